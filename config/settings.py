@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -52,6 +53,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover every other middleware
+    'inventory.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -60,6 +63,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # ?_profile=1 for staff users (see inventory/profiling.py)
+    'inventory.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -86,13 +91,48 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Run on every new SQLite connection
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,  # ms to wait for a lock before "database is locked"
+    'mmap_size': 268435456,  # 256 MiB of the file read through mmap
+    'cache_size': -65536,  # negative = KiB, i.e. 64 MiB page cache per connection
+}
+# WAL is stored in the database file itself and adds -wal/-shm files next to it,
+# so it is opt-in (SQLITE_WAL=1) rather than rewriting a checked-in db.sqlite3
+SQLITE_WAL = os.environ.get('SQLITE_WAL') == '1'
+if SQLITE_WAL:
+    SQLITE_PRAGMAS.update({
+        'journal_mode': 'WAL',  # readers no longer block the writer (and vice versa)
+        'synchronous': 'NORMAL',  # durable with WAL except on power loss; no fsync per commit
+    })
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Persistent connections: reused across requests for up to 10 minutes
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+        },
+        # A file rather than shared-cache memory, so tests see real file locking
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# adjust_stock, receive and complete BEGIN IMMEDIATE on SQLite and retry while
+# the database stays locked (see inventory/db.py)
+STOCK_WRITE_RETRIES = 5
+STOCK_WRITE_RETRY_DELAY = 0.05  # seconds, doubled on every attempt
+
+# /metrics (Prometheus) takes `Authorization: Bearer <token>` when set; staff users always get in,
+# anyone else only under DEBUG without a token
+METRICS_TOKEN = ''
+
+# Artefacts of profiled requests (?_profile=1), downloadable from /profiles/<id>/
+PROFILE_DIR = BASE_DIR / 'profiles'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -137,6 +177,24 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Caches
+# The sales report cache defaults to process-local memory; point it at a
+# FileBasedCache (or any shared backend) to share entries between workers, e.g.
+# {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': BASE_DIR / 'cache' / 'reports'}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'reports': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sales-reports',
+        'TIMEOUT': 600,
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+SALES_REPORT_CACHE = 'reports'
+
 # Auth redirects for the web UI
 LOGIN_URL = 'web:login'
 LOGIN_REDIRECT_URL = 'web:dashboard'
@@ -151,9 +209,9 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
         'rest_framework.filters.OrderingFilter',
-        'rest_framework.filters.SearchFilter',
+        'inventory.search.FullTextSearchFilter',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'inventory.pagination.PageNumberOrKeysetPagination',
     'PAGE_SIZE': 25,
 }
 
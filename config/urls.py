@@ -18,6 +18,9 @@ from django.contrib import admin
 from django.urls import path, include
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
+from inventory.metrics import metrics_view
+from inventory.profiling import download_profile
+
 # Web UI routes under root
 
 urlpatterns = [
@@ -26,4 +29,6 @@ urlpatterns = [
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('api/', include('inventory.urls')),
+    path('metrics', metrics_view, name='metrics'),
+    path('profiles/<str:profile_id>/', download_profile, name='profile-download'),
 ]
@@ -1,7 +1,11 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.http import HttpResponseRedirect
 from .models import (
     Supplier, Product, Location, InventoryItem,
-    PurchaseOrder, PurchaseOrderItem, SalesOrder, SalesOrderItem
+    PurchaseOrder, PurchaseOrderItem, SalesOrder, SalesOrderItem, StockMovement,
+    daily_sales_keys, resync_daily_sales, sync_reservations,
 )
 
 
@@ -26,7 +30,7 @@ class LocationAdmin(admin.ModelAdmin):
 
 @admin.register(InventoryItem)
 class InventoryItemAdmin(admin.ModelAdmin):
-    list_display = ("product", "location", "quantity", "reorder_threshold")
+    list_display = ("product", "location", "quantity", "reserved", "reorder_threshold")
     list_filter = ("location",)
     search_fields = ("product__sku", "product__name", "location__code")
 
@@ -50,6 +54,54 @@ class SalesOrderItemInline(admin.TabularInline):
 
 @admin.register(SalesOrder)
 class SalesOrderAdmin(admin.ModelAdmin):
-    list_display = ("id", "reference", "customer_name", "status", "created_at")
+    list_display = ("id", "reference", "customer_name", "status", "created_at", "completed_at")
     list_filter = ("status",)
     inlines = [SalesOrderItemInline]
+
+    def save_model(self, request, obj, form, change):
+        # Rollup rows the order counted towards before the edit (see save_related)
+        obj._daily_sales_keys = daily_sales_keys([obj.pk]) if change else set()
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        order = form.instance
+        try:
+            sync_reservations([order])
+        except ValidationError as e:
+            # Not enough stock to hold the lines: the save is undone in response_add/response_change
+            for message in e.messages:
+                self.message_user(request, message, messages.ERROR)
+            order._reservation_refused = True
+            return
+        resync_daily_sales(order.__dict__.pop('_daily_sales_keys', set()) | daily_sales_keys([order.pk]))
+
+    def refused(self, request, obj):
+        # Rolls back changeform_view's atomic block, once the change log entry has been written in it
+        if not obj.__dict__.pop('_reservation_refused', False):
+            return None
+        transaction.set_rollback(True)
+        return HttpResponseRedirect(request.path)
+
+    def response_add(self, request, obj, post_url_continue=None):
+        return self.refused(request, obj) or super().response_add(request, obj, post_url_continue)
+
+    def response_change(self, request, obj):
+        return self.refused(request, obj) or super().response_change(request, obj)
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    """The ledger is append-only: entries are written by the stock operations, never by hand."""
+    list_display = ("created_at", "product", "location", "kind", "delta", "quantity_after", "reason")
+    list_filter = ("kind", "location")
+    search_fields = ("product__sku", "reason")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,141 @@
+"""Async (ASGI) versions of the slow read endpoints, served under /api/async/.
+
+Under an ASGI server, sync views all share one thread for their database
+work, so a long report or export holds up every CRUD request behind it.
+These views await the ORM instead (`aaggregate`, `aiterator`) and stream
+exports from async iterators, giving the thread back between chunks. They
+answer exactly like their sync counterparts and still work under WSGI.
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import report_cache
+from .exports import EXPORT_CHUNK_SIZE, export_format, stream_rows
+from .models import low_stock_items
+from .views import SalesReportView
+
+LOW_STOCK_LIMIT = 100
+LOW_STOCK_MAX_LIMIT = 1000
+LOW_STOCK_COLUMNS = [
+    ('id', 'id'), ('product', 'product_id'), ('sku', 'product__sku'), ('product_name', 'product__name'),
+    ('location', 'location_id'), ('location_code', 'location__code'),
+    ('quantity', 'quantity'), ('reorder_threshold', 'reorder_threshold'),
+    ('shortfall', 'shortfall'), ('severity', 'severity'),
+]
+
+
+def json_response(data, status=200):
+    # Encoded like DRF's JSONRenderer, so both APIs return the same bytes
+    return JsonResponse(
+        data, status=status, encoder=JSONEncoder, safe=False,
+        json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False},
+    )
+
+
+def report_response(data, source, cache_status):
+    response = json_response(data)
+    response['X-Report-Source'] = source
+    response['X-Cache'] = cache_status
+    return response
+
+
+async def _single(row):
+    yield row
+
+
+async def _value_rows(queryset, lookups):
+    # values_list().aiterator() runs its query inside the event loop on Django 5.1
+    # (SynchronousOnlyOperation); values() defers it to the sync thread like the rest
+    async for row in queryset.values(*lookups).aiterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield tuple(row[lookup] for lookup in lookups)
+
+
+@require_GET
+async def sales_report(request):
+    """Same parameters, headers and cache entries as SalesReportView."""
+    try:
+        params = SalesReportView.report_params(request)
+        output = export_format(request) if 'output' in request.GET else None
+    except ValidationError as exc:
+        return json_response(exc.detail, status=400)
+
+    cache_key = None
+    if output is None:
+        cache_key = await report_cache.acache_key(SalesReportView.cache_params(**params))
+        cached = await report_cache.alookup(cache_key)
+        if cached is not None:
+            return report_response(cached, params['source'], 'HIT')
+
+    query, groups = SalesReportView.report_query(**params)
+    if groups is None:
+        data = SalesReportView.totals(await query.aaggregate(**SalesReportView.annotations(params['source'])))
+        if output:
+            return SalesReportView.export_response(_single(tuple(data.values())), output, params)
+    elif output:
+        async def rows():
+            async for row in query.aiterator(chunk_size=EXPORT_CHUNK_SIZE):
+                yield tuple(SalesReportView.grouped_row(row, groups).values())
+        return SalesReportView.export_response(rows(), output, params)
+    else:
+        data = [SalesReportView.grouped_row(row, groups) async for row in query.aiterator(chunk_size=EXPORT_CHUNK_SIZE)]
+
+    await report_cache.astore(cache_key, data)
+    return report_response(data, params['source'], 'MISS')
+
+
+def _filtered_queryset(viewset, request):
+    # Filter backends validate foreign keys and check for the search tables, both
+    # of which query the database, so this runs through sync_to_async
+    view = viewset(request=Request(request), args=(), kwargs={}, format_kwarg=None, action='export')
+    return view.get_export_queryset(view.filter_queryset(view.get_queryset()))
+
+
+def export_view(viewset):
+    """Async twin of `viewset`'s `export` action: same filters, columns and formats."""
+    headers, lookups = zip(*viewset.export_columns)
+
+    @require_GET
+    async def export(request):
+        try:
+            output = export_format(request)
+            queryset = await sync_to_async(_filtered_queryset)(viewset, request)
+        except ValidationError as exc:
+            return json_response(exc.detail, status=400)
+        return stream_rows(headers, _value_rows(queryset, lookups), output, viewset.export_filename)
+
+    export.__name__ = f'{viewset.export_filename.replace("-", "_")}_export'
+    return export
+
+
+@require_GET
+async def low_stock(request):
+    """Items at or under their reorder threshold, most severe first.
+
+    `?location=<id>` narrows to one location. JSON answers carry the total
+    count and the first `limit` rows; `?output=csv|ndjson` streams them all.
+    """
+    queryset = low_stock_items()
+    location = request.GET.get('location', '').strip()
+    try:
+        if location:
+            if not location.isdigit():
+                raise ValidationError({'location': ['Expected a location id.']})
+            queryset = queryset.filter(location_id=int(location))
+        output = export_format(request) if 'output' in request.GET else None
+        limit = request.GET.get('limit', '').strip()
+        limit = int(limit) if limit else LOW_STOCK_LIMIT
+    except ValueError:
+        return json_response({'limit': ['Expected an integer.']}, status=400)
+    except ValidationError as exc:
+        return json_response(exc.detail, status=400)
+
+    headers, lookups = zip(*LOW_STOCK_COLUMNS)
+    if output:
+        return stream_rows(headers, _value_rows(queryset, lookups), output, 'low-stock')
+    limit = max(1, min(limit, LOW_STOCK_MAX_LIMIT))
+    results = [dict(zip(headers, row)) async for row in queryset.values_list(*lookups)[:limit]]
+    return json_response({'count': await queryset.acount(), 'results': results})
@@ -0,0 +1,108 @@
+"""In-process prefix index over active products for the autocomplete endpoint.
+
+The index holds sorted arrays of folded SKUs and name words, searched with
+bisect, and is built on first use. Product writes drop it through signals and
+bump a version in the shared cache so other workers rebuild too; MAX_AGE
+bounds staleness for anything that bypasses both.
+"""
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'autocomplete:version'
+MAX_AGE = 300
+TOKEN_RE = re.compile(r'\w+')
+
+
+def fold(text: str) -> str:
+    """Casefold and strip accents, so 'Écrou' matches 'ecr'."""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def _prefix_range(keys, prefix):
+    start = bisect_left(keys, prefix)
+    # Every string with this prefix sorts before prefix + U+10FFFF
+    return start, bisect_left(keys, prefix + '\U0010ffff', start)
+
+
+class ProductIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    def invalidate(self) -> None:
+        self._state = None
+        # Other processes notice the new version on their next lookup
+        transaction.on_commit(lambda: cache.set(VERSION_KEY, time.time(), None))
+
+    def _current(self):
+        state = self._state
+        version = cache.get(VERSION_KEY)
+        if state is not None and state['version'] == version and time.monotonic() - state['built'] < MAX_AGE:
+            return state
+        with self._lock:
+            if self._state is state:
+                self._state = self._build(version)
+            return self._state
+
+    @staticmethod
+    def _build(version):
+        from .models import Product
+        products = {}
+        skus, words = [], []
+        rows = Product.objects.filter(is_active=True).values_list('id', 'sku', 'name')
+        for pk, sku, name in rows.iterator(chunk_size=5000):
+            products[pk] = (sku, name)
+            skus.append((fold(sku), pk))
+            words.extend((word, pk) for word in set(TOKEN_RE.findall(fold(name))))
+        skus.sort()
+        words.sort()
+        return {
+            'version': version,
+            'built': time.monotonic(),
+            'products': products,
+            'sku_keys': [key for key, _ in skus],
+            'sku_ids': [pk for _, pk in skus],
+            'word_keys': [key for key, _ in words],
+            'word_ids': [pk for _, pk in words],
+        }
+
+    def search(self, text: str, limit: int = 10) -> list:
+        """SKU prefix matches first (in SKU order), then products whose name has a word starting with every query word."""
+        state = self._current()
+        folded = fold(text.strip())
+        if not folded:
+            return []
+        found = []
+        start, stop = _prefix_range(state['sku_keys'], folded)
+        found.extend(state['sku_ids'][start:min(stop, start + limit)])
+
+        terms = TOKEN_RE.findall(folded)
+        if len(found) < limit and terms:
+            # Walk the narrowest word range and check the other words against each candidate
+            ranges = sorted(
+                ((_prefix_range(state['word_keys'], term), term) for term in terms),
+                key=lambda item: item[0][1] - item[0][0],
+            )
+            (start, stop), _ = ranges[0]
+            others = [term for _, term in ranges[1:]]
+            seen = set(found)
+            for pk in state['word_ids'][start:stop]:
+                if pk in seen:
+                    continue
+                seen.add(pk)
+                name_words = TOKEN_RE.findall(fold(state['products'][pk][1]))
+                if all(any(word.startswith(term) for word in name_words) for term in others):
+                    found.append(pk)
+                    if len(found) >= limit:
+                        break
+        return [{'id': pk, 'sku': state['products'][pk][0], 'name': state['products'][pk][1]} for pk in found]
+
+
+product_index = ProductIndex()
@@ -0,0 +1,34 @@
+"""Dashboard row counts, cached for a short time and dropped on writes.
+
+Saves and deletes through the ORM invalidate the entry via signals; bulk paths
+that create or remove rows (the catalog import, adjust_stock_many() for a new
+product/location pair) call invalidate() themselves. Anything else is picked
+up when the entry expires after COUNTS_TIMEOUT seconds.
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+COUNTS_KEY = 'dashboard:counts'
+COUNTS_TIMEOUT = 60
+
+
+def counted_models():
+    from .models import Supplier, Product, Location, InventoryItem
+    return {
+        'products': Product,
+        'suppliers': Supplier,
+        'locations': Location,
+        'inventory_items': InventoryItem,
+    }
+
+
+def get_counts() -> dict:
+    counts = cache.get(COUNTS_KEY)
+    if counts is None:
+        counts = {name: model.objects.count() for name, model in counted_models().items()}
+        cache.set(COUNTS_KEY, counts, COUNTS_TIMEOUT)
+    return counts
+
+
+def invalidate() -> None:
+    transaction.on_commit(lambda: cache.delete(COUNTS_KEY))
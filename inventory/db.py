@@ -0,0 +1,63 @@
+"""Write transactions for stock mutations on SQLite.
+
+A default (DEFERRED) transaction that reads before it writes only asks for
+the write lock at its first UPDATE. If another connection committed in the
+meantime SQLite fails at once with "database is locked", without waiting
+for busy_timeout, because waiting could deadlock. `stock_write` functions
+open their transaction with BEGIN IMMEDIATE instead: they wait for the write
+lock up front, where busy_timeout applies. If the lock is still not free
+after that, the whole call is retried a few times with backoff.
+"""
+import random
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+LOCKED_MESSAGES = ('database is locked', 'database table is locked')
+
+
+def is_locked(exc: Exception) -> bool:
+    return isinstance(exc, OperationalError) and any(message in str(exc) for message in LOCKED_MESSAGES)
+
+
+@contextmanager
+def immediate_transactions(using=None):
+    """Outermost atomic() blocks opened inside begin IMMEDIATE (SQLite only)."""
+    connection = transaction.get_connection(using)
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    # Connecting resets transaction_mode from OPTIONS, so connect first
+    connection.ensure_connection()
+    previous = connection.transaction_mode
+    connection.transaction_mode = 'IMMEDIATE'
+    try:
+        yield
+    finally:
+        connection.transaction_mode = previous
+
+
+def stock_write(func):
+    """Run `func` (which opens its own atomic block) with IMMEDIATE transactions, retried while locked.
+
+    Inside a caller's transaction the lock is already decided, so `func` just runs.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if transaction.get_connection().in_atomic_block:
+            return func(*args, **kwargs)
+        retries = getattr(settings, 'STOCK_WRITE_RETRIES', 5)
+        delay = getattr(settings, 'STOCK_WRITE_RETRY_DELAY', 0.05)
+        for attempt in range(retries + 1):
+            try:
+                with immediate_transactions():
+                    return func(*args, **kwargs)
+            except OperationalError as exc:
+                if attempt == retries or not is_locked(exc):
+                    raise
+            # Jittered exponential backoff so the retrying writers do not collide again
+            time.sleep(delay * 2 ** attempt * random.uniform(0.5, 1.5))
+    return wrapper
@@ -0,0 +1,73 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+EXPORT_CHUNK_SIZE = 2000
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def export_format(request, param='output'):
+    # request.GET so plain Django (async) views can share it with DRF views
+    output = request.GET.get(param, 'csv')
+    if output not in EXPORT_FORMATS:
+        raise ValidationError({param: [f"Expected one of: {', '.join(EXPORT_FORMATS)}."]})
+    return output
+
+
+def _encoder(columns, output):
+    """(header, row -> line) for the export format."""
+    if output == 'csv':
+        writer = csv.writer(_Echo())
+        return writer.writerow(columns), writer.writerow
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    return '', lambda row: encoder.encode(dict(zip(columns, row))) + '\n'
+
+
+def _chunks(columns, rows, output, size=EXPORT_CHUNK_SIZE):
+    # One write per chunk of rows rather than per row keeps the WSGI/ASGI overhead low
+    header, encode = _encoder(columns, output)
+    buffer = [header]
+    for row in rows:
+        buffer.append(encode(row))
+        if len(buffer) >= size:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+async def _achunks(columns, rows, output, size=EXPORT_CHUNK_SIZE):
+    header, encode = _encoder(columns, output)
+    buffer = [header]
+    async for row in rows:
+        buffer.append(encode(row))
+        if len(buffer) >= size:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_rows(columns, rows, output, filename):
+    """Stream an iterable of row tuples as CSV or NDJSON without materialising it.
+
+    `rows` should be lazy, e.g. `queryset.values_list(...).iterator(chunk_size=...)`,
+    so memory stays flat however many rows are exported. Async views pass an
+    async iterable (`aiterator()`), which ASGI servers consume without a thread.
+    """
+    chunks = _achunks if hasattr(rows, '__aiter__') else _chunks
+    response = StreamingHttpResponse(chunks(columns, rows, output), content_type=EXPORT_FORMATS[output])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{output}"'
+    return response
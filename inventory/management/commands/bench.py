@@ -0,0 +1,286 @@
+import json
+import platform
+import sqlite3
+import statistics
+import subprocess
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+from pathlib import Path
+from time import perf_counter
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from inventory import counters, report_cache
+from inventory.models import (
+    Supplier, Product, Location, InventoryItem, PurchaseOrder, PurchaseOrderItem,
+    SalesOrder, SalesOrderItem,
+)
+
+REPORT_GROUPS = ['none', 'product', 'supplier', 'day', 'month']
+REPORT_SOURCES = ['rollup', 'raw']
+ORDER_LINES = 5
+CASES = {}
+
+
+def case(name):
+    """Register a benchmark. The decorated function does its (untimed) setup and returns
+    the callable to time, which returns the size in bytes of what it produced."""
+    def register(func):
+        CASES[name] = func
+        return func
+    return register
+
+
+def fetch(client, url):
+    response = client.get(url)
+    if response.status_code != 200:
+        raise CommandError(f'GET {url} answered {response.status_code}')
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def get(url):
+    return lambda bench: lambda: fetch(bench.client, url)
+
+
+for _name, _url in [
+    ('api.inventory.list', '/api/inventory/'),
+    ('api.sales_orders.list', '/api/sales-orders/'),
+    ('api.purchase_orders.list', '/api/purchase-orders/'),
+]:
+    case(_name)(get(_url))
+
+
+@case('api.sales_orders.detail')
+def sales_order_detail(bench):
+    return lambda: fetch(bench.client, f'/api/sales-orders/{bench.sales_order_id}/')
+
+
+@case('api.purchase_orders.detail')
+def purchase_order_detail(bench):
+    return lambda: fetch(bench.client, f'/api/purchase-orders/{bench.purchase_order_id}/')
+
+
+def report(group_by, source):
+    url = f'/api/reports/sales/?source={source}' + (f'&group_by={group_by}' if group_by != 'none' else '')
+
+    def setup(bench):
+        report_cache.get_cache().clear()
+        return lambda: fetch(bench.client, url)
+    return setup
+
+
+for _group in REPORT_GROUPS:
+    for _source in REPORT_SOURCES:
+        case(f'report.sales.{_group}.{_source}')(report(_group, _source))
+
+
+@case('web.dashboard')
+def dashboard(bench):
+    # invalidate() waits for a commit that never comes here
+    cache.delete(counters.COUNTS_KEY)
+    return lambda: fetch(bench.web_client, '/')
+
+
+@case('orders.sales.complete')
+def complete_order(bench):
+    order = SalesOrder.objects.create(reference='BENCH', status=SalesOrder.Status.PENDING, ship_from_id=bench.location_id)
+    SalesOrderItem.objects.bulk_create([
+        SalesOrderItem(sales_order=order, product_id=product_id, quantity=1, unit_price=price)
+        for product_id, price in bench.stocked
+    ])
+
+    def run():
+        order.complete()
+        return 0
+    return run
+
+
+@case('orders.purchase.receive')
+def receive_order(bench):
+    order = PurchaseOrder.objects.create(
+        reference='BENCH', supplier_id=bench.supplier_id, status=PurchaseOrder.Status.PENDING,
+        receive_location_id=bench.location_id,
+    )
+    PurchaseOrderItem.objects.bulk_create([
+        PurchaseOrderItem(purchase_order=order, product_id=product_id, quantity=10, unit_cost=price)
+        for product_id, price in bench.stocked
+    ])
+
+    def run():
+        order.receive()
+        return 0
+    return run
+
+
+@case('command.check_low_stock')
+def check_low_stock(bench):
+    def run():
+        out = StringIO()
+        call_command('check_low_stock', stdout=out)
+        return len(out.getvalue())
+    return run
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Bench:
+    """Fixtures shared by the cases, picked from the loaded dataset."""
+
+    def __init__(self, host):
+        self.client = Client(HTTP_HOST=host)
+        self.web_client = Client(HTTP_HOST=host)
+        user, _ = get_user_model().objects.get_or_create(username='bench')
+        self.web_client.force_login(user)
+
+        # The largest orders, so detail views show their worst case
+        sales_order = SalesOrder.objects.annotate(lines=models.Count('items')).order_by('-lines', 'id').first()
+        purchase_order = PurchaseOrder.objects.annotate(lines=models.Count('items')).order_by('-lines', 'id').first()
+        if sales_order is None or purchase_order is None:
+            raise CommandError('No orders to benchmark; load a dataset first (manage.py seed_bench).')
+        self.sales_order_id = sales_order.pk
+        self.purchase_order_id = purchase_order.pk
+        self.supplier_id = purchase_order.supplier_id
+
+        # A location with plenty of stock, for the complete/receive cases
+        items = InventoryItem.objects.filter(quantity__gte=models.F('reserved') + 100)
+        self.location_id = items.values_list('location_id', flat=True).order_by('location_id').first()
+        if self.location_id is None:
+            items = InventoryItem.objects.filter(quantity__gt=models.F('reserved'))
+            self.location_id = items.values_list('location_id', flat=True).order_by('-quantity').first()
+        self.stocked = list(
+            items.filter(location_id=self.location_id).order_by('id')
+            .values_list('product_id', 'product__unit_price')[:ORDER_LINES]
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the hot paths (API lists and details, sales report for every group_by and source, "
+        "order completion and receipt, dashboard, check_low_stock) against the configured database "
+        "and record wall time, query count, database time and response size per case. Everything "
+        "runs in one transaction that is rolled back, so writes are not committed (nor fsynced). "
+        "Use --output to save the results as JSON and --compare to diff them with an earlier run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per case')
+        parser.add_argument('--warmup', type=int, default=1, help='Untimed runs per case first')
+        parser.add_argument('--only', action='append', default=[], help='Run the cases starting with this prefix (repeatable)')
+        parser.add_argument('--list', action='store_true', help='List the cases and exit')
+        parser.add_argument('--host', default='localhost', help='Host header; must be in ALLOWED_HOSTS')
+        parser.add_argument('--label', default='', help='Free text stored with the results, e.g. a branch name')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+
+    def handle(self, *args, **options):
+        names = [name for name in CASES if not options['only'] or name.startswith(tuple(options['only']))]
+        if options['list']:
+            self.stdout.write('\n'.join(CASES))
+            return
+        if not names:
+            raise CommandError('No case matches --only.')
+        baseline = None
+        if options['compare']:
+            try:
+                baseline = json.loads(Path(options['compare']).read_text())['results']
+            except (OSError, ValueError, KeyError) as exc:
+                raise CommandError(f"Cannot read {options['compare']}: {exc}")
+
+        with transaction.atomic():
+            bench = Bench(options['host'])
+            results = {name: self.measure(CASES[name], bench, options['repeat'], options['warmup']) for name in names}
+            data = {'meta': self.meta(options['label']), 'results': results}
+            transaction.set_rollback(True)
+        cache.delete(counters.COUNTS_KEY)
+        report_cache.get_cache().clear()
+
+        self.report(results, baseline)
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(data, indent=2) + '\n')
+            self.stdout.write(f"Results written to {options['output']}")
+
+    @staticmethod
+    def measure(setup, bench, repeat, warmup):
+        timings, queries, db_times, sizes = [], [], [], []
+        for run in range(warmup + repeat):
+            # Savepoints keep each run's writes (and its setup's) out of the next run
+            with transaction.atomic():
+                func = setup(bench)
+                with CaptureQueriesContext(connection) as captured:
+                    started = perf_counter()
+                    size = func()
+                    elapsed = perf_counter() - started
+                transaction.set_rollback(True)
+            if run < warmup:
+                continue
+            timings.append(elapsed * 1000)
+            queries.append(len(captured))
+            db_times.append(sum(float(query['time']) for query in captured.captured_queries) * 1000)
+            sizes.append(size)
+        return {
+            'runs': repeat,
+            'min_ms': round(min(timings), 3),
+            'median_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'max_ms': round(max(timings), 3),
+            'queries': max(queries),
+            'db_ms': round(statistics.median(db_times), 3),
+            'bytes': max(sizes),
+        }
+
+    @staticmethod
+    def meta(label):
+        return {
+            'label': label,
+            'timestamp': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+            'git': git_revision(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'sqlite': sqlite3.sqlite_version if connection.vendor == 'sqlite' else None,
+            'dataset': {
+                model._meta.label: model.objects.count()
+                for model in (Supplier, Product, Location, InventoryItem, PurchaseOrder, SalesOrder, SalesOrderItem)
+            },
+        }
+
+    def report(self, results, baseline):
+        header = f"{'case':<32} {'median ms':>10} {'p95 ms':>9} {'queries':>8} {'db ms':>9} {'bytes':>10}"
+        if baseline:
+            header += f" {'vs base':>8} {'queries':>8}"
+        self.stdout.write(header)
+        for name, result in results.items():
+            line = (
+                f"{name:<32} {result['median_ms']:>10.1f} {result['p95_ms']:>9.1f} {result['queries']:>8} "
+                f"{result['db_ms']:>9.1f} {result['bytes']:>10}"
+            )
+            before = (baseline or {}).get(name)
+            if before:
+                change = (result['median_ms'] - before['median_ms']) / before['median_ms'] * 100 if before['median_ms'] else 0
+                line += f" {change:>+7.0f}% {result['queries'] - before['queries']:>+8}"
+            elif baseline:
+                line += f" {'new':>8}"
+            self.stdout.write(line)
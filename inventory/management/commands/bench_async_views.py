@@ -0,0 +1,114 @@
+import asyncio
+import json
+import statistics
+import time
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+
+# (sync URL, async URL) pairs of slow reads; `output=` keeps the report out of the cache
+SLOW_ENDPOINTS = [
+    ('/api/sales-orders/export/?output=csv', '/api/async/sales-orders/export/?output=csv'),
+    ('/api/inventory/export/?output=ndjson', '/api/async/inventory/export/?output=ndjson'),
+    ('/api/reports/sales/?source=raw&group_by=day&output=csv', '/api/async/reports/sales/?source=raw&group_by=day&output=csv'),
+]
+FAST_URL = '/api/locations/?page_size=10'
+
+
+async def fetch(app, url, host='localhost'):
+    """Run one GET through the ASGI application in-process; returns (status, bytes, seconds)."""
+    path, _, query = url.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', host.encode())], 'server': (host, 80), 'client': ('127.0.0.1', 0),
+    }
+    requested = False
+    finished = asyncio.Event()
+    response = {'status': None, 'size': 0}
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        elif message['type'] == 'http.response.body':
+            response['size'] += len(message.get('body', b''))
+
+    started = time.perf_counter()
+    await app(scope, receive, send)
+    finished.set()
+    return response['status'], response['size'], time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync and async report/export endpoints under an ASGI application: "
+        "starts concurrent slow reads and measures the latency of fast CRUD requests issued "
+        "meanwhile. Runs in-process against the configured database (load some data first)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slow', type=int, default=4, help='Concurrent requests per slow endpoint')
+        parser.add_argument('--fast', type=int, default=50, help='Fast requests issued while the slow ones run')
+        parser.add_argument('--fast-concurrency', type=int, default=4)
+        parser.add_argument('--host', default='localhost', help='Host header; must be in ALLOWED_HOSTS')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        app = get_asgi_application()
+        results = {}
+        for mode, index in (('sync', 0), ('async', 1)):
+            slow_urls = [urls[index] for urls in SLOW_ENDPOINTS for _ in range(options['slow'])]
+            results[mode] = asyncio.run(self.scenario(app, options['host'], slow_urls, options['fast'], options['fast_concurrency']))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'mode':<6} {'slow wall s':>11} {'slow MB':>8} {'fast p50 ms':>12} {'fast p95 ms':>12} {'fast max ms':>12} {'errors':>6}")
+        for mode, result in results.items():
+            self.stdout.write(
+                f"{mode:<6} {result['slow_wall']:>11.2f} {result['slow_bytes'] / 1e6:>8.1f} "
+                f"{result['fast_p50'] * 1000:>12.1f} {result['fast_p95'] * 1000:>12.1f} "
+                f"{result['fast_max'] * 1000:>12.1f} {result['errors']:>6}"
+            )
+
+    @staticmethod
+    async def scenario(app, host, slow_urls, fast_count, fast_concurrency):
+        started = time.perf_counter()
+        slow = [asyncio.create_task(fetch(app, url, host)) for url in slow_urls]
+        await asyncio.sleep(0)  # let the slow requests reach their views first
+
+        fast = []
+
+        async def worker(count):
+            for _ in range(count):
+                fast.append(await fetch(app, FAST_URL, host))
+
+        share, extra = divmod(fast_count, fast_concurrency)
+        await asyncio.gather(*(worker(share + (i < extra)) for i in range(fast_concurrency)))
+        slow = await asyncio.gather(*slow)
+        slow_wall = time.perf_counter() - started
+
+        latencies = [seconds for _, _, seconds in fast] or [0.0]
+        return {
+            'slow_requests': len(slow),
+            'slow_wall': slow_wall,
+            'slow_bytes': sum(size for _, size, _ in slow),
+            'fast_requests': len(fast),
+            'fast_p50': statistics.median(latencies),
+            'fast_p95': percentile(latencies, 0.95),
+            'fast_max': max(latencies),
+            'errors': sum(1 for status, _, _ in (*slow, *fast) if status != 200),
+        }
@@ -1,37 +1,128 @@
-from django.core.management.base import BaseCommand
+import time
+from datetime import timedelta
+from itertools import groupby
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
-from django.db import models
-from inventory.models import InventoryItem
+from django.db import close_old_connections, models
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from inventory.models import InventoryItem, day_start
+
+LOW_STOCK = models.Q(quantity__lte=models.F('reorder_threshold'))
+# Re-read this much before the previous poll so rows committed late are not missed;
+# alerts are deduplicated through InventoryItem.low_stock_alerted_at
+CHECKPOINT_OVERLAP = timedelta(seconds=5)
+
+
+def parse_since(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        return day_start(day)
+    return moment if timezone.is_aware(moment) else timezone.make_aware(moment)
+
 
 class Command(BaseCommand):
-    help = "List low stock items (quantity <= reorder_threshold) and optionally send alerts"
+    help = (
+        "List low stock items (quantity <= reorder_threshold) and optionally send alerts. "
+        "With --since/--watch only rows touched since the checkpoint are evaluated and only "
+        "items that newly crossed their threshold are reported, as one digest per location."
+    )
 
     def add_arguments(self, parser):
         parser.add_argument('--email', action='store_true', help='Send alert emails (requires EMAIL settings)')
+        parser.add_argument('--since', help='Only evaluate rows touched since this date/datetime (ISO 8601)')
+        parser.add_argument('--watch', action='store_true', help='Keep polling for newly low items until interrupted')
+        parser.add_argument('--interval', type=float, default=60, help='Seconds between polls in --watch mode')
+        parser.add_argument('--checkpoint', help='File holding the last poll time; read on start, updated after every poll')
 
     def handle(self, *args, **options):
-        low = InventoryItem.objects.select_related('product', 'location').filter(quantity__lte=models.F('reorder_threshold'))
-        if not low.exists():
-            self.stdout.write(self.style.SUCCESS('No low stock items.'))
+        self.email = options['email']
+        checkpoint = Path(options['checkpoint']) if options['checkpoint'] else None
+        since = options['since']
+        if since is None and checkpoint and checkpoint.exists():
+            since = checkpoint.read_text().strip() or None
+        if since is not None:
+            try:
+                since = parse_since(since)
+            except ValueError:
+                raise CommandError(f'Invalid --since value: {since!r}')
+
+        if not (options['watch'] or since or checkpoint):
+            self.list_all()
             return
 
+        while True:
+            since = self.poll(since)
+            if checkpoint:
+                checkpoint.write_text(since.isoformat())
+            if not options['watch']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
+            close_old_connections()
+
+    def list_all(self):
+        low = InventoryItem.objects.select_related('product', 'location').filter(LOW_STOCK).order_by('location__code', 'product__sku')
+        # Lines are streamed; they are only kept when an email needs the full report
         lines = []
-        for item in low:
-            lines.append(f"{item.product.sku} - {item.product.name} @ {item.location.code}: qty={item.quantity}, threshold={item.reorder_threshold}")
-        report = "\n".join(lines)
-        self.stdout.write(report)
+        count = 0
+        for item in low.iterator(chunk_size=2000):
+            line = self.describe(item)
+            self.stdout.write(line)
+            count += 1
+            if self.email:
+                lines.append(line)
+        if not count:
+            self.stdout.write(self.style.SUCCESS('No low stock items.'))
+        elif self.email:
+            self.send('Low stock alert', "\n".join(lines))
 
-        if options['email']:
-            # Placeholder: requires EMAIL_* settings to be configured
-            try:
-                from django.core.mail import send_mail
-                subject = 'Low stock alert'
-                body = report
-                recipient = getattr(settings, 'STOCK_ALERT_EMAIL', None)
-                if not recipient:
-                    self.stdout.write(self.style.WARNING('STOCK_ALERT_EMAIL not set; skipping email'))
-                    return
-                send_mail(subject, body, getattr(settings, 'DEFAULT_FROM_EMAIL', None), [recipient])
-                self.stdout.write(self.style.SUCCESS('Alert email sent'))
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'Failed to send email: {e}'))
+    def poll(self, since):
+        """Report items that crossed their threshold since `since`; returns the next checkpoint."""
+        started = timezone.now()
+        touched = InventoryItem.objects.all()
+        if since is not None:
+            touched = touched.filter(updated_at__gte=since)
+        # Items back above their threshold may alert again next time they cross it
+        touched.filter(low_stock_alerted_at__isnull=False).exclude(LOW_STOCK).update(low_stock_alerted_at=None)
+
+        crossed = touched.filter(LOW_STOCK, low_stock_alerted_at__isnull=True).select_related('product', 'location')
+        crossed = crossed.order_by('location__code', 'product__sku').iterator(chunk_size=2000)
+        for _, items in groupby(crossed, key=lambda item: item.location_id):
+            items = list(items)
+            lines = [self.describe(item) for item in items]
+            self.stdout.write(f'[{started:%Y-%m-%d %H:%M:%S}] {items[0].location.code}: {len(lines)} newly low')
+            for line in lines:
+                self.stdout.write(f'  {line}')
+            self.stdout.flush()
+            if self.email and not self.send(f'Low stock alert: {items[0].location.code}', "\n".join(lines)):
+                continue  # left unmarked, so the digest is retried on the next poll
+            InventoryItem.objects.filter(pk__in=[item.pk for item in items]).update(low_stock_alerted_at=started)
+        return started - CHECKPOINT_OVERLAP
+
+    @staticmethod
+    def describe(item):
+        return f"{item.product.sku} - {item.product.name} @ {item.location.code}: qty={item.quantity}, threshold={item.reorder_threshold}"
+
+    def send(self, subject, body):
+        """Email the alert; False only when sending failed and should be retried."""
+        # Placeholder: requires EMAIL_* settings to be configured
+        try:
+            from django.core.mail import send_mail
+            recipient = getattr(settings, 'STOCK_ALERT_EMAIL', None)
+            if not recipient:
+                self.stdout.write(self.style.WARNING('STOCK_ALERT_EMAIL not set; skipping email'))
+                return True
+            send_mail(subject, body, getattr(settings, 'DEFAULT_FROM_EMAIL', None), [recipient])
+            self.stdout.write(self.style.SUCCESS('Alert email sent'))
+            return True
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Failed to send email: {e}'))
+            return False
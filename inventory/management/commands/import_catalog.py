@@ -0,0 +1,255 @@
+import csv
+import json
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from inventory import counters
+from inventory.autocomplete import product_index
+from inventory.models import (
+    Supplier, Product, Location, InventoryItem, StockMovement, bump_versions, record_movements, refresh_daily_sales,
+)
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'oui'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'non'}
+
+
+class RejectedRow(Exception):
+    pass
+
+
+def _text(row, key, required=False):
+    value = row.get(key)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise RejectedRow(f'{key} is required')
+    return value or None
+
+
+def _decimal(row, key):
+    value = _text(row, key)
+    if value is None:
+        return Decimal('0')
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise RejectedRow(f'{key} is not a number: {value!r}')
+
+
+def _int(row, key):
+    value = _text(row, key)
+    if value is None:
+        return 0
+    try:
+        return int(value)
+    except ValueError:
+        raise RejectedRow(f'{key} is not an integer: {value!r}')
+
+
+def _bool(row, key, default=True):
+    value = _text(row, key)
+    if value is None:
+        return default
+    if value.lower() in TRUE_VALUES:
+        return True
+    if value.lower() in FALSE_VALUES:
+        return False
+    raise RejectedRow(f'{key} is not a boolean: {value!r}')
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk import suppliers, products or stock levels from a CSV/NDJSON file. "
+        "Rows are upserted by natural key (Supplier.name, Product.sku, Location.code) in chunked transactions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['suppliers', 'products', 'stock'])
+        parser.add_argument('path', help="CSV or NDJSON file ('-' for stdin)")
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--offset', type=int, default=0, help='Skip this many data rows (restart after a failure)')
+        parser.add_argument('--checkpoint', help='File recording the last committed offset; resumes from it when present')
+        parser.add_argument('--rejects', help='Write rejected rows (with reason) to this NDJSON file')
+
+    def handle(self, *args, **options):
+        self.kind = options['kind']
+        self.batch_size = options['batch_size']
+        checkpoint = Path(options['checkpoint']) if options['checkpoint'] else None
+        offset = options['offset']
+        if checkpoint and checkpoint.exists() and not offset:
+            offset = int(checkpoint.read_text().strip() or 0)
+            self.stdout.write(f'Resuming from checkpoint offset {offset}')
+
+        fmt = options['format'] or ('ndjson' if options['path'].endswith(('.ndjson', '.jsonl')) else 'csv')
+        handle = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8')
+        rejects = open(options['rejects'], 'a', encoding='utf-8') if options['rejects'] else None
+        self.build_maps()
+
+        imported = rejected = 0
+        position = offset
+        started = time.monotonic()
+        try:
+            rows = islice(self.read_rows(handle, fmt), offset, None)
+            while True:
+                chunk = list(islice(rows, self.batch_size))
+                if not chunk:
+                    break
+                objects, errors = self.prepare(chunk, position)
+                with transaction.atomic():
+                    self.upsert(objects)
+                    counters.invalidate()
+                position += len(chunk)
+                imported += len(objects)
+                rejected += len(errors)
+                for line, reason, raw in errors:
+                    if rejects:
+                        rejects.write(json.dumps({'line': line, 'reason': reason, 'row': raw}) + '\n')
+                    else:
+                        self.stderr.write(f'line {line}: {reason}')
+                if checkpoint:
+                    checkpoint.write_text(str(position))
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'offset={position} imported={imported} rejected={rejected} '
+                    f'rate={(position - offset) / elapsed if elapsed else 0:.0f} rows/s'
+                )
+        finally:
+            if handle is not sys.stdin:
+                handle.close()
+            if rejects:
+                rejects.close()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{self.kind}: {imported} upserted, {rejected} rejected, '
+            f'{position - offset} rows in {elapsed:.1f}s'
+        ))
+
+    def read_rows(self, handle, fmt):
+        if fmt == 'csv':
+            yield from csv.DictReader(handle)
+            return
+        for number, line in enumerate(handle, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise CommandError(f'Invalid JSON on line {number}: {e}')
+
+    def build_maps(self):
+        # Natural key -> id maps, loaded once for the whole run
+        self.suppliers = dict(Supplier.objects.values_list('name', 'id'))
+        if self.kind == 'stock':
+            self.locations = dict(Location.objects.values_list('code', 'id'))
+            self.products = dict(Product.objects.values_list('sku', 'id'))
+
+    def prepare(self, chunk, position):
+        # Keyed by natural key so a repeated key within a chunk keeps its last row
+        objects, errors = {}, []
+        for index, row in enumerate(chunk, start=position + 1):
+            try:
+                key, obj = getattr(self, f'build_{self.kind}')(row)
+            except RejectedRow as e:
+                errors.append((index, str(e), row))
+                continue
+            objects[key] = obj
+        return list(objects.values()), errors
+
+    def build_suppliers(self, row):
+        name = _text(row, 'name', required=True)
+        return name, Supplier(
+            id=self.suppliers.get(name), name=name,
+            email=_text(row, 'email'), phone=_text(row, 'phone'),
+            address=_text(row, 'address'), website=_text(row, 'website'),
+        )
+
+    def build_products(self, row):
+        sku = _text(row, 'sku', required=True)
+        supplier_name = _text(row, 'supplier')
+        supplier_id = None
+        if supplier_name:
+            supplier_id = self.suppliers.get(supplier_name)
+            if supplier_id is None:
+                raise RejectedRow(f'unknown supplier {supplier_name!r}')
+        return sku, Product(
+            sku=sku, name=_text(row, 'name', required=True), description=_text(row, 'description'),
+            unit_cost=_decimal(row, 'unit_cost'), unit_price=_decimal(row, 'unit_price'),
+            supplier_id=supplier_id, is_active=_bool(row, 'is_active'),
+            track_inventory=_bool(row, 'track_inventory'),
+        )
+
+    def build_stock(self, row):
+        sku = _text(row, 'sku', required=True)
+        code = _text(row, 'location', required=True)
+        if sku not in self.products:
+            raise RejectedRow(f'unknown sku {sku!r}')
+        if code not in self.locations:
+            raise RejectedRow(f'unknown location {code!r}')
+        key = (self.products[sku], self.locations[code])
+        return key, InventoryItem(
+            product_id=key[0], location_id=key[1],
+            quantity=_int(row, 'quantity'), reorder_threshold=_int(row, 'reorder_threshold'),
+        )
+
+    def upsert(self, objects):
+        if self.kind == 'suppliers':
+            # Supplier.name carries no unique constraint, so split into insert/update
+            fields = ['email', 'phone', 'address', 'website']
+            existing = [s for s in objects if s.id]
+            Supplier.objects.bulk_update(existing, fields, batch_size=self.batch_size)
+            bump_versions(Supplier.objects.filter(pk__in=[s.id for s in existing]))
+            created = Supplier.objects.bulk_create([s for s in objects if not s.id], batch_size=self.batch_size)
+            new = [s.name for s in created]
+            self.suppliers.update(Supplier.objects.filter(name__in=new).values_list('name', 'id'))
+        elif self.kind == 'products':
+            # Stored cost and supplier, so the rollup is only re-derived for products whose values move
+            stored = {
+                sku: (unit_cost, supplier_id)
+                for sku, unit_cost, supplier_id in Product.objects.filter(
+                    sku__in=[p.sku for p in objects],
+                ).values_list('sku', 'unit_cost', 'supplier_id')
+            }
+            Product.objects.bulk_create(
+                objects, batch_size=self.batch_size, update_conflicts=True, unique_fields=['sku'],
+                update_fields=['name', 'description', 'unit_cost', 'unit_price', 'supplier', 'is_active', 'track_inventory'],
+            )
+            # bulk_create skips save() and post_save, so move the row versions and keep the
+            # sales rollup and autocomplete in step here
+            upserted = Product.objects.filter(sku__in=[p.sku for p in objects])
+            bump_versions(upserted)
+            changed = [
+                p.sku for p in objects
+                if p.sku in stored and stored[p.sku] != (p.unit_cost, p.supplier_id)
+            ]
+            if changed:
+                refresh_daily_sales(Product.objects.filter(sku__in=changed))
+            product_index.invalidate()
+        else:
+            # Quantities before the upsert, so the ledger records the difference
+            before, ids = {}, {}
+            for pk, product_id, location_id, quantity in InventoryItem.objects.filter(
+                product_id__in={obj.product_id for obj in objects},
+                location_id__in={obj.location_id for obj in objects},
+            ).values_list('pk', 'product_id', 'location_id', 'quantity'):
+                before[(product_id, location_id)] = quantity
+                ids[(product_id, location_id)] = pk
+            InventoryItem.objects.bulk_create(
+                objects, batch_size=self.batch_size, update_conflicts=True, unique_fields=['product', 'location'],
+                update_fields=['quantity', 'reorder_threshold', 'updated_at'],
+            )
+            updated = [ids[key] for key in ((obj.product_id, obj.location_id) for obj in objects) if key in ids]
+            bump_versions(InventoryItem.objects.filter(pk__in=updated))
+            record_movements(
+                StockMovement(
+                    product_id=obj.product_id, location_id=obj.location_id, kind=StockMovement.Kind.IMPORT,
+                    delta=obj.quantity - before.get((obj.product_id, obj.location_id), 0), quantity_after=obj.quantity,
+                )
+                for obj in objects
+            )
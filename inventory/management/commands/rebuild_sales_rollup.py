@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+from inventory.models import rebuild_daily_sales
+
+
+class Command(BaseCommand):
+    help = "Rebuild (or backfill) the daily sales rollup from completed sales orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', type=parse_date, help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--end-date', type=parse_date, help='Last day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        written = rebuild_daily_sales(options['start_date'], options['end_date'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Daily sales rollup rebuilt: {written} rows.'))
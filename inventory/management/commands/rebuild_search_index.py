@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from inventory import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the SQLite FTS5 search index (all models, or the given ones), creating it if missing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help=f"Model labels, e.g. {', '.join(search.INDEXES)}")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if not search.fts5_supported(connection):
+            raise CommandError('Full-text search needs SQLite with FTS5.')
+        unknown = sorted(set(options['models']) - set(search.INDEXES))
+        if unknown:
+            raise CommandError(f"Unknown model(s): {', '.join(unknown)}")
+        with transaction.atomic(using=options['database']):
+            if search.enabled(options['database']):
+                search.rebuild(connection, options['models'] or None)
+            else:
+                search.install(connection)
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
@@ -0,0 +1,236 @@
+import random
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from inventory import counters, report_cache
+from inventory.autocomplete import product_index
+from inventory.models import (
+    Supplier, Product, Location, InventoryItem,
+    PurchaseOrder, PurchaseOrderItem, SalesOrder, SalesOrderItem, StockReservation,
+    rebuild_daily_sales, take_stock_snapshots,
+)
+
+NOUNS = [
+    'Vis', 'Écrou', 'Boulon', 'Rondelle', 'Câble', 'Gaine', 'Tube', 'Raccord', 'Joint', 'Filtre',
+    'Pompe', 'Moteur', 'Capteur', 'Relais', 'Fusible', 'Ampoule', 'Batterie', 'Courroie', 'Roulement', 'Vanne',
+]
+QUALIFIERS = [
+    'inox', 'acier', 'laiton', 'cuivre', 'plastique', 'renforcé', 'étanche', 'compact', 'industriel', 'standard',
+    'haute pression', 'basse tension', 'zingué', 'galvanisé', 'téflon', 'nylon', 'aluminium', 'silicone',
+]
+SIZES = ['M3', 'M4', 'M5', 'M6', 'M8', 'M10', 'M12', '6 mm', '10 mm', '16 mm', '1/4"', '1/2"', '3/4"', '12 V', '24 V', '230 V']
+ORDER_STATUSES = [
+    (SalesOrder.Status.COMPLETED, 85), (SalesOrder.Status.PENDING, 5),
+    (SalesOrder.Status.DRAFT, 5), (SalesOrder.Status.CANCELLED, 5),
+]
+PURCHASE_STATUSES = [
+    (PurchaseOrder.Status.RECEIVED, 70), (PurchaseOrder.Status.PENDING, 20), (PurchaseOrder.Status.DRAFT, 10),
+]
+HISTORY_DAYS = 365
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a reproducible synthetic dataset for benchmarks: suppliers, products, locations, "
+        "stock, purchase orders and sales orders, inserted in bulk. The same --seed always yields "
+        "the same data (relative to now); --scale shrinks or grows every count."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--scale', type=float, default=1.0, help='Multiplier applied to every count below')
+        parser.add_argument('--suppliers', type=int, default=500)
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--locations', type=int, default=25)
+        parser.add_argument('--sales-orders', type=int, default=400_000)
+        parser.add_argument('--lines', type=int, default=5, help='Average lines per order')
+        parser.add_argument('--purchase-orders', type=int, default=20_000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = f"B{options['seed']}"
+        self.now = timezone.now().replace(microsecond=0)
+        count = {
+            name: max(1, int(options[name] * options['scale']))
+            for name in ('suppliers', 'products', 'locations', 'sales_orders', 'purchase_orders')
+        }
+        self.lines = max(1, options['lines'])
+        if Location.objects.filter(code__startswith=f'{self.prefix}-').exists():
+            raise CommandError(f"A dataset with seed {options['seed']} is already loaded; pick another --seed.")
+
+        started = time.perf_counter()
+        suppliers = self.step('suppliers', self.seed_suppliers, count['suppliers'])
+        products = self.step('products', self.seed_products, count['products'], suppliers)
+        locations = self.step('locations', self.seed_locations, count['locations'])
+        self.step('inventory items', self.seed_stock, products, locations)
+        self.step('purchase orders', self.seed_purchase_orders, count['purchase_orders'], suppliers, products, locations)
+        self.step('sales orders', self.seed_sales_orders, count['sales_orders'], products, locations)
+        self.step('reservations', self.seed_reservations, locations)
+        self.step('sales rollup rows', rebuild_daily_sales)
+        self.step('stock snapshots', lambda: take_stock_snapshots(locations))
+
+        counters.invalidate()
+        product_index.invalidate()
+        report_cache.invalidate_all()
+        self.stdout.write(self.style.SUCCESS(f'Dataset {self.prefix} ready in {time.perf_counter() - started:.1f}s.'))
+
+    def step(self, label, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        size = result if isinstance(result, int) else len(result)
+        self.stdout.write(f'{label}: {size} in {time.perf_counter() - started:.1f}s')
+        self.stdout.flush()
+        return result
+
+    def insert(self, model, objects):
+        """Bulk insert in batches, one transaction per batch; returns the saved objects (with pks)."""
+        saved = []
+        for start in range(0, len(objects), self.batch_size):
+            with transaction.atomic():
+                saved.extend(model.objects.bulk_create(objects[start:start + self.batch_size]))
+        return saved
+
+    def moment(self):
+        return self.now - timedelta(seconds=self.rng.randrange(HISTORY_DAYS * 86400))
+
+    def pick(self, choices):
+        return self.rng.choices([value for value, _ in choices], weights=[weight for _, weight in choices])[0]
+
+    def popular(self, products):
+        # Skewed towards the first products, as real sales are
+        return products[int(len(products) * self.rng.random() ** 3)]
+
+    def seed_suppliers(self, count):
+        suppliers = [
+            Supplier(name=f'{self.prefix} Fournisseur {n:05d}', email=f'contact{n}@{self.prefix.lower()}-fournisseur.example')
+            for n in range(count)
+        ]
+        return [supplier.pk for supplier in self.insert(Supplier, suppliers)]
+
+    def seed_products(self, count, suppliers):
+        rng = self.rng
+        products = []
+        for n in range(count):
+            cost = Decimal(rng.randrange(50, 50_000)) / 100
+            products.append(Product(
+                sku=f'{self.prefix}-{n:07d}',
+                name=f'{rng.choice(NOUNS)} {rng.choice(QUALIFIERS)} {rng.choice(SIZES)}',
+                description=f'{rng.choice(NOUNS)} {rng.choice(QUALIFIERS)}, référence fournisseur {rng.randrange(10**6):06d}',
+                unit_cost=cost,
+                unit_price=(cost * Decimal(rng.uniform(1.1, 2.0))).quantize(Decimal('0.01')),
+                supplier_id=rng.choice(suppliers),
+                is_active=rng.random() > 0.03,
+            ))
+        return [(product.pk, product.unit_cost, product.unit_price) for product in self.insert(Product, products)]
+
+    def seed_locations(self, count):
+        locations = [Location(code=f'{self.prefix}-WH{n:03d}', name=f'Entrepôt {n:03d}') for n in range(count)]
+        return [location.pk for location in self.insert(Location, locations)]
+
+    def seed_stock(self, products, locations):
+        rng = self.rng
+        items = []
+        for product_id, _, _ in products:
+            for location_id in rng.sample(locations, rng.randint(1, min(3, len(locations)))):
+                threshold = rng.randint(5, 50)
+                # About one row in ten at or below its threshold
+                quantity = rng.randint(0, threshold) if rng.random() < 0.1 else rng.randint(threshold + 1, 1000)
+                items.append(InventoryItem(
+                    product_id=product_id, location_id=location_id, quantity=quantity,
+                    reorder_threshold=threshold,
+                ))
+        return len(self.insert(InventoryItem, items))
+
+    def seed_purchase_orders(self, count, suppliers, products, locations):
+        rng = self.rng
+        created = 0
+        for start in range(0, count, self.batch_size):
+            orders = []
+            for n in range(start, min(count, start + self.batch_size)):
+                orders.append(PurchaseOrder(
+                    supplier_id=rng.choice(suppliers), reference=f'{self.prefix}-PO-{n:07d}',
+                    status=self.pick(PURCHASE_STATUSES), created_at=self.moment(),
+                    receive_location_id=rng.choice(locations),
+                ))
+            with transaction.atomic():
+                orders = PurchaseOrder.objects.bulk_create(orders)
+                lines = []
+                for order in orders:
+                    for product_id, cost, _ in rng.sample(products, rng.randint(1, min(10, len(products)))):
+                        lines.append(PurchaseOrderItem(
+                            purchase_order_id=order.pk, product_id=product_id,
+                            quantity=rng.randint(10, 500), unit_cost=cost,
+                        ))
+                PurchaseOrderItem.objects.bulk_create(lines, batch_size=self.batch_size)
+            created += len(orders)
+        return created
+
+    def seed_sales_orders(self, count, products, locations):
+        rng = self.rng
+        created = lines_created = 0
+        for start in range(0, count, self.batch_size):
+            orders = []
+            for n in range(start, min(count, start + self.batch_size)):
+                status = self.pick(ORDER_STATUSES)
+                created_at = self.moment()
+                completed_at = None
+                if status == SalesOrder.Status.COMPLETED:
+                    completed_at = min(self.now, created_at + timedelta(seconds=rng.randrange(3 * 86400)))
+                orders.append(SalesOrder(
+                    reference=f'{self.prefix}-SO-{n:07d}', customer_name=f'Client {rng.randrange(20_000):05d}',
+                    status=status, created_at=created_at, completed_at=completed_at,
+                    ship_from_id=rng.choice(locations),
+                ))
+            with transaction.atomic():
+                orders = SalesOrder.objects.bulk_create(orders)
+                lines = []
+                for order in orders:
+                    for _ in range(rng.randint(1, 2 * self.lines - 1)):
+                        product_id, _, price = self.popular(products)
+                        lines.append(SalesOrderItem(
+                            sales_order_id=order.pk, product_id=product_id,
+                            quantity=rng.randint(1, 10), unit_price=price,
+                        ))
+                SalesOrderItem.objects.bulk_create(lines, batch_size=self.batch_size)
+            created += len(orders)
+            lines_created += len(lines)
+        self.stdout.write(f'sales order lines: {lines_created}')
+        return created
+
+    def seed_reservations(self, locations):
+        # Pending orders hold their lines, like sync_reservations() would have done (without its
+        # availability check: the generator does not keep stock and orders consistent)
+        lines = SalesOrderItem.objects.filter(
+            sales_order__status=SalesOrder.Status.PENDING, sales_order__ship_from__in=locations,
+        ).values_list('sales_order_id', 'product_id', 'sales_order__ship_from_id').annotate(total=Sum('quantity'))
+        reservations = [
+            StockReservation(sales_order_id=order_id, product_id=product_id, location_id=location_id, quantity=total)
+            for order_id, product_id, location_id, total in lines.order_by()
+        ]
+        self.insert(StockReservation, reservations)
+        totals = defaultdict(int)
+        for reservation in reservations:
+            totals[(reservation.product_id, reservation.location_id)] += reservation.quantity
+        InventoryItem.objects.bulk_create(
+            [InventoryItem(product_id=product_id, location_id=location_id) for product_id, location_id in totals],
+            ignore_conflicts=True, batch_size=self.batch_size,
+        )
+        items = []
+        for location_id in locations:
+            for item in InventoryItem.objects.filter(location_id=location_id).only('id', 'product_id', 'location_id'):
+                if (item.product_id, item.location_id) in totals:
+                    item.reserved = totals[(item.product_id, item.location_id)]
+                    items.append(item)
+        for start in range(0, len(items), self.batch_size):
+            with transaction.atomic():
+                InventoryItem.objects.bulk_update(items[start:start + self.batch_size], ['reserved'])
+        return reservations
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.models import Location, take_stock_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        "Snapshot on-hand stock per location. Run periodically (e.g. nightly): point-in-time "
+        "stock reads the latest snapshot plus the ledger entries recorded after it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--location', action='append', help='Location code (repeatable; all locations by default)')
+        parser.add_argument('--min-movements', type=int, default=0, help='Skip locations with fewer ledger entries since their last snapshot')
+
+    def handle(self, *args, **options):
+        locations = None
+        if options['location']:
+            locations = dict(Location.objects.filter(code__in=options['location']).values_list('code', 'pk'))
+            unknown = sorted(set(options['location']) - set(locations))
+            if unknown:
+                raise CommandError(f"Unknown location(s): {', '.join(unknown)}")
+            locations = list(locations.values())
+        taken = take_stock_snapshots(locations, min_movements=options['min_movements'])
+        self.stdout.write(self.style.SUCCESS(f'{len(taken)} snapshot(s) taken.'))
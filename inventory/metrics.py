@@ -0,0 +1,269 @@
+"""Request and stock-operation metrics, served at /metrics in Prometheus text format.
+
+MetricsMiddleware times every request and files it under its URL name
+(`product-list`, `web:dashboard`, ...), together with the number and duration
+of the SQL queries it ran and the response size. Queries are counted by an
+execute wrapper installed on each new connection, which follows the request
+through sync_to_async via a context variable (queries run while a streamed
+body is being sent are not counted). Recording is a few dict
+lookups under a lock per request, so it stays on in production.
+
+Values live in the process: with several workers, scrape each of them (or
+run the metrics endpoint on a single worker).
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+UNRESOLVED = '<unresolved>'
+
+# Query count and time of the request being served, if any
+_request_stats = ContextVar('request_stats', default=None)
+# Stock operation being counted, if any: the ones it calls are part of it
+_operation = ContextVar('stock_operation', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield f'{self.name}{_labels(self.label_names, labels)} {_number(value)}'
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum]; made cumulative on export
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0]
+            state[0][index] += 1
+            state[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {labels: (list(counts), total) for labels, (counts, total) in self._values.items()}
+        bounds = [_number(bound) for bound in self.buckets] + ['+Inf']
+        for labels, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = 'le="' + bound + '"'
+                yield f'{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}'
+            yield f'{self.name}_count{_labels(self.label_names, labels)} {cumulative}'
+
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Request latency by URL name.', ('view', 'method', 'status'),
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'SQL queries run per request.', ('view',), buckets=QUERY_BUCKETS,
+)
+REQUEST_DB_SECONDS = Histogram(
+    'http_request_db_seconds', 'Time spent in SQL queries per request.', ('view',),
+)
+RESPONSE_BYTES = Histogram(
+    'http_response_size_bytes', 'Response body size (streamed bodies once fully sent).', ('view',), buckets=SIZE_BUCKETS,
+)
+STOCK_OPERATIONS = Counter(
+    'inventory_stock_operations_total', 'Stock-mutating operations by outcome.', ('operation', 'outcome'),
+)
+STOCK_OPERATION_SECONDS = Histogram(
+    'inventory_stock_operation_seconds', 'Duration of stock-mutating operations.', ('operation',),
+)
+REGISTRY = [
+    REQUEST_SECONDS, REQUEST_QUERIES, REQUEST_DB_SECONDS, RESPONSE_BYTES,
+    STOCK_OPERATIONS, STOCK_OPERATION_SECONDS,
+]
+
+
+def exposition() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats[0] += 1
+        stats[1] += time.perf_counter() - started
+
+
+def instrument(connection) -> None:
+    """Count the queries of `connection` against the current request (connection_created receiver)."""
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def counted(operation):
+    """Count calls of a stock operation by outcome ('ok' or 'error') and time them.
+
+    Only the outermost operation counts: adjust_stock_many() run by
+    complete() is part of the completion, not an adjust_stock of its own.
+    """
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _operation.get() is not None:
+                return func(*args, **kwargs)
+            token = _operation.set(operation)
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = func(*args, **kwargs)
+                outcome = 'ok'
+                return result
+            finally:
+                _operation.reset(token)
+                STOCK_OPERATIONS.inc(operation, outcome)
+                STOCK_OPERATION_SECONDS.observe(time.perf_counter() - started, operation)
+        return wrapper
+    return decorate
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else UNRESOLVED
+
+
+def _counted_body(chunks, observe):
+    size = 0
+    try:
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        observe(size)
+
+
+async def _acounted_body(chunks, observe):
+    size = 0
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        observe(size)
+
+
+class MetricsMiddleware:
+    """Records latency, SQL query count/time and response size per URL name. Put it first."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = [0, 0.0]
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        return self.record(request, response, stats, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        stats = [0, 0.0]
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        return self.record(request, response, stats, time.perf_counter() - started)
+
+    @staticmethod
+    def record(request, response, stats, elapsed):
+        view = _view_name(request)
+        REQUEST_SECONDS.observe(elapsed, view, request.method, str(response.status_code))
+        REQUEST_QUERIES.observe(stats[0], view)
+        REQUEST_DB_SECONDS.observe(stats[1], view)
+        observe = lambda size: RESPONSE_BYTES.observe(size, view)  # noqa: E731
+        if not response.streaming:
+            observe(len(response.content))
+        elif response.is_async:
+            response.streaming_content = _acounted_body(response.streaming_content, observe)
+        else:
+            response.streaming_content = _counted_body(response.streaming_content, observe)
+        return response
+
+
+@require_GET
+def metrics_view(request):
+    """Prometheus scrape endpoint, for staff users or `Authorization: Bearer <METRICS_TOKEN>`.
+
+    Without a token it is only open to everyone under DEBUG.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        allowed = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        allowed = settings.DEBUG
+    if not (allowed or request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(exposition(), content_type=CONTENT_TYPE)
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    SalesOrderItem = apps.get_model('inventory', 'SalesOrderItem')
+    DailySalesRollup = apps.get_model('inventory', 'DailySalesRollup')
+    money = models.DecimalField(max_digits=18, decimal_places=2)
+    rows = SalesOrderItem.objects.filter(sales_order__status='completed').values(
+        'sales_order__created_at__date', 'product_id', 'product__supplier_id'
+    ).annotate(
+        total_quantity=models.Sum('quantity'),
+        total_revenue=models.Sum(models.ExpressionWrapper(models.F('quantity') * models.F('unit_price'), output_field=money)),
+        total_cost=models.Sum(models.ExpressionWrapper(models.F('quantity') * models.F('product__unit_cost'), output_field=money)),
+    ).order_by()
+    DailySalesRollup.objects.bulk_create([
+        DailySalesRollup(
+            day=row['sales_order__created_at__date'], product_id=row['product_id'],
+            supplier_id=row['product__supplier_id'], quantity=row['total_quantity'],
+            revenue=row['total_revenue'], cost=row['total_cost'],
+        )
+        for row in rows.iterator(chunk_size=2000)
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='inventory.product')),
+                ('supplier', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_sales', to='inventory.supplier')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['supplier', 'day'], name='inventory_d_supplie_b27d92_idx')],
+                'unique_together': {('day', 'product')},
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
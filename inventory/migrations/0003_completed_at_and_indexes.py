@@ -0,0 +1,50 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:08
+
+from django.db import migrations, models
+
+
+def backfill_completed_at(apps, schema_editor):
+    # The real completion time was never recorded; creation time keeps the
+    # existing rollup days valid
+    SalesOrder = apps.get_model('inventory', 'SalesOrder')
+    SalesOrder.objects.filter(status='completed', completed_at__isnull=True).update(completed_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_daily_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='salesorder',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_completed_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='inventoryitem',
+            index=models.Index(condition=models.Q(('quantity__lte', models.F('reorder_threshold'))), fields=['location', 'product'], name='inventoryitem_low_stock'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['status', 'created_at'], name='purchaseorder_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['created_at', 'id'], name='purchaseorder_created_id'),
+        ),
+        migrations.AddIndex(
+            model_name='salesorder',
+            index=models.Index(fields=['status', 'completed_at'], name='salesorder_status_completed'),
+        ),
+        migrations.AddIndex(
+            model_name='salesorder',
+            index=models.Index(fields=['status', 'created_at'], name='salesorder_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='salesorder',
+            index=models.Index(fields=['created_at', 'id'], name='salesorder_created_id'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_completed_at_and_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventoryitem',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='inventoryitem',
+            name='low_stock_alerted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
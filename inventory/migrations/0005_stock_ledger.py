@@ -0,0 +1,74 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:11
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def opening_snapshots(apps, schema_editor):
+    # History starts here: the current quantities become each location's baseline
+    Location = apps.get_model('inventory', 'Location')
+    InventoryItem = apps.get_model('inventory', 'InventoryItem')
+    StockSnapshot = apps.get_model('inventory', 'StockSnapshot')
+    StockSnapshotItem = apps.get_model('inventory', 'StockSnapshotItem')
+    for location in Location.objects.all():
+        snapshot = StockSnapshot.objects.create(location=location, last_movement_id=0)
+        StockSnapshotItem.objects.bulk_create([
+            StockSnapshotItem(snapshot=snapshot, product_id=product_id, quantity=quantity)
+            for product_id, quantity in InventoryItem.objects.filter(location=location).values_list('product_id', 'quantity')
+        ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_inventoryitem_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_movement_id', models.BigIntegerField(default=0)),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='inventory.location')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockSnapshotItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inventory.product')),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='inventory.stocksnapshot')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.IntegerField()),
+                ('quantity_after', models.IntegerField()),
+                ('kind', models.CharField(choices=[('receipt', 'Receipt'), ('sale', 'Sale'), ('adjustment', 'Adjustment'), ('import', 'Import'), ('correction', 'Correction')], default='adjustment', max_length=16)),
+                ('reason', models.CharField(blank=True, default='', max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='inventory.location')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='inventory.product')),
+                ('purchase_order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='inventory.purchaseorder')),
+                ('sales_order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='inventory.salesorder')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['location', 'id'], name='stockmovement_location_id'), models.Index(fields=['product', 'location', 'created_at'], name='stockmovement_product_time')],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stocksnapshot',
+            index=models.Index(fields=['location', 'taken_at'], name='stocksnapshot_location_time'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='stocksnapshotitem',
+            unique_together={('snapshot', 'product')},
+        ),
+        migrations.RunPython(opening_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from inventory import search
+
+
+def create_search_index(apps, schema_editor):
+    if search.fts5_supported(schema_editor.connection):
+        search.install(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:26
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def reserve_pending_orders(apps, schema_editor):
+    # Orders already pending hold their lines from now on, even beyond what is available
+    SalesOrderItem = apps.get_model('inventory', 'SalesOrderItem')
+    InventoryItem = apps.get_model('inventory', 'InventoryItem')
+    StockReservation = apps.get_model('inventory', 'StockReservation')
+    lines = SalesOrderItem.objects.filter(sales_order__status='pending', sales_order__ship_from__isnull=False)
+    rows = lines.values_list('sales_order_id', 'product_id', 'sales_order__ship_from_id').annotate(total=models.Sum('quantity'))
+    reservations = [
+        StockReservation(sales_order_id=order_id, product_id=product_id, location_id=location_id, quantity=total)
+        for order_id, product_id, location_id, total in rows.order_by()
+    ]
+    StockReservation.objects.bulk_create(reservations, batch_size=500)
+    totals = StockReservation.objects.values_list('product_id', 'location_id').annotate(total=models.Sum('quantity'))
+    for product_id, location_id, total in totals.order_by():
+        item, _ = InventoryItem.objects.get_or_create(product_id=product_id, location_id=location_id)
+        item.reserved = total
+        item.save(update_fields=['reserved'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventoryitem',
+            name='reserved',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='stock_reservations', to='inventory.location')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='stock_reservations', to='inventory.product')),
+                ('sales_order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='inventory.salesorder')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'location'], name='stockreservation_product_loc')],
+                'unique_together': {('sales_order', 'product')},
+            },
+        ),
+        migrations.RunPython(reserve_pending_orders, migrations.RunPython.noop),
+    ]
@@ -1,20 +1,63 @@
-from django.db import models
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connections, models, transaction
+from django.db.models import sql
+from django.db.models.functions import Cast
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
+from . import counters, report_cache
+from .db import stock_write
+from .metrics import counted
+
+
+class VersionedModel(models.Model):
+    """Rows carry a version, bumped by every save() and by bump_versions() on bulk paths.
+
+    The API derives ETags from it (see ConditionalGetViewSetMixin); `updated_at`
+    gives Last-Modified. Both must move on every write that changes the row.
+    """
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version', 'updated_at'}
+        # Bumped in the UPDATE itself, so concurrent saves of a stale copy still each move it
+        version, self.version = self.version, models.F('version') + 1
+        try:
+            super().save(*args, **kwargs)
+        except Exception:
+            self.version = version
+            raise
+        self.refresh_from_db(fields=['version'])
+
 
-class Supplier(models.Model):
+def bump_versions(queryset, **values) -> int:
+    """queryset.update(**values), also moving version and updated_at (for bulk writes)."""
+    return queryset.update(version=models.F('version') + 1, updated_at=timezone.now(), **values)
+
+
+class Supplier(VersionedModel):
     name = models.CharField(max_length=255)
     email = models.EmailField(blank=True, null=True)
     phone = models.CharField(max_length=50, blank=True, null=True)
     address = models.TextField(blank=True, null=True)
     website = models.URLField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
 
-class Product(models.Model):
+class Product(VersionedModel):
     sku = models.CharField(max_length=64, unique=True)
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
@@ -23,32 +66,66 @@ class Product(models.Model):
     supplier = models.ForeignKey(Supplier, on_delete=models.SET_NULL, null=True, blank=True, related_name='products')
     is_active = models.BooleanField(default=True)
     track_inventory = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.sku} - {self.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        product = super().from_db(db, field_names, values)
+        # Baseline for the sales rollup refresh: only cost or supplier changes reach it
+        if {'unit_cost', 'supplier_id'} <= product.__dict__.keys():
+            product._saved_costing = (product.unit_cost, product.supplier_id)
+        return product
 
-class Location(models.Model):
+
+class Location(VersionedModel):
     code = models.CharField(max_length=32, unique=True)
     name = models.CharField(max_length=255)
     address = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.code} - {self.name}"
 
 
-class InventoryItem(models.Model):
+class InventoryItem(VersionedModel):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='inventory_items')
     location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='inventory_items')
     quantity = models.IntegerField(default=0)
+    # Sum of the StockReservation rows for this product and location, kept by sync_reservations()
+    reserved = models.IntegerField(default=0, editable=False)
     reorder_threshold = models.IntegerField(default=0)
+    # Bulk paths (adjust_stock_many, import_catalog, reservations) set updated_at and version explicitly
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    low_stock_alerted_at = models.DateTimeField(blank=True, null=True, editable=False)
 
     class Meta:
         unique_together = ('product', 'location')
+        indexes = [
+            # Only rows at or below their threshold, so the low-stock scan stays small
+            models.Index(
+                fields=['location', 'product'], name='inventoryitem_low_stock',
+                condition=models.Q(quantity__lte=models.F('reorder_threshold')),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.product.sku} @ {self.location.code}: {self.quantity}"
 
+    @property
+    def available(self):
+        """Available to promise: on hand minus what pending orders hold."""
+        return self.quantity - self.reserved
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        item = super().from_db(db, field_names, values)
+        # Baseline for the ledger entry written when the row is saved directly
+        item._saved_quantity = item.__dict__.get('quantity')
+        return item
+
 
 class PurchaseOrder(models.Model):
     class Status(models.TextChoices):
@@ -65,18 +142,44 @@ class PurchaseOrder(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     receive_location = models.ForeignKey(Location, on_delete=models.PROTECT, related_name='received_purchase_orders', null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='purchaseorder_status_created'),
+            models.Index(fields=['created_at', 'id'], name='purchaseorder_created_id'),
+        ]
+
     def __str__(self):
         return f"PO-{self.id or 'new'} {self.supplier.name} ({self.status})"
 
+    @counted('receive')
+    @stock_write
     def receive(self):
         if self.status in {self.Status.CANCELLED, self.Status.RECEIVED}:
             raise ValidationError('Cannot receive a cancelled or already received purchase order.')
         if not self.receive_location:
             raise ValidationError('receive_location must be set to receive stock.')
-        for item in self.items.all():
-            adjust_stock(item.product, self.receive_location, item.quantity)
-        self.status = self.Status.RECEIVED
-        self.save(update_fields=['status', 'updated_at'])
+        with transaction.atomic():
+            # Merge duplicate product lines so each row is touched once
+            received = defaultdict(int)
+            lines = defaultdict(int)
+            for product_id, quantity in self.items.values_list('product_id', 'quantity'):
+                received[product_id] += quantity
+                lines[product_id] += 1
+            updated = adjust_stock_many(
+                [(pid, self.receive_location_id, qty) for pid, qty in received.items()],
+                kind=StockMovement.Kind.RECEIPT, purchase_order=self,
+            )
+            self.status = self.Status.RECEIVED
+            self.save(update_fields=['status', 'updated_at'])
+        return [
+            {
+                'product': product_id,
+                'lines': lines[product_id],
+                'quantity': quantity,
+                'on_hand': updated[(product_id, self.receive_location_id)].quantity,
+            }
+            for product_id, quantity in received.items()
+        ]
 
 
 class PurchaseOrderItem(models.Model):
@@ -102,26 +205,57 @@ class SalesOrder(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     ship_from = models.ForeignKey(Location, on_delete=models.PROTECT, related_name='sales_orders', null=True, blank=True)
+    completed_at = models.DateTimeField(blank=True, null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'completed_at'], name='salesorder_status_completed'),
+            models.Index(fields=['status', 'created_at'], name='salesorder_status_created'),
+            models.Index(fields=['created_at', 'id'], name='salesorder_created_id'),
+        ]
 
     def __str__(self):
         return f"SO-{self.id or 'new'} ({self.status})"
 
+    @counted('complete')
+    @stock_write
     def complete(self):
         if self.status in {self.Status.CANCELLED, self.Status.COMPLETED}:
             raise ValidationError('Cannot complete a cancelled or already completed sales order.')
         if not self.ship_from:
             raise ValidationError('ship_from must be set to complete order.')
-        # Ensure stock availability
-        for item in self.items.all():
-            inv = InventoryItem.objects.filter(product=item.product, location=self.ship_from).first()
-            available = inv.quantity if inv else 0
-            if item.quantity > available:
-                raise ValidationError(f'Insufficient stock for {item.product.sku} at {self.ship_from.code}.')
-        # Deduct stock
-        for item in self.items.all():
-            adjust_stock(item.product, self.ship_from, -item.quantity)
-        self.status = self.Status.COMPLETED
-        self.save(update_fields=['status', 'updated_at'])
+        with transaction.atomic():
+            # The order's own reservation becomes part of what it may take
+            release_reservations([self])
+            # Load every line with the stock available at ship_from in one query
+            on_hand = InventoryItem.objects.filter(
+                product=models.OuterRef('product'), location=self.ship_from
+            ).values(free=models.F('quantity') - models.F('reserved'))[:1]
+            items = self.items.select_related('product').annotate(available=models.Subquery(on_hand))
+            items = list(items)
+            requested = defaultdict(int)
+            available = {}
+            skus = {}
+            for item in items:
+                requested[item.product_id] += item.quantity
+                available[item.product_id] = item.available or 0
+                skus[item.product_id] = item.product.sku
+            short = [pid for pid, qty in requested.items() if qty > available[pid]]
+            if not short:
+                updated = adjust_stock_many(
+                    [(pid, self.ship_from_id, -qty) for pid, qty in requested.items()], guarded=True,
+                    kind=StockMovement.Kind.SALE, sales_order=self,
+                )
+                # Another writer may have consumed the stock since it was read
+                short = [pid for pid in requested if (pid, self.ship_from_id) not in updated]
+            if short:
+                raise ValidationError([
+                    f'Insufficient stock for {skus[pid]} at {self.ship_from.code}.' for pid in short
+                ])
+            self.status = self.Status.COMPLETED
+            self.completed_at = timezone.now()
+            self.save(update_fields=['status', 'completed_at', 'updated_at'])
+            record_daily_sales(self, items)
 
 
 class SalesOrderItem(models.Model):
@@ -134,10 +268,648 @@ class SalesOrderItem(models.Model):
         return f"SOI {self.product.sku} x{self.quantity}"
 
 
-def adjust_stock(product: Product, location: Location, delta: int) -> InventoryItem:
+class DailySalesRollup(models.Model):
+    """Completed sales per day and product, maintained as orders complete.
+
+    Edits and deletions of completed orders resync the rows they touch (see
+    keep_daily_sales()). `supplier` and `cost` follow the product's current
+    supplier and unit cost, like the raw report does; see refresh_daily_sales().
+    """
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    supplier = models.ForeignKey(Supplier, on_delete=models.SET_NULL, null=True, blank=True, related_name='daily_sales')
+    quantity = models.BigIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    cost = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('day', 'product')
+        indexes = [models.Index(fields=['supplier', 'day'])]
+
+    def __str__(self):
+        return f"{self.day} {self.product_id}: {self.quantity}"
+
+
+class StockMovement(models.Model):
+    """Append-only ledger of every change to InventoryItem.quantity."""
+
+    class Kind(models.TextChoices):
+        RECEIPT = 'receipt', 'Receipt'
+        SALE = 'sale', 'Sale'
+        ADJUSTMENT = 'adjustment', 'Adjustment'
+        IMPORT = 'import', 'Import'
+        CORRECTION = 'correction', 'Correction'
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements')
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='stock_movements')
+    delta = models.IntegerField()
+    quantity_after = models.IntegerField()
+    kind = models.CharField(max_length=16, choices=Kind.choices, default=Kind.ADJUSTMENT)
+    reason = models.CharField(max_length=255, blank=True, default='')
+    purchase_order = models.ForeignKey(PurchaseOrder, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    sales_order = models.ForeignKey(SalesOrder, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Delta scans after a snapshot: WHERE location = ? AND id > ?
+            models.Index(fields=['location', 'id'], name='stockmovement_location_id'),
+            models.Index(fields=['product', 'location', 'created_at'], name='stockmovement_product_time'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.product_id}@{self.location_id}: {self.delta:+d}"
+
+
+class StockSnapshot(models.Model):
+    """On-hand quantities of one location, as of ledger entry `last_movement_id`."""
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='stock_snapshots')
+    taken_at = models.DateTimeField(default=timezone.now)
+    last_movement_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['location', 'taken_at'], name='stocksnapshot_location_time')]
+
+    def __str__(self):
+        return f"{self.location_id} @ {self.taken_at:%Y-%m-%d %H:%M}"
+
+
+class StockSnapshotItem(models.Model):
+    snapshot = models.ForeignKey(StockSnapshot, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    quantity = models.IntegerField()
+
+    class Meta:
+        unique_together = ('snapshot', 'product')
+
+
+class StockReservation(models.Model):
+    """Stock held at `location` by a pending sales order, one row per product."""
+    sales_order = models.ForeignKey(SalesOrder, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='stock_reservations')
+    location = models.ForeignKey(Location, on_delete=models.PROTECT, related_name='stock_reservations')
+    quantity = models.PositiveIntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('sales_order', 'product')
+        indexes = [models.Index(fields=['product', 'location'], name='stockreservation_product_loc')]
+
+    def __str__(self):
+        return f"SO-{self.sales_order_id} {self.product_id}@{self.location_id}: {self.quantity}"
+
+
+def adjust_stock(product: Product, location: Location, delta: int, **movement) -> InventoryItem:
     """Adjust stock quantity for a product at a location by delta (can be negative)."""
-    inv, _ = InventoryItem.objects.get_or_create(product=product, location=location, defaults={'quantity': 0})
-    inv.quantity = models.F('quantity') + delta
-    inv.save(update_fields=['quantity'])
-    # Refresh from DB to collapse F expression
-    return InventoryItem.objects.get(pk=inv.pk)
+    return adjust_stock_many([(product.pk, location.pk, delta)], **movement)[(product.pk, location.pk)]
+
+
+STOCK_BATCH_SIZE = 100
+
+
+def _supports_update_returning(connection) -> bool:
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35)
+
+
+def _update_returning(queryset, values: dict) -> list:
+    """Run queryset.update(**values) and return the updated rows as model instances.
+
+    The UPDATE is compiled by the ORM; on backends with UPDATE ... RETURNING the
+    new rows come back with the statement, otherwise they are re-read once.
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    if not _supports_update_returning(connection):
+        pks = list(queryset.values_list('pk', flat=True))
+        queryset.filter(pk__in=pks).update(**values)
+        return list(model._base_manager.using(queryset.db).filter(pk__in=pks))
+    fields = model._meta.concrete_fields
+    query = queryset.query.chain(sql.UpdateQuery)
+    query.add_update_values(values)
+    update_sql, params = query.get_compiler(queryset.db).as_sql()
+    columns = ', '.join(connection.ops.quote_name(f.column) for f in fields)
+    with connection.cursor() as cursor:
+        cursor.execute(f'{update_sql} RETURNING {columns}', params)
+        rows = cursor.fetchall()
+    names = [f.attname for f in fields]
+    return [model.from_db(queryset.db, names, row) for row in rows]
+
+
+@counted('adjust_stock')
+@stock_write
+def adjust_stock_many(changes, guarded: bool = False, **movement) -> dict:
+    """Apply [(product_id, location_id, delta), ...] to stock in a few batched statements.
+
+    Duplicate (product, location) pairs are merged, missing rows are created in
+    one bulk insert and every delta is applied with CASE UPDATEs that return the
+    new rows. With guarded=True a row is only decremented while it holds enough
+    unreserved stock. Returns {(product_id, location_id): InventoryItem} for the rows that
+    were updated; pairs left out failed their guard.
+
+    Each applied change is appended to the StockMovement ledger. Keyword
+    arguments (kind, reason, sales_order, ...) describe the movements; a dict
+    as a fourth tuple element overrides them for that change.
+
+    Called outside a transaction it takes the SQLite write lock up front and
+    retries while the database is locked (see inventory.db.stock_write).
+    """
+    changes = list(changes)
+    merged = defaultdict(int)
+    for product_id, location_id, delta, *_ in changes:
+        merged[(product_id, location_id)] += delta
+    pending = list(merged.items())
+    updated = {}
+    now = timezone.now()
+    with transaction.atomic():
+        wanted = {key for key, delta in pending if delta >= 0 or not guarded}
+        if wanted:
+            wanted -= set(InventoryItem.objects.filter(
+                product_id__in={product_id for product_id, _ in wanted},
+                location_id__in={location_id for _, location_id in wanted},
+            ).values_list('product_id', 'location_id'))
+        if wanted:
+            InventoryItem.objects.bulk_create(
+                [InventoryItem(product_id=product_id, location_id=location_id, quantity=0) for product_id, location_id in wanted],
+                ignore_conflicts=True,
+                batch_size=STOCK_BATCH_SIZE * 5,
+            )
+            # bulk_create skips post_save, which keeps the dashboard counts fresh
+            counters.invalidate()
+        for start in range(0, len(pending), STOCK_BATCH_SIZE):
+            batch = pending[start:start + STOCK_BATCH_SIZE]
+            match = models.Q()
+            whens = []
+            for (product_id, location_id), delta in batch:
+                key = models.Q(product_id=product_id, location_id=location_id)
+                match |= key & models.Q(quantity__gte=models.F('reserved') - delta) if guarded and delta < 0 else key
+                whens.append(models.When(key, then=models.F('quantity') + delta))
+            rows = _update_returning(
+                InventoryItem.objects.filter(match),
+                {
+                    'quantity': models.Case(*whens, default=models.F('quantity')),
+                    'version': models.F('version') + 1, 'updated_at': now,
+                },
+            )
+            for inv in rows:
+                updated[(inv.product_id, inv.location_id)] = inv
+        # Walk back from the final quantities to each change's running balance
+        balance = {key: inv.quantity for key, inv in updated.items()}
+        entries = []
+        for product_id, location_id, delta, *extra in reversed(changes):
+            key = (product_id, location_id)
+            if key not in balance or not delta:
+                continue
+            entries.append(StockMovement(
+                product_id=product_id, location_id=location_id, delta=delta,
+                quantity_after=balance[key], created_at=now, **{**movement, **(extra[0] if extra else {})},
+            ))
+            balance[key] -= delta
+        StockMovement.objects.bulk_create(entries[::-1], batch_size=STOCK_BATCH_SIZE * 5)
+    return updated
+
+
+def record_movements(entries) -> None:
+    """Append StockMovement rows for changes applied outside adjust_stock_many()."""
+    StockMovement.objects.bulk_create([entry for entry in entries if entry.delta], batch_size=STOCK_BATCH_SIZE * 5)
+
+
+def take_stock_snapshots(locations=None, min_movements: int = 0) -> list:
+    """Snapshot on-hand quantities per location (ids or a queryset; all by default).
+
+    Locations with fewer than `min_movements` ledger entries since their last
+    snapshot are skipped, so the snapshot cadence follows activity and the delta
+    scan behind stock_at() stays bounded. Returns the snapshots taken.
+    """
+    location_ids = list(Location.objects.filter(pk__in=locations).values_list('pk', flat=True)) if locations is not None \
+        else list(Location.objects.values_list('pk', flat=True))
+    taken = []
+    for location_id in location_ids:
+        with transaction.atomic():
+            # Mark and quantities are read in one transaction, so they agree
+            mark = StockMovement.objects.aggregate(mark=models.Max('id'))['mark'] or 0
+            if min_movements:
+                previous = StockSnapshot.objects.filter(location_id=location_id).order_by('-taken_at').first()
+                since = previous.last_movement_id if previous else 0
+                pending = StockMovement.objects.filter(location_id=location_id, id__gt=since, id__lte=mark).count()
+                if pending < min_movements:
+                    continue
+            quantities = list(InventoryItem.objects.filter(location_id=location_id).values_list('product_id', 'quantity'))
+            snapshot = StockSnapshot.objects.create(location_id=location_id, taken_at=timezone.now(), last_movement_id=mark)
+            StockSnapshotItem.objects.bulk_create(
+                [StockSnapshotItem(snapshot=snapshot, product_id=product_id, quantity=quantity) for product_id, quantity in quantities],
+                batch_size=STOCK_BATCH_SIZE * 5,
+            )
+            taken.append(snapshot)
+    return taken
+
+
+def stock_at(location, moment, products=None) -> dict:
+    """On-hand quantities {product_id: quantity} at `location` as of `moment`.
+
+    Reads the latest snapshot taken at or before `moment` and adds the ledger
+    entries recorded after it, so the cost is bounded by the snapshot cadence
+    rather than the length of the history.
+    """
+    snapshot = StockSnapshot.objects.filter(location=location, taken_at__lte=moment).order_by('-taken_at').first()
+    quantities = {}
+    movements = StockMovement.objects.filter(location=location, created_at__lte=moment)
+    if snapshot is not None:
+        items = snapshot.items.all()
+        if products is not None:
+            items = items.filter(product__in=products)
+        quantities = dict(items.values_list('product_id', 'quantity'))
+        movements = movements.filter(id__gt=snapshot.last_movement_id)
+    if products is not None:
+        movements = movements.filter(product__in=products)
+    for product_id, delta in movements.values_list('product_id').annotate(total=models.Sum('delta')).order_by():
+        quantities[product_id] = quantities.get(product_id, 0) + delta
+    return quantities
+
+
+def low_stock_items(queryset=None):
+    """Items at or under their reorder threshold, most severe first.
+
+    Severity is the share of the threshold that is missing (1.0 when out of
+    stock, whatever the threshold), then the raw shortfall breaks ties.
+    """
+    if queryset is None:
+        queryset = InventoryItem.objects.all()
+    shortfall = models.F('reorder_threshold') - models.F('quantity')
+    return queryset.filter(quantity__lte=models.F('reorder_threshold')).annotate(
+        shortfall=shortfall,
+        severity=Cast(shortfall + 1, models.FloatField()) / (models.F('reorder_threshold') + 1),
+    ).order_by('-severity', '-shortfall', 'product__sku')
+
+
+def _apply_reserved(deltas: dict) -> list:
+    """Add {(product_id, location_id): delta} to InventoryItem.reserved.
+
+    Increases must fit in the available quantity; if any does not, nothing is
+    written and the keys that did not fit are returned.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    keys = list(deltas)
+    batches = []
+    available = {}
+    for start in range(0, len(keys), STOCK_BATCH_SIZE):
+        match = models.Q()
+        for product_id, location_id in keys[start:start + STOCK_BATCH_SIZE]:
+            match |= models.Q(product_id=product_id, location_id=location_id)
+        batches.append((keys[start:start + STOCK_BATCH_SIZE], match))
+        rows = InventoryItem.objects.select_for_update().filter(match)
+        for product_id, location_id, quantity, reserved in rows.values_list('product_id', 'location_id', 'quantity', 'reserved'):
+            available[(product_id, location_id)] = quantity - reserved
+    short = [key for key, delta in deltas.items() if delta > 0 and available.get(key, 0) < delta]
+    if short:
+        return short
+    for batch, match in batches:
+        whens = [
+            models.When(models.Q(product_id=product_id, location_id=location_id), then=models.F('reserved') + deltas[(product_id, location_id)])
+            for product_id, location_id in batch
+        ]
+        bump_versions(InventoryItem.objects.filter(match), reserved=models.Case(*whens, default=models.F('reserved')))
+    return []
+
+
+def _reservation_errors(keys) -> list:
+    skus = dict(Product.objects.filter(pk__in={product_id for product_id, _ in keys}).values_list('pk', 'sku'))
+    codes = dict(Location.objects.filter(pk__in={location_id for _, location_id in keys}).values_list('pk', 'code'))
+    return [f'Insufficient stock to reserve {skus[product_id]} at {codes[location_id]}.' for product_id, location_id in keys]
+
+
+@stock_write
+def sync_reservations(orders) -> None:
+    """Bring the reservations of `orders` (SalesOrder instances) in line with their status and lines.
+
+    A pending order with a ship_from location reserves the quantity of each of
+    its products there; any other status holds nothing. Only differences are
+    written, to StockReservation and to InventoryItem.reserved. Raises
+    ValidationError, writing nothing, when a pending order asks for more than
+    is available to promise.
+    """
+    orders = {order.pk: order for order in orders}
+    holding = [pk for pk, order in orders.items() if order.status == SalesOrder.Status.PENDING and order.ship_from_id]
+    with transaction.atomic():
+        wanted = defaultdict(int)
+        lines = SalesOrderItem.objects.filter(sales_order__in=holding).values_list('sales_order_id', 'product_id', 'quantity')
+        for order_id, product_id, quantity in lines:
+            wanted[(order_id, product_id, orders[order_id].ship_from_id)] += quantity
+        held = {
+            (reservation.sales_order_id, reservation.product_id, reservation.location_id): reservation
+            for reservation in StockReservation.objects.filter(sales_order__in=list(orders))
+        }
+        deltas = defaultdict(int)
+        for (_, product_id, location_id), quantity in wanted.items():
+            deltas[(product_id, location_id)] += quantity
+        for (_, product_id, location_id), reservation in held.items():
+            deltas[(product_id, location_id)] -= reservation.quantity
+        short = _apply_reserved(deltas)
+        if short:
+            raise ValidationError(_reservation_errors(short))
+
+        stale = [reservation.pk for key, reservation in held.items() if key not in wanted]
+        changed, created = [], []
+        for (order_id, product_id, location_id), quantity in wanted.items():
+            reservation = held.get((order_id, product_id, location_id))
+            if reservation is None:
+                created.append(StockReservation(sales_order_id=order_id, product_id=product_id, location_id=location_id, quantity=quantity))
+            elif reservation.quantity != quantity:
+                reservation.quantity = quantity
+                changed.append(reservation)
+        if stale:
+            StockReservation.objects.filter(pk__in=stale).delete()
+        StockReservation.objects.bulk_update(changed, ['quantity'], batch_size=STOCK_BATCH_SIZE * 5)
+        StockReservation.objects.bulk_create(created, batch_size=STOCK_BATCH_SIZE * 5)
+
+
+@stock_write
+def release_reservations(orders) -> None:
+    """Drop every reservation held by `orders` (instances or ids)."""
+    with transaction.atomic():
+        held = StockReservation.objects.filter(sales_order__in=list(orders))
+        deltas = defaultdict(int)
+        for product_id, location_id, quantity in held.values_list('product_id', 'location_id', 'quantity'):
+            deltas[(product_id, location_id)] -= quantity
+        if deltas:
+            _apply_reserved(deltas)
+            held.delete()
+
+
+def available_to_promise(product_id, location_id) -> int:
+    """On hand minus reserved for one product and location: a single unique-index read."""
+    row = InventoryItem.objects.filter(product_id=product_id, location_id=location_id).values_list('quantity', 'reserved').first()
+    return row[0] - row[1] if row else 0
+
+
+BULK_COMPLETE_CHUNK_SIZE = 200
+
+
+@counted('bulk_complete')
+def complete_sales_orders(order_ids, chunk_size: int = BULK_COMPLETE_CHUNK_SIZE) -> dict:
+    """Complete many sales orders, one transaction per chunk.
+
+    Each chunk loads its orders, their lines and the inventory they touch in a
+    few queries, checks availability in memory and deducts stock for every
+    eligible order in one adjust_stock_many() call. If a concurrent writer
+    beats the chunk to its stock, the chunk is retried order by order.
+    Returns {order_id: [error, ...]}, with an empty list for completed orders.
+    """
+    results = {}
+    order_ids = list(dict.fromkeys(order_ids))
+    for start in range(0, len(order_ids), chunk_size):
+        chunk = order_ids[start:start + chunk_size]
+        try:
+            results.update(_complete_sales_order_chunk(chunk))
+        except _StockConflict:
+            for order in SalesOrder.objects.filter(pk__in=chunk).select_related('ship_from'):
+                try:
+                    order.complete()
+                    results[order.pk] = []
+                except ValidationError as e:
+                    results[order.pk] = e.messages
+            for pk in chunk:
+                results.setdefault(pk, ['Sales order not found.'])
+    return {pk: results[pk] for pk in order_ids}
+
+
+class _StockConflict(Exception):
+    pass
+
+
+@stock_write
+def _complete_sales_order_chunk(chunk: list) -> dict:
+    results = {}
+    with transaction.atomic():
+        orders = {
+            order.pk: order
+            for order in SalesOrder.objects.filter(pk__in=chunk)
+            .select_related('ship_from')
+            .prefetch_related(models.Prefetch('items', queryset=SalesOrderItem.objects.select_related('product')))
+        }
+        product_ids = {item.product_id for order in orders.values() for item in order.items.all()}
+        location_ids = {order.ship_from_id for order in orders.values() if order.ship_from_id}
+        # Available stock, plus what each order holds itself
+        on_hand = {
+            (product_id, location_id): quantity - reserved
+            for product_id, location_id, quantity, reserved in InventoryItem.objects.filter(
+                product_id__in=product_ids, location_id__in=location_ids
+            ).values_list('product_id', 'location_id', 'quantity', 'reserved')
+        }
+        held = {
+            (order_id, product_id, location_id): quantity
+            for order_id, product_id, location_id, quantity in StockReservation.objects.filter(
+                sales_order__in=list(orders)
+            ).values_list('sales_order_id', 'product_id', 'location_id', 'quantity')
+        }
+        changes = []
+        done = []
+        for pk in chunk:
+            order = orders.get(pk)
+            if order is None:
+                results[pk] = ['Sales order not found.']
+                continue
+            if order.status in {SalesOrder.Status.CANCELLED, SalesOrder.Status.COMPLETED}:
+                results[pk] = ['Cannot complete a cancelled or already completed sales order.']
+                continue
+            if not order.ship_from_id:
+                results[pk] = ['ship_from must be set to complete order.']
+                continue
+            requested = defaultdict(int)
+            skus = {}
+            for item in order.items.all():
+                requested[item.product_id] += item.quantity
+                skus[item.product_id] = item.product.sku
+            location_id = order.ship_from_id
+            short = [
+                pid for pid, qty in requested.items()
+                if qty > on_hand.get((pid, location_id), 0) + held.get((pk, pid, location_id), 0)
+            ]
+            if short:
+                results[pk] = [f'Insufficient stock for {skus[pid]} at {order.ship_from.code}.' for pid in short]
+                continue
+            for pid, qty in requested.items():
+                on_hand[(pid, location_id)] = on_hand.get((pid, location_id), 0) + held.get((pk, pid, location_id), 0) - qty
+                changes.append((pid, location_id, -qty, {'sales_order': order}))
+            done.append(order)
+        release_reservations(done)
+        updated = adjust_stock_many(changes, guarded=True, kind=StockMovement.Kind.SALE)
+        if any((pid, location_id) not in updated for pid, location_id, *_ in changes):
+            raise _StockConflict
+        now = timezone.now()
+        claimed = SalesOrder.objects.filter(pk__in=[order.pk for order in done]).exclude(
+            status__in=[SalesOrder.Status.CANCELLED, SalesOrder.Status.COMPLETED]
+        ).update(status=SalesOrder.Status.COMPLETED, completed_at=now, updated_at=now)
+        if claimed != len(done):
+            raise _StockConflict
+        for order in done:
+            order.status, order.completed_at = SalesOrder.Status.COMPLETED, now
+        record_daily_sales_many((order, order.items.all()) for order in done)
+        for order in done:
+            results[order.pk] = []
+    return results
+
+
+def sales_day(order: SalesOrder):
+    """Day a completed order counts towards in the sales report."""
+    return timezone.localtime(order.completed_at or order.created_at).date()
+
+
+def day_start(day):
+    """Aware datetime of local midnight opening `day`, for index-friendly range filters."""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def record_daily_sales(order: SalesOrder, items) -> None:
+    record_daily_sales_many([(order, items)])
+
+
+def record_daily_sales_many(orders_with_items) -> None:
+    """Add completed order lines (with `product` loaded) to the daily rollup.
+
+    Lines are merged per (day, product); missing rollup rows are created in
+    one bulk insert and the increments applied with batched CASE UPDATEs.
+    """
+    totals = {}
+    for order, items in orders_with_items:
+        day = sales_day(order)
+        for item in items:
+            key = (day, item.product_id)
+            if key not in totals:
+                totals[key] = [item.product.supplier_id, 0, Decimal('0'), Decimal('0')]
+            row = totals[key]
+            row[1] += item.quantity
+            row[2] += item.quantity * item.unit_price
+            row[3] += item.quantity * item.product.unit_cost
+    if not totals:
+        return
+    report_cache.invalidate_days({day for day, _ in totals})
+    pending = list(totals.items())
+    DailySalesRollup.objects.bulk_create(
+        [DailySalesRollup(day=day, product_id=product_id, supplier_id=row[0]) for (day, product_id), row in pending],
+        ignore_conflicts=True,
+        batch_size=STOCK_BATCH_SIZE * 5,
+    )
+    for start in range(0, len(pending), STOCK_BATCH_SIZE):
+        batch = pending[start:start + STOCK_BATCH_SIZE]
+        match = models.Q(pk__in=[])
+        whens = {'quantity': [], 'revenue': [], 'cost': []}
+        for (day, product_id), (_, quantity, revenue, cost) in batch:
+            key = models.Q(day=day, product_id=product_id)
+            match |= key
+            whens['quantity'].append(models.When(key, then=models.F('quantity') + quantity))
+            whens['revenue'].append(models.When(key, then=models.F('revenue') + revenue))
+            whens['cost'].append(models.When(key, then=models.F('cost') + cost))
+        DailySalesRollup.objects.filter(match).update(**{
+            field: models.Case(*cases, default=models.F(field), output_field=DailySalesRollup._meta.get_field(field))
+            for field, cases in whens.items()
+        })
+
+
+def refresh_daily_sales(products) -> None:
+    """Re-derive rollup supplier and cost after products changed (ids or a queryset)."""
+    product = Product.objects.filter(pk=models.OuterRef('product_id'))
+    rollup = DailySalesRollup.objects.filter(product__in=products)
+    report_cache.invalidate_days(rollup.dates('day', 'month'))
+    rollup.update(
+        supplier_id=models.Subquery(product.values('supplier_id')[:1]),
+        cost=models.ExpressionWrapper(
+            models.F('quantity') * models.Subquery(product.values('unit_cost')[:1]),
+            output_field=models.DecimalField(max_digits=18, decimal_places=2),
+        ),
+    )
+
+
+def daily_sales_keys(orders) -> set:
+    """(day, product_id) rollup rows the completed orders among `orders` (ids) count towards."""
+    lines = SalesOrderItem.objects.filter(
+        sales_order__in=orders, sales_order__status=SalesOrder.Status.COMPLETED,
+        sales_order__completed_at__isnull=False,
+    ).values_list('sales_order__completed_at', 'product_id').distinct()
+    return {(timezone.localtime(completed_at).date(), product_id) for completed_at, product_id in lines}
+
+
+def resync_daily_sales(keys) -> None:
+    """Recompute the rollup rows {(day, product_id), ...} from the completed orders.
+
+    For the changes record_daily_sales_many() cannot apply as increments:
+    lines of a completed order edited, an order leaving the completed status
+    or deleted. See keep_daily_sales().
+    """
+    products = defaultdict(set)
+    for day, product_id in keys:
+        products[day].add(product_id)
+    if not products:
+        return
+    with transaction.atomic():
+        report_cache.invalidate_days(products)
+        for day, product_ids in products.items():
+            DailySalesRollup.objects.filter(day=day, product__in=product_ids).delete()
+            DailySalesRollup.objects.bulk_create(
+                _daily_totals(_completed_lines(day, day).filter(product__in=product_ids)),
+                batch_size=STOCK_BATCH_SIZE * 5,
+            )
+
+
+@contextmanager
+def keep_daily_sales(orders):
+    """Resync the rollup for what `orders` (instances) counted towards before the block and after it.
+
+    Wrap edits of existing sales orders (status, lines) that bypass complete().
+    """
+    order_ids = [order.pk for order in orders if order.pk]
+    with transaction.atomic():
+        keys = daily_sales_keys(order_ids)
+        yield
+        resync_daily_sales(keys | daily_sales_keys(order_ids))
+
+
+def _completed_lines(start=None, end=None):
+    """Lines of completed orders, optionally those completed within a day range."""
+    items = SalesOrderItem.objects.filter(sales_order__status=SalesOrder.Status.COMPLETED)
+    if start:
+        items = items.filter(sales_order__completed_at__gte=day_start(start))
+    if end:
+        items = items.filter(sales_order__completed_at__lt=day_start(end + timedelta(days=1)))
+    return items
+
+
+def _daily_totals(items, chunk_size: int = 2000):
+    """Unsaved rollup rows summing `items` per completion day and product."""
+    money = models.DecimalField(max_digits=18, decimal_places=2)
+    rows = items.values('sales_order__completed_at__date', 'product_id', 'product__supplier_id').annotate(
+        total_quantity=models.Sum('quantity'),
+        total_revenue=models.Sum(models.ExpressionWrapper(models.F('quantity') * models.F('unit_price'), output_field=money)),
+        total_cost=models.Sum(models.ExpressionWrapper(models.F('quantity') * models.F('product__unit_cost'), output_field=money)),
+    ).order_by()
+    for row in rows.iterator(chunk_size=chunk_size):
+        yield DailySalesRollup(
+            day=row['sales_order__completed_at__date'], product_id=row['product_id'],
+            supplier_id=row['product__supplier_id'], quantity=row['total_quantity'],
+            revenue=row['total_revenue'], cost=row['total_cost'],
+        )
+
+
+def rebuild_daily_sales(start=None, end=None, batch_size: int = 2000) -> int:
+    """Recompute the rollup from completed orders, optionally for a day range. Returns rows written."""
+    rollup = DailySalesRollup.objects.all()
+    if start:
+        rollup = rollup.filter(day__gte=start)
+    if end:
+        rollup = rollup.filter(day__lte=end)
+    written = 0
+    with transaction.atomic():
+        if start and end:
+            report_cache.invalidate_days(rollup.dates('day', 'month'))
+        else:
+            report_cache.invalidate_all()
+        rollup.delete()
+        batch = []
+        for row in _daily_totals(_completed_lines(start, end), batch_size):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                written += len(DailySalesRollup.objects.bulk_create(batch))
+                batch = []
+        written += len(DailySalesRollup.objects.bulk_create(batch))
+    return written
@@ -0,0 +1,182 @@
+import json
+from base64 import b64decode, b64encode
+
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+    """Keyset (seek) pagination over a composite, unique ordering.
+
+    Unlike DRF's CursorPagination, which only seeks on the first ordering field
+    and skips ties with an OFFSET, the cursor stores the values of every
+    ordering field and pages with a row-value comparison. No COUNT is issued.
+    The last ordering field must be unique; `pk` is appended when it is not.
+    Nullable fields sort NULLs above every value (last ascending, first
+    descending) on every database, and the seek follows the same rule.
+    """
+    ordering = ('id',)
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        fields = [self.model_field(queryset.model, field.lstrip('-')) for field in self.ordering]
+        self.nullable = {name.lstrip('-') for name, field in zip(self.ordering, fields) if field.null}
+        reverse, position = self.decode_cursor(request, fields)
+
+        ordering = [self.flip(field) if reverse else field for field in self.ordering]
+        queryset = queryset.order_by(*[self.order_by(field) for field in ordering])
+        if position is not None:
+            queryset = queryset.filter(self.seek(ordering, position))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        if self.has_next or self.has_previous:
+            self.display_page_controls = True
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(super().get_ordering(request, queryset, view))
+        if ordering[-1].lstrip('-') not in {'pk', 'id'}:
+            ordering.append('-pk' if ordering[-1].startswith('-') else 'pk')
+        return tuple(ordering)
+
+    @staticmethod
+    def model_field(model, name):
+        return model._meta.pk if name == 'pk' else model._meta.get_field(name)
+
+    @staticmethod
+    def flip(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def order_by(self, field):
+        name = field.lstrip('-')
+        if name not in self.nullable:
+            return field
+        return F(name).desc(nulls_first=True) if field.startswith('-') else F(name).asc(nulls_last=True)
+
+    @staticmethod
+    def equal(name, value):
+        return Q(**{f'{name}__isnull': True}) if value is None else Q(**{name: value})
+
+    def after(self, field, value):
+        """Rows past `value` on one field, NULL being above every value."""
+        name = field.lstrip('-')
+        if field.startswith('-'):
+            return Q(**{f'{name}__isnull': False}) if value is None else Q(**{f'{name}__lt': value})
+        if value is None:
+            return Q(pk__in=[])
+        condition = Q(**{f'{name}__gt': value})
+        return condition | Q(**{f'{name}__isnull': True}) if name in self.nullable else condition
+
+    def seek(self, ordering, position):
+        """Build `(a, b, c) > (x, y, z)` honouring each field's direction and NULLs."""
+        condition = Q(pk__in=[])
+        for index, field in enumerate(ordering):
+            prefix = [self.equal(f.lstrip('-'), value) for f, value in zip(ordering[:index], position)]
+            condition |= Q(*prefix) & self.after(field, position[index])
+        return condition
+
+    def position_of(self, obj):
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def decode_cursor(self, request, fields):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return False, None
+        try:
+            data = json.loads(b64decode(encoded.encode('ascii')).decode('ascii'))
+            position = [field.to_python(value) for field, value in zip(fields, data['p'], strict=True)]
+            return bool(data['r']), position
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, reverse, position):
+        data = json.dumps({'r': int(reverse), 'p': position}, default=str, separators=(',', ':'))
+        return replace_query_param(self.base_url, self.cursor_query_param, b64encode(data.encode('ascii')).decode('ascii'))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(False, self.position_of(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(True, self.position_of(self.page[0]))
+
+
+class OrderKeysetPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class PageNumberOrKeysetPagination(PageNumberPagination):
+    """Page numbers by default; `?pagination=cursor` (or any `cursor`) switches to keyset.
+
+    Subclasses pick the keyset flavour through `keyset_class`. Endpoints that
+    should always page by keyset can use a KeysetPagination subclass directly.
+    """
+    keyset_class = KeysetPagination
+    mode_query_param = 'pagination'
+    keyset = None
+
+    def use_keyset(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.keyset_class.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.keyset is not None:
+            return self.keyset.to_html()
+        return super().to_html()
+
+    def get_paginated_response_schema(self, schema):
+        response = super().get_paginated_response_schema(schema)
+        # count is omitted in keyset mode
+        response['required'] = ['results']
+        return response
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                'name': self.mode_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Set to "cursor" for keyset pagination (no count, stable deep paging).',
+                'schema': {'type': 'string', 'enum': ['page', 'cursor']},
+            },
+        ] + self.keyset_class().get_schema_operation_parameters(view)
+
+
+class OrderPagination(PageNumberOrKeysetPagination):
+    keyset_class = OrderKeysetPagination
@@ -0,0 +1,206 @@
+"""On-demand profiling of a single request, for staff users.
+
+Add `?_profile=1` (or an `X-Profile: 1` header) to any URL: the request runs
+under cProfile and every SQL query is recorded with its duration and the
+project line that issued it. The artefact, a zip with `profile.pstats`
+(open with `python -m pstats` or snakeviz), `stats.txt` and `queries.json`,
+is saved under PROFILE_DIR and named in the `X-Profile-Id` response header;
+download it from /profiles/<id>/. `?_profile=download` returns the zip
+instead of the page.
+
+Without the switch the middleware does two dict lookups, and the query
+wrapper a context variable read.
+"""
+import cProfile
+import io
+import json
+import marshal
+import pstats
+import re
+import threading
+import time
+import traceback
+import uuid
+import zipfile
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils import timezone
+
+from . import metrics
+
+PARAM = '_profile'
+HEADER = 'HTTP_X_PROFILE'
+PROFILE_ID = re.compile(r'^\d{8}-\d{6}-[0-9a-f]{8}$')
+STATS_LINES = 80
+SQL_PARAMS_LIMIT = 200
+
+# Queries of the request being profiled, if any
+_captured = ContextVar('profiled_queries', default=None)
+# cProfile allows one active profiler at a time
+_profiler_lock = threading.Lock()
+# Query wrappers, never the origin of a query
+_WRAPPERS = {__file__, metrics.__file__}
+
+
+def profile_dir() -> Path:
+    return Path(getattr(settings, 'PROFILE_DIR', settings.BASE_DIR / 'profiles'))
+
+
+def _origin():
+    # Innermost frame in project code, skipping the query wrappers and installed packages
+    root = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename.startswith(root) and 'site-packages' not in frame.filename and frame.filename not in _WRAPPERS:
+            return f'{Path(frame.filename).relative_to(root)}:{frame.lineno} in {frame.name}'
+    return None
+
+
+def _capture_query(execute, sql, params, many, context):
+    queries = _captured.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        queries.append({
+            'sql': sql,
+            'params': repr(params)[:SQL_PARAMS_LIMIT],
+            'many': many,
+            'ms': round((time.perf_counter() - started) * 1000, 3),
+            'alias': context['connection'].alias,
+            'origin': _origin(),
+        })
+
+
+def instrument(connection) -> None:
+    """Record the queries of `connection` for profiled requests (connection_created receiver)."""
+    if _capture_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_capture_query)
+
+
+def requested(request):
+    return request.GET.get(PARAM) or request.META.get(HEADER)
+
+
+def build_artefact(request, user, response, profiler, queries, elapsed) -> bytes:
+    profiler.create_stats()
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(STATS_LINES)
+    match = getattr(request, 'resolver_match', None)
+    summary = {
+        'method': request.method,
+        'path': request.get_full_path(),
+        'view': match.view_name if match else None,
+        'user': user.get_username(),
+        'status': response.status_code,
+        'started_at': timezone.now().isoformat(),
+        'elapsed_ms': round(elapsed * 1000, 3),
+        'query_count': len(queries),
+        'db_ms': round(sum(query['ms'] for query in queries), 3),
+        'queries': queries,
+    }
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('profile.pstats', marshal.dumps(profiler.stats))
+        archive.writestr('stats.txt', text.getvalue())
+        archive.writestr('queries.json', json.dumps(summary, indent=2, default=str))
+    return buffer.getvalue()
+
+
+class ProfilingMiddleware:
+    """Profiles requests carrying the switch, for staff users only. Place after AuthenticationMiddleware.
+
+    Streamed bodies are produced after the profiler stops, so only their setup is profiled.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        mode = requested(request)
+        if not mode or not request.user.is_staff:
+            return self.get_response(request)
+        if not _profiler_lock.acquire(blocking=False):
+            return self.busy(self.get_response(request))
+        try:
+            queries = []
+            token = _captured.set(queries)
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+                _captured.reset(token)
+            elapsed = time.perf_counter() - started
+        finally:
+            _profiler_lock.release()
+        return self.finish(request, request.user, response, mode, profiler, queries, elapsed)
+
+    async def __acall__(self, request):
+        mode = requested(request)
+        if not mode:
+            return await self.get_response(request)
+        user = await request.auser()
+        if not user.is_staff:
+            return await self.get_response(request)
+        if not _profiler_lock.acquire(blocking=False):
+            return self.busy(await self.get_response(request))
+        # Profiles the event loop thread: ORM calls run through sync_to_async
+        # show up as waits, but their queries are still captured
+        try:
+            queries = []
+            token = _captured.set(queries)
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                response = await self.get_response(request)
+            finally:
+                profiler.disable()
+                _captured.reset(token)
+            elapsed = time.perf_counter() - started
+        finally:
+            _profiler_lock.release()
+        return self.finish(request, user, response, mode, profiler, queries, elapsed)
+
+    @staticmethod
+    def busy(response):
+        response['X-Profile'] = 'busy'
+        return response
+
+    @staticmethod
+    def finish(request, user, response, mode, profiler, queries, elapsed):
+        artefact = build_artefact(request, user, response, profiler, queries, elapsed)
+        profile_id = f'{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}'
+        directory = profile_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f'{profile_id}.zip').write_bytes(artefact)
+        if mode == 'download':
+            response = HttpResponse(artefact, content_type='application/zip')
+            response['Content-Disposition'] = f'attachment; filename="profile-{profile_id}.zip"'
+        response['X-Profile-Id'] = profile_id
+        response['X-Profile-Queries'] = str(len(queries))
+        return response
+
+
+@staff_member_required
+def download_profile(request, profile_id):
+    path = profile_dir() / f'{profile_id}.zip'
+    if not PROFILE_ID.match(profile_id) or not path.exists():
+        raise Http404('No such profile.')
+    return FileResponse(path.open('rb'), as_attachment=True, filename=f'profile-{profile_id}.zip')
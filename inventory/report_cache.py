@@ -0,0 +1,92 @@
+"""Response cache for the sales report with date-range scoped invalidation.
+
+Every cached entry is keyed on the normalised report parameters plus a set of
+generation tokens: one per calendar month the date filter covers, or a single
+"open" token when either bound is missing, and a global "epoch" token.
+Invalidating a day replaces the token of its month and the "open" token, so
+only reports whose range includes that month miss afterwards; entries under
+old tokens simply expire.
+"""
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+KEY_PREFIX = 'sales-report'
+EPOCH = 'epoch'
+OPEN = 'open'
+
+
+def get_cache():
+    return caches[getattr(settings, 'SALES_REPORT_CACHE', 'default')]
+
+
+def _generation_key(name):
+    return f'{KEY_PREFIX}:gen:{name}'
+
+
+def _months(start, end):
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        yield f'{year:04d}-{month:02d}'
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _generation_names(params):
+    start, end = params.get('start_date'), params.get('end_date')
+    buckets = [OPEN] if start is None or end is None else list(_months(start, end))
+    return [EPOCH, *buckets]
+
+
+def _digest(params, names, tokens):
+    generations = [tokens.get(_generation_key(name), '0') for name in names]
+    raw = json.dumps([params, generations], default=str, sort_keys=True)
+    return f'{KEY_PREFIX}:{hashlib.sha1(raw.encode()).hexdigest()}'
+
+
+def cache_key(params: dict) -> str:
+    """Key for normalised params; `start_date`/`end_date` must be dates or None."""
+    names = _generation_names(params)
+    return _digest(params, names, get_cache().get_many([_generation_key(name) for name in names]))
+
+
+def lookup(key):
+    return get_cache().get(key)
+
+
+def store(key, value):
+    get_cache().set(key, value)
+
+
+# Async variants for the ASGI views; backends without native async run these in a thread
+
+async def acache_key(params: dict) -> str:
+    names = _generation_names(params)
+    return _digest(params, names, await get_cache().aget_many([_generation_key(name) for name in names]))
+
+
+async def alookup(key):
+    return await get_cache().aget(key)
+
+
+async def astore(key, value):
+    await get_cache().aset(key, value)
+
+
+def _bump(names):
+    token = uuid.uuid4().hex
+    get_cache().set_many({_generation_key(name): token for name in names}, timeout=None)
+
+
+def invalidate_days(days) -> None:
+    """Drop cached reports covering any of `days`, once the current transaction commits."""
+    names = {f'{day.year:04d}-{day.month:02d}' for day in days}
+    if names:
+        transaction.on_commit(lambda: _bump([OPEN, *names]))
+
+
+def invalidate_all() -> None:
+    transaction.on_commit(lambda: _bump([EPOCH]))
@@ -0,0 +1,254 @@
+"""SQLite FTS5 full-text search for products, suppliers and orders.
+
+Each indexed model gets an FTS5 table kept in sync by triggers, so every write
+path (ORM saves, bulk_create, queryset updates, imports) is covered. Results
+are ranked with bm25(). Other databases, or SQLite builds without FTS5, fall
+back to the usual icontains lookups.
+
+Words only match at their start, so codes such as SKUs are also matched as
+substrings (`123` finds `SKU-00123`), and search fields an index lacks (an
+item's location code) keep their icontains lookup. Those lookups scan the
+table, so they only run for code-like text (with a digit) or when the index
+finds nothing, and their rows rank after the full-text matches.
+"""
+import operator
+import re
+from dataclasses import dataclass, field
+from functools import reduce
+
+from django.db import connections
+from django.db.models import Case, Q, Value, When
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+from rest_framework.settings import api_settings
+
+TOKENIZE = 'unicode61 remove_diacritics 2'
+TOKEN_RE = re.compile(r'\w+')
+# Search text worth matching as a substring too (SKUs, location codes)
+CODE_RE = re.compile(r'\d')
+
+
+@dataclass(frozen=True)
+class FtsIndex:
+    table: str
+    source: str
+    # FTS column -> SQL expression over a source row ({row} is `new` or the table name)
+    columns: dict
+    # Source columns whose change re-indexes the row
+    watch: tuple
+    # bm25() weight per column; higher means a match there ranks better
+    weights: tuple
+    # ORM lookups (search_fields entries) the index answers
+    lookups: tuple
+    # Fields also matched with icontains: codes users type without their prefix or zeros
+    substrings: tuple = field(default=())
+    # (table, column, fk): re-index source rows when table.column changes for source.fk = table.id
+    dependencies: tuple = field(default=())
+
+    def values(self, row):
+        return ', '.join(expr.format(row=row) for expr in self.columns.values())
+
+    def rank_sql(self):
+        return f"bm25({self.table}, {', '.join(str(weight) for weight in self.weights)})"
+
+    def create_sql(self):
+        t, src, cols = self.table, self.source, ', '.join(self.columns)
+        insert = f'INSERT INTO {t}(rowid, {cols}) VALUES (new.id, {self.values("new")});'
+        yield f"CREATE VIRTUAL TABLE IF NOT EXISTS {t} USING fts5({cols}, tokenize='{TOKENIZE}', prefix='2 3')"
+        yield f'CREATE TRIGGER IF NOT EXISTS {t}_ai AFTER INSERT ON {src} BEGIN {insert} END'
+        yield (
+            f"CREATE TRIGGER IF NOT EXISTS {t}_au AFTER UPDATE OF {', '.join(self.watch)} ON {src} "
+            f'BEGIN DELETE FROM {t} WHERE rowid = old.id; {insert} END'
+        )
+        yield f'CREATE TRIGGER IF NOT EXISTS {t}_ad AFTER DELETE ON {src} BEGIN DELETE FROM {t} WHERE rowid = old.id; END'
+        for table, column, fk in self.dependencies:
+            yield (
+                f'CREATE TRIGGER IF NOT EXISTS {t}_{table}_au AFTER UPDATE OF {column} ON {table} BEGIN '
+                f'DELETE FROM {t} WHERE rowid IN (SELECT id FROM {src} WHERE {fk} = new.id); '
+                f'INSERT INTO {t}(rowid, {cols}) SELECT id, {self.values(src)} FROM {src} WHERE {fk} = new.id; END'
+            )
+
+    def drop_sql(self):
+        for table, _, _ in self.dependencies:
+            yield f'DROP TRIGGER IF EXISTS {self.table}_{table}_au'
+        for suffix in ('ai', 'au', 'ad'):
+            yield f'DROP TRIGGER IF EXISTS {self.table}_{suffix}'
+        yield f'DROP TABLE IF EXISTS {self.table}'
+
+    def rebuild_sql(self):
+        cols = ', '.join(self.columns)
+        yield f'DELETE FROM {self.table}'
+        yield f'INSERT INTO {self.table}(rowid, {cols}) SELECT id, {self.values(self.source)} FROM {self.source}'
+        yield f"INSERT INTO {self.table}({self.table}) VALUES ('optimize')"
+
+
+INDEXES = {
+    'inventory.Product': FtsIndex(
+        table='inventory_product_fts', source='inventory_product',
+        columns={'sku': '{row}.sku', 'name': '{row}.name', 'description': '{row}.description'},
+        watch=('sku', 'name', 'description'), weights=(10.0, 5.0, 1.0),
+        lookups=('sku', 'name', 'description'), substrings=('sku',),
+    ),
+    'inventory.Supplier': FtsIndex(
+        table='inventory_supplier_fts', source='inventory_supplier',
+        columns={'name': '{row}.name', 'email': '{row}.email'},
+        watch=('name', 'email'), weights=(5.0, 2.0), lookups=('name', 'email'),
+    ),
+    'inventory.SalesOrder': FtsIndex(
+        table='inventory_salesorder_fts', source='inventory_salesorder',
+        columns={'reference': '{row}.reference', 'customer_name': '{row}.customer_name'},
+        watch=('reference', 'customer_name'), weights=(5.0, 3.0), lookups=('reference', 'customer_name'),
+    ),
+    'inventory.PurchaseOrder': FtsIndex(
+        table='inventory_purchaseorder_fts', source='inventory_purchaseorder',
+        columns={
+            'reference': '{row}.reference',
+            'supplier': '(SELECT name FROM inventory_supplier WHERE id = {row}.supplier_id)',
+        },
+        watch=('reference', 'supplier_id'), weights=(5.0, 2.0), lookups=('reference', 'supplier__name'),
+        dependencies=(('inventory_supplier', 'name', 'supplier_id'),),
+    ),
+}
+# Models searched through the index of a related model: label -> (foreign key, indexed label)
+RELATED = {
+    'inventory.InventoryItem': ('product', 'inventory.Product'),
+}
+
+_available = {}
+
+
+def fts5_supported(connection) -> bool:
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def enabled(using) -> bool:
+    """True when the search tables exist on this database (checked once per database)."""
+    connection = connections[using]
+    key = (using, str(connection.settings_dict['NAME']))
+    if key not in _available:
+        _available[key] = connection.vendor == 'sqlite' and bool(
+            {index.table for index in INDEXES.values()} & set(connection.introspection.table_names())
+        )
+    return _available[key]
+
+
+def install(connection) -> None:
+    with connection.cursor() as cursor:
+        for index in INDEXES.values():
+            for statement in (*index.create_sql(), *index.rebuild_sql()):
+                cursor.execute(statement)
+    _available.clear()
+
+
+def uninstall(connection) -> None:
+    with connection.cursor() as cursor:
+        for index in INDEXES.values():
+            for statement in index.drop_sql():
+                cursor.execute(statement)
+    _available.clear()
+
+
+def rebuild(connection, labels=None) -> None:
+    with connection.cursor() as cursor:
+        for label, index in INDEXES.items():
+            if labels is None or label in labels:
+                for statement in index.rebuild_sql():
+                    cursor.execute(statement)
+
+
+def match_query(text: str) -> str:
+    """Every word of `text` as a quoted prefix term, so input never reaches FTS5 syntax."""
+    return ' '.join(f'"{token}"*' for token in TOKEN_RE.findall(text))
+
+
+def index_for(model):
+    """(FtsIndex, relation) answering searches over `model`; relation is '' for the model's own index."""
+    label, relation = model._meta.label, ''
+    if label in RELATED:
+        relation, label = RELATED[label]
+    index = INDEXES.get(label)
+    return None if index is None else (index, relation)
+
+
+def ranked(queryset, text, keep_ordering=False, also=None):
+    """Filter `queryset` to FTS matches for `text`, best first; None if the model has no usable index.
+
+    The FTS table is joined on rowid, so the index drives the query. Rows
+    matching `also` or the index's substring fields (lookups that scan the
+    table) are only looked for when `text` looks like a code, i.e. has a
+    digit, or nothing matched; they rank after every FTS match.
+    """
+    found = index_for(queryset.model)
+    if found is None or not enabled(queryset.db):
+        return None
+    index, relation = found
+    query = match_query(text)
+    if not query:
+        return queryset
+    prefix, column = (f'{relation}__', f'{relation}_id') if relation else ('', 'id')
+    table = index.table
+    results = queryset.extra(
+        tables=[table],
+        where=[f'{table}.rowid = {queryset.model._meta.db_table}.{column}', f'{table} MATCH %s'],
+        params=[query],
+        select={'search_rank': index.rank_sql()},
+    )
+    also = also or Q()
+    for name in index.substrings:
+        also |= Q(**{f'{prefix}{name}__icontains': text.strip()})
+    if also and (CODE_RE.search(text) or not results.exists()):
+        # bm25() needs the join, which would drop the other rows: FTS matches rank 0, the tail 1
+        matches = Q(**{f'{column}__in': RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [query])})
+        results = queryset.filter(matches | also).annotate(
+            search_rank=Case(When(matches, then=Value(0)), default=Value(1)),
+        )
+    if keep_ordering:
+        return results
+    # bm25() is lower for better matches; the previous ordering breaks ties
+    return results.order_by('search_rank', *queryset.query.order_by)
+
+
+class FullTextSearchFilter(SearchFilter):
+    """DRF SearchFilter answered from the FTS5 indexes, ranked by relevance.
+
+    Views over models without an index (or databases without FTS5) keep the
+    icontains search over `search_fields`, as do the fields an index lacks.
+    An explicit `?ordering=` wins over relevance. Web views call `search()`
+    with their own fallback lookups.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '')
+        if not text.strip():
+            return queryset
+        keep_ordering = api_settings.ORDERING_PARAM in request.query_params
+        results = ranked(queryset, text, keep_ordering, also=self.unindexed(request, queryset, view))
+        if results is None:
+            return super().filter_queryset(request, queryset, view)
+        return results
+
+    def unindexed(self, request, queryset, view):
+        """The usual search over the `search_fields` the index does not cover, as a Q (None if all are)."""
+        found = index_for(queryset.model)
+        if found is None:
+            return None
+        index, relation = found
+        covered = {f'{relation}__{name}' if relation else name for name in index.lookups}
+        fields = [name for name in self.get_search_fields(view, request) or () if name.lstrip('^=@$') not in covered]
+        terms = self.get_search_terms(request)
+        if not fields or not terms:
+            return None
+        lookups = [self.construct_search(str(name), queryset) for name in fields]
+        return reduce(operator.and_, (
+            reduce(operator.or_, (Q(**{lookup: term}) for lookup in lookups)) for term in terms
+        ))
+
+    @staticmethod
+    def search(queryset, text, fallback, also=None):
+        """Ranked FTS results (plus rows matching `also`), or `queryset.filter(fallback)` where no index applies."""
+        results = ranked(queryset, text, also=also)
+        return queryset.filter(fallback) if results is None else results
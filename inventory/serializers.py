@@ -1,52 +1,144 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
 from rest_framework import serializers
 from .models import (
     Supplier, Product, Location, InventoryItem,
     PurchaseOrder, PurchaseOrderItem,
-    SalesOrder, SalesOrderItem,
+    SalesOrder, SalesOrderItem, StockMovement,
+    keep_daily_sales, sync_reservations,
 )
 
 
-class SupplierSerializer(serializers.ModelSerializer):
+def _nested(names, prefix):
+    return {name[len(prefix) + 1:] for name in names if name.startswith(f'{prefix}.')}
+
+
+class SparseFieldsMixin:
+    """Sparse fieldsets (`fields=`) and opt-in nested detail (`expand=`).
+
+    Fields listed in `Meta.expandable_fields` are left out unless expanded.
+    Dotted names such as `items.quantity` or `items.product_detail` are passed
+    down to nested serializers that use the mixin too.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.only_fields = set(fields) if fields else None
+        self.expand_fields = set(expand or ())
+
+    def get_fields(self):
+        fields = super().get_fields()
+        for name in getattr(self.Meta, 'expandable_fields', ()):
+            if name not in self.expand_fields:
+                fields.pop(name, None)
+        if self.only_fields is not None:
+            wanted = {name.split('.', 1)[0] for name in self.only_fields | self.expand_fields}
+            for name in set(fields) - wanted:
+                fields.pop(name)
+        for name, field in fields.items():
+            nested = getattr(field, 'child', field)
+            if isinstance(nested, SparseFieldsMixin):
+                nested.only_fields = _nested(self.only_fields or (), name) or None
+                nested.expand_fields = _nested(self.expand_fields, name)
+        return fields
+
+
+class SupplierSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Supplier
         fields = '__all__'
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     supplier_name = serializers.ReadOnlyField(source='supplier.name')
 
     class Meta:
         model = Product
         fields = [
             'id', 'sku', 'name', 'description', 'unit_cost', 'unit_price',
-            'supplier', 'supplier_name', 'is_active', 'track_inventory'
+            'supplier', 'supplier_name', 'is_active', 'track_inventory', 'version', 'updated_at',
         ]
 
 
-class LocationSerializer(serializers.ModelSerializer):
+class LocationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Location
         fields = '__all__'
 
 
-class InventoryItemSerializer(serializers.ModelSerializer):
+class InventoryItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     product_detail = ProductSerializer(source='product', read_only=True)
     location_detail = LocationSerializer(source='location', read_only=True)
+    available = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = InventoryItem
-        fields = ['id', 'product', 'product_detail', 'location', 'location_detail', 'quantity', 'reorder_threshold']
-
-
-class PurchaseOrderItemSerializer(serializers.ModelSerializer):
+        fields = [
+            'id', 'product', 'product_detail', 'location', 'location_detail',
+            'quantity', 'reserved', 'available', 'reorder_threshold', 'version', 'updated_at',
+        ]
+        expandable_fields = ['product_detail', 'location_detail']
+
+
+ITEM_BATCH_SIZE = 500
+
+
+def _create_items(model, fk_name, instance, items_data):
+    # Ids only mean something when updating an existing order
+    items = [{attr: value for attr, value in item.items() if attr != 'id'} for item in items_data]
+    model.objects.bulk_create([model(**{fk_name: instance}, **item) for item in items], batch_size=ITEM_BATCH_SIZE)
+
+
+def _sync_items(model, fk_name, instance, items_data):
+    """Diff incoming item dicts against the instance's lines by id.
+
+    Lines with a known id are updated in place, lines without one are created
+    and lines missing from the payload are removed with a single DELETE.
+    """
+    existing = {item.pk: item for item in model.objects.filter(**{fk_name: instance})}
+    to_create, to_update, keep = [], [], set()
+    update_fields = set()
+    for data in items_data:
+        data = dict(data)
+        pk = data.pop('id', None)
+        if pk is None:
+            to_create.append(model(**{fk_name: instance}, **data))
+            continue
+        item = existing.get(pk)
+        if item is None or pk in keep:
+            raise serializers.ValidationError({'items': [f'Invalid or duplicate item id {pk}.']})
+        keep.add(pk)
+        changed = []
+        for attr, value in data.items():
+            field = model._meta.get_field(attr)
+            # Compare relations by primary key so unchanged lines don't load them
+            incoming = value.pk if field.is_relation and value is not None else value
+            if getattr(item, field.attname) != incoming:
+                changed.append(attr)
+        for attr in changed:
+            setattr(item, attr, data[attr])
+        if changed:
+            to_update.append(item)
+            update_fields.update(changed)
+    if len(keep) < len(existing):
+        model.objects.filter(**{fk_name: instance}).exclude(pk__in=keep).delete()
+    if to_update:
+        model.objects.bulk_update(to_update, sorted(update_fields), batch_size=ITEM_BATCH_SIZE)
+    if to_create:
+        model.objects.bulk_create(to_create, batch_size=ITEM_BATCH_SIZE)
+
+
+class PurchaseOrderItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
     product_detail = ProductSerializer(source='product', read_only=True)
 
     class Meta:
         model = PurchaseOrderItem
         fields = ['id', 'product', 'product_detail', 'quantity', 'unit_cost']
+        expandable_fields = ['product_detail']
 
 
-class PurchaseOrderSerializer(serializers.ModelSerializer):
+class PurchaseOrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     items = PurchaseOrderItemSerializer(many=True)
     supplier_name = serializers.ReadOnlyField(source='supplier.name')
 
@@ -58,57 +150,79 @@ class PurchaseOrderSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at']
 
+    @transaction.atomic
     def create(self, validated_data):
         items_data = validated_data.pop('items', [])
         po = PurchaseOrder.objects.create(**validated_data)
-        for item in items_data:
-            PurchaseOrderItem.objects.create(purchase_order=po, **item)
+        _create_items(PurchaseOrderItem, 'purchase_order', po, items_data)
         return po
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         items_data = validated_data.pop('items', None)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
         if items_data is not None:
-            instance.items.all().delete()
-            for item in items_data:
-                PurchaseOrderItem.objects.create(purchase_order=instance, **item)
+            _sync_items(PurchaseOrderItem, 'purchase_order', instance, items_data)
         return instance
 
 
-class SalesOrderItemSerializer(serializers.ModelSerializer):
+class SalesOrderItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
     product_detail = ProductSerializer(source='product', read_only=True)
 
     class Meta:
         model = SalesOrderItem
         fields = ['id', 'product', 'product_detail', 'quantity', 'unit_price']
+        expandable_fields = ['product_detail']
 
 
-class SalesOrderSerializer(serializers.ModelSerializer):
+class SalesOrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     items = SalesOrderItemSerializer(many=True)
 
     class Meta:
         model = SalesOrder
         fields = [
-            'id', 'reference', 'customer_name', 'status', 'created_at', 'updated_at', 'ship_from', 'items'
+            'id', 'reference', 'customer_name', 'status', 'created_at', 'updated_at', 'completed_at', 'ship_from', 'items'
         ]
-        read_only_fields = ['created_at', 'updated_at']
+        read_only_fields = ['created_at', 'updated_at', 'completed_at']
 
+    @transaction.atomic
     def create(self, validated_data):
         items_data = validated_data.pop('items', [])
         so = SalesOrder.objects.create(**validated_data)
-        for item in items_data:
-            SalesOrderItem.objects.create(sales_order=so, **item)
+        _create_items(SalesOrderItem, 'sales_order', so, items_data)
+        self.reserve(so)
         return so
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         items_data = validated_data.pop('items', None)
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-        if items_data is not None:
-            instance.items.all().delete()
-            for item in items_data:
-                SalesOrderItem.objects.create(sales_order=instance, **item)
-        return instance
\ No newline at end of file
+        # Edits of a completed order (lines, status) must reach the sales rollup too
+        with keep_daily_sales([instance]):
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save()
+            if items_data is not None:
+                _sync_items(SalesOrderItem, 'sales_order', instance, items_data)
+        self.reserve(instance)
+        return instance
+
+    @staticmethod
+    def reserve(order):
+        # Pending orders hold their lines; refusing rolls the whole write back
+        try:
+            sync_reservations([order])
+        except DjangoValidationError as e:
+            raise serializers.ValidationError({'status': e.messages})
+
+
+class StockMovementSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = StockMovement
+        fields = '__all__'
+
+
+class SalesOrderBulkCompleteSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
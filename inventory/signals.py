@@ -0,0 +1,74 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import counters, metrics, profiling
+from .autocomplete import product_index
+from .models import (
+    InventoryItem, Product, SalesOrder, StockMovement,
+    daily_sales_keys, record_movements, refresh_daily_sales, release_reservations, resync_daily_sales,
+)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, **kwargs):
+    # The sales rollup follows the product's current supplier and unit cost
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and not {'unit_cost', 'supplier'} & set(update_fields):
+        return
+    costing = (instance.unit_cost, instance.supplier_id)
+    if not created and getattr(instance, '_saved_costing', None) != costing:
+        # Also when loaded without either field: no baseline to compare against
+        refresh_daily_sales([instance.pk])
+    instance._saved_costing = costing
+
+
+@receiver(post_save, sender=Product, dispatch_uid='autocomplete-save')
+@receiver(post_delete, sender=Product, dispatch_uid='autocomplete-delete')
+def product_changed(sender, **kwargs):
+    product_index.invalidate()
+
+
+@receiver(post_save, sender=InventoryItem)
+def inventory_item_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Direct edits (forms, admin, API) bypass adjust_stock_many, so ledger them here
+    if raw or (update_fields is not None and 'quantity' not in update_fields):
+        return
+    previous = 0 if created else getattr(instance, '_saved_quantity', None)
+    if previous is None:
+        return  # loaded without its quantity: no baseline to diff against
+    record_movements([StockMovement(
+        product_id=instance.product_id, location_id=instance.location_id,
+        delta=instance.quantity - previous, quantity_after=instance.quantity,
+        kind=StockMovement.Kind.CORRECTION,
+    )])
+    instance._saved_quantity = instance.quantity
+
+
+@receiver(pre_delete, sender=SalesOrder)
+def sales_order_deleting(sender, instance, **kwargs):
+    # Reservation rows cascade; the InventoryItem.reserved totals have to follow
+    release_reservations([instance])
+    # Rollup rows the order counted towards, recomputed once its lines are gone
+    instance._daily_sales_keys = daily_sales_keys([instance.pk])
+
+
+@receiver(post_delete, sender=SalesOrder)
+def sales_order_deleted(sender, instance, **kwargs):
+    resync_daily_sales(instance.__dict__.pop('_daily_sales_keys', ()))
+
+
+def counted_rows_changed(sender, created=True, **kwargs):
+    if created:
+        counters.invalidate()
+
+
+for model in counters.counted_models().values():
+    post_save.connect(counted_rows_changed, sender=model, dispatch_uid=f'counters-save-{model.__name__}')
+    post_delete.connect(counted_rows_changed, sender=model, dispatch_uid=f'counters-delete-{model.__name__}')
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    metrics.instrument(connection)
+    profiling.instrument(connection)
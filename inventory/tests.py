@@ -1,3 +1,1477 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, close_old_connections, connection, transaction
+from django.db.models import Count, F, Sum
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from . import counters, report_cache, search
+from .models import (
+    Supplier, Product, Location, InventoryItem,
+    PurchaseOrder, PurchaseOrderItem,
+    SalesOrder, SalesOrderItem, DailySalesRollup, StockMovement, StockReservation,
+    adjust_stock, adjust_stock_many, available_to_promise, complete_sales_orders, day_start, low_stock_items, stock_at,
+    sync_reservations, take_stock_snapshots,
+)
+from .views import InventoryItemViewSet, ProductViewSet, SalesReportView
+
+
+class QueryBudgetTests(APITestCase):
+    """Pin the number of queries per API endpoint so N+1 regressions fail fast.
+
+    Every endpoint is exercised with several page sizes; the budget must hold
+    for all of them, i.e. the query count may not grow with the number of rows.
+    """
+
+    PAGE_SIZES = [1, 10, 25]
+    ITEMS_PER_ORDER = 3
+
+    # COUNT + page (+ one prefetch for nested order items)
+    LIST_BUDGETS = {
+        '/api/suppliers/': 2,
+        '/api/products/': 2,
+        '/api/locations/': 2,
+        '/api/inventory/': 2,
+        '/api/purchase-orders/': 3,
+        '/api/sales-orders/': 3,
+        '/api/inventory/?expand=product_detail,location_detail': 2,
+        '/api/purchase-orders/?expand=items.product_detail': 3,
+        '/api/sales-orders/?expand=items.product_detail': 3,
+        '/api/sales-orders/?fields=id,status': 2,
+    }
+    DETAIL_BUDGETS = {
+        '/api/suppliers/{}/': 1,
+        '/api/products/{}/': 1,
+        '/api/locations/{}/': 1,
+        '/api/inventory/{}/': 1,
+        '/api/purchase-orders/{}/': 2,
+        '/api/sales-orders/{}/': 2,
+        '/api/inventory/{}/?expand=product_detail,location_detail': 1,
+        '/api/purchase-orders/{}/?expand=items.product_detail': 2,
+        '/api/sales-orders/{}/?expand=items.product_detail': 2,
+    }
+
+    def populate(self, rows):
+        suppliers = Supplier.objects.bulk_create([Supplier(name=f'Supplier {i}') for i in range(rows)])
+        locations = Location.objects.bulk_create([Location(code=f'L{i}', name=f'Location {i}') for i in range(rows)])
+        products = Product.objects.bulk_create([
+            Product(sku=f'SKU-{i}', name=f'Product {i}', supplier=suppliers[i]) for i in range(rows)
+        ])
+        InventoryItem.objects.bulk_create([
+            InventoryItem(product=products[i], location=locations[i], quantity=10) for i in range(rows)
+        ])
+        pos = PurchaseOrder.objects.bulk_create([
+            PurchaseOrder(supplier=suppliers[i], receive_location=locations[i]) for i in range(rows)
+        ])
+        sos = SalesOrder.objects.bulk_create([SalesOrder(ship_from=locations[i]) for i in range(rows)])
+        PurchaseOrderItem.objects.bulk_create([
+            PurchaseOrderItem(purchase_order=po, product=products[(i + j) % rows], quantity=1, unit_cost=1)
+            for i, po in enumerate(pos) for j in range(self.ITEMS_PER_ORDER)
+        ])
+        SalesOrderItem.objects.bulk_create([
+            SalesOrderItem(sales_order=so, product=products[(i + j) % rows], quantity=1, unit_price=1)
+            for i, so in enumerate(sos) for j in range(self.ITEMS_PER_ORDER)
+        ])
+        return {
+            '/api/suppliers/{}/': suppliers[0].pk,
+            '/api/products/{}/': products[0].pk,
+            '/api/locations/{}/': locations[0].pk,
+            '/api/inventory/{}/': InventoryItem.objects.values_list('pk', flat=True).first(),
+            '/api/purchase-orders/{}/': pos[0].pk,
+            '/api/sales-orders/{}/': sos[0].pk,
+        }
+
+    def assertWithinBudget(self, url, budget, expected_rows=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        if expected_rows is not None:
+            self.assertEqual(len(response.data['results']), expected_rows, url)
+        self.assertLessEqual(
+            len(ctx), budget,
+            f'{url} ran {len(ctx)} queries (budget {budget}):\n'
+            + '\n'.join(q['sql'] for q in ctx.captured_queries),
+        )
+
+    def test_list_endpoints(self):
+        for rows in self.PAGE_SIZES:
+            with self.subTest(rows=rows):
+                self.populate(rows)
+                for url, budget in self.LIST_BUDGETS.items():
+                    self.assertWithinBudget(url, budget, expected_rows=rows)
+                self.clear_data()
+
+    def test_detail_endpoints(self):
+        for rows in self.PAGE_SIZES:
+            with self.subTest(rows=rows):
+                pks = self.populate(rows)
+                for url, budget in self.DETAIL_BUDGETS.items():
+                    self.assertWithinBudget(url.format(pks[url.split('?')[0]]), budget)
+                self.clear_data()
+
+    def clear_data(self):
+        SalesOrder.objects.all().delete()
+        PurchaseOrder.objects.all().delete()
+        InventoryItem.objects.all().delete()
+        Product.objects.all().delete()
+        Location.objects.all().delete()
+        Supplier.objects.all().delete()
+
+
+class NestedItemWriteTests(APITestCase):
+    """Order updates diff the incoming lines against the stored ones by id."""
+
+    def setUp(self):
+        supplier = Supplier.objects.create(name='Supplier')
+        self.products = [Product.objects.create(sku=f'SKU-{n}', name=f'Product {n}', supplier=supplier) for n in range(3)]
+        response = self.client.post('/api/purchase-orders/', {
+            'supplier': supplier.pk,
+            'items': [{'product': product.pk, 'quantity': 2, 'unit_cost': '1.00'} for product in self.products[:2]],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.url = f"/api/purchase-orders/{response.data['id']}/"
+        self.items = response.data['items']
+
+    def patch(self, items):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.url, {'items': items}, format='json')
+        line_writes = tuple(f'{verb} "inventory_purchaseorderitem"' for verb in ('INSERT INTO', 'UPDATE', 'DELETE FROM'))
+        return response, [query['sql'].split()[0] for query in queries if query['sql'].startswith(line_writes)]
+
+    def stored(self):
+        return list(PurchaseOrderItem.objects.order_by('id').values_list('id', 'product_id', 'quantity'))
+
+    def test_untouched_lines_are_not_written(self):
+        before = self.stored()
+        response, writes = self.patch(self.items)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(writes, [])
+        self.assertEqual(self.stored(), before)
+
+    def test_changed_line_updated_in_place_and_missing_line_deleted(self):
+        first, second = self.items
+        response, writes = self.patch([
+            {**first, 'quantity': 5},
+            {'product': self.products[2].pk, 'quantity': 1, 'unit_cost': '1.00'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(writes), ['DELETE', 'INSERT', 'UPDATE'])
+        stored = self.stored()
+        self.assertEqual(stored[0], (first['id'], self.products[0].pk, 5))
+        self.assertNotIn(second['id'], [pk for pk, _, _ in stored])
+        self.assertEqual([(product, quantity) for _, product, quantity in stored[1:]], [(self.products[2].pk, 1)])
+
+    def test_unknown_and_duplicate_ids(self):
+        before = self.stored()
+        first = self.items[0]
+        for items in ([{**first, 'id': 999}], [first, {**first, 'quantity': 9}]):
+            with self.subTest(items=items):
+                response, _ = self.patch(items)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('items', response.data)
+        self.assertEqual(self.stored(), before)
+
+    def test_ids_are_ignored_on_create(self):
+        taken = self.items[0]['id']
+        response = self.client.post('/api/purchase-orders/', {
+            'supplier': Supplier.objects.get().pk,
+            'items': [{'id': taken, 'product': self.products[2].pk, 'quantity': 1, 'unit_cost': '1.00'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotEqual(response.data['items'][0]['id'], taken)
+        self.assertEqual(PurchaseOrderItem.objects.get(pk=taken).product, self.products[0])
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        first = datetime(2024, 1, 10, 12, tzinfo=dt_timezone.utc)
+        second = first + timedelta(days=1)
+        # Ties on both values and on NULL, spread across pages of two
+        self.orders = SalesOrder.objects.bulk_create([
+            SalesOrder(reference=f'SO-{n}', created_at=first, completed_at=completed_at)
+            for n, completed_at in enumerate([None, first, first, None, second, first, None])
+        ])
+
+    def walk(self, url, link):
+        """Follow `link` from `url`; returns the ids of each page visited and the last URL."""
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            pages.append([row['id'] for row in response.data['results']])
+            last, url = url, response.data[link]
+        return pages, last
+
+    def assertPages(self, ordering, expected):
+        pages, last = self.walk(f'/api/sales-orders/?pagination=cursor&page_size=2&fields=id&ordering={ordering}', 'next')
+        self.assertEqual(sum(pages, []), expected)
+        backward, _ = self.walk(last, 'previous')
+        self.assertEqual(sum(reversed(backward), []), expected)
+
+    def test_nullable_ordering(self):
+        # NULLs sort above every value: last ascending, first descending
+        ascending = sorted(self.orders, key=lambda order: (order.completed_at is None, order.completed_at or 0, order.pk))
+        for ordering, orders in (
+            ('completed_at', ascending),
+            ('-completed_at', ascending[::-1]),
+            ('reference,-completed_at', sorted(self.orders, key=lambda order: order.reference)),
+        ):
+            with self.subTest(ordering=ordering):
+                self.assertPages(ordering, [order.pk for order in orders])
+
+    def test_ties_on_the_default_ordering(self):
+        self.assertPages('-created_at', [order.pk for order in reversed(self.orders)])
+
+
+class DailySalesRollupTests(APITestCase):
+    """The rollup answers like the raw aggregation whatever happens to completed orders."""
+
+    def setUp(self):
+        report_cache.get_cache().clear()
+        self.location = Location.objects.create(code='L1', name='Location 1')
+        self.products = [
+            Product.objects.create(sku=f'SKU-{n}', name=f'Product {n}', unit_cost=2, unit_price=5) for n in range(2)
+        ]
+        for product in self.products:
+            adjust_stock(product, self.location, 100)
+        self.orders = [self.complete_order(product) for product in (self.products[0], self.products[0], self.products[1])]
+
+    def complete_order(self, product):
+        order = SalesOrder.objects.create(ship_from=self.location)
+        SalesOrderItem.objects.create(sales_order=order, product=product, quantity=2, unit_price=5)
+        order.complete()
+        return order.pk
+
+    def assertRollupMatchesRaw(self, revenue):
+        for query in ('', '?group_by=product', '?group_by=supplier', '?group_by=day'):
+            with self.subTest(query=query):
+                rollup = self.client.get(f'/api/reports/sales/{query}')
+                raw = self.client.get(f"/api/reports/sales/{query}{'&' if query else '?'}source=raw")
+                self.assertEqual(rollup['X-Report-Source'], 'rollup')
+                self.assertEqual(rollup.data, raw.data)
+        self.assertEqual(self.client.get('/api/reports/sales/').data['revenue'], revenue)
+
+    def change(self, method, url, data=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 300, response.data)
+
+    def test_edits_and_deletions_of_completed_orders(self):
+        self.assertRollupMatchesRaw(30)
+        first, second, third = self.orders
+        line = SalesOrderItem.objects.get(sales_order=first)
+        self.change('patch', f'/api/sales-orders/{first}/', {'items': [
+            {'id': line.pk, 'product': self.products[0].pk, 'quantity': 6, 'unit_price': '5.00'},
+            {'product': self.products[1].pk, 'quantity': 1, 'unit_price': '5.00'},
+        ]})
+        self.assertRollupMatchesRaw(55)
+        self.change('patch', f'/api/sales-orders/{second}/', {'status': 'cancelled'})
+        self.assertRollupMatchesRaw(45)
+        self.change('delete', f'/api/sales-orders/{third}/')
+        self.assertRollupMatchesRaw(35)
+        with self.captureOnCommitCallbacks(execute=True):
+            SalesOrder.objects.filter(pk=first).delete()
+        self.assertRollupMatchesRaw(0)
+        self.assertFalse(DailySalesRollup.objects.exists())
+
+    def test_date_group_keys(self):
+        # Clients read these names from before grouping moved to completed_at
+        keys = {
+            'day': {'sales_order__created_at__date'},
+            'month': {'sales_order__created_at__year', 'sales_order__created_at__month'},
+        }
+        for group_by, expected in keys.items():
+            for source in ('rollup', 'raw'):
+                with self.subTest(group_by=group_by, source=source):
+                    response = self.client.get(f'/api/reports/sales/?group_by={group_by}&source={source}')
+                    row = response.data[0]
+                    self.assertLessEqual(expected, set(row))
+                    self.assertFalse(any('completed_at' in key for key in row))
+
+
+class SalesReportCacheTests(APITestCase):
+    JANUARY = '/api/reports/sales/?start_date=2024-01-01&end_date=2024-01-31'
+    MARCH = '/api/reports/sales/?start_date=2024-03-01&end_date=2024-03-31'
+
+    def setUp(self):
+        report_cache.get_cache().clear()
+        self.location = Location.objects.create(code='L1', name='Location 1')
+        self.product = Product.objects.create(sku='SKU-1', name='Product 1', unit_cost=2, unit_price=5)
+        InventoryItem.objects.create(product=self.product, location=self.location, quantity=100)
+        self.complete_order(datetime(2024, 1, 10, 12, tzinfo=dt_timezone.utc))
+
+    def complete_order(self, completed_at):
+        order = SalesOrder.objects.create(ship_from=self.location)
+        SalesOrderItem.objects.create(sales_order=order, product=self.product, quantity=1, unit_price=5)
+        with self.captureOnCommitCallbacks(execute=True), mock.patch('django.utils.timezone.now', return_value=completed_at):
+            order.complete()
+
+    def fetch(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['X-Cache'], response.data
+
+    def test_hit_after_miss(self):
+        self.assertEqual(self.fetch(self.JANUARY)[0], 'MISS')
+        with self.assertNumQueries(0):
+            status, data = self.fetch(self.JANUARY)
+        self.assertEqual((status, data['revenue']), ('HIT', 5))
+
+    def test_completion_invalidates_only_its_month(self):
+        self.fetch(self.JANUARY)
+        self.fetch(self.MARCH)
+        self.complete_order(datetime(2024, 1, 20, 12, tzinfo=dt_timezone.utc))
+        status, data = self.fetch(self.JANUARY)
+        self.assertEqual((status, data['revenue']), ('MISS', 10))
+        self.assertEqual(self.fetch(self.MARCH)[0], 'HIT')
+
+    def test_cost_change_invalidates_months_sold(self):
+        self.fetch(self.JANUARY)
+        self.fetch(self.MARCH)
+        self.product.unit_cost = 3
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        status, data = self.fetch(self.JANUARY)
+        self.assertEqual((status, data['cost']), ('MISS', 3))
+        self.assertEqual(self.fetch(self.MARCH)[0], 'HIT')
+
+    def test_other_product_edits_keep_the_cache(self):
+        self.fetch(self.JANUARY)
+        product = Product.objects.get(pk=self.product.pk)
+        product.name = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+            response = self.client.patch(f'/api/products/{product.pk}/', {'unit_price': '7.00'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.fetch(self.JANUARY)[0], 'HIT')
+
+
+class AdjustStockManyTests(APITestCase):
+    def setUp(self):
+        self.location = Location.objects.create(code='L1', name='Location 1')
+        self.products = [Product.objects.create(sku=f'SKU-{n}', name=f'Product {n}') for n in range(4)]
+        for product in self.products[:2]:
+            InventoryItem.objects.create(product=product, location=self.location, quantity=5)
+
+    def quantities(self):
+        return dict(InventoryItem.objects.values_list('product__sku', 'quantity'))
+
+    @mock.patch('inventory.models.STOCK_BATCH_SIZE', 2)
+    def test_existing_and_new_rows_in_one_call(self):
+        a, b, c, d = (product.pk for product in self.products)
+        loc = self.location.pk
+        changes = [(a, loc, 3), (c, loc, 4), (b, loc, -2), (a, loc, -1), (d, loc, 1)]
+        updated = adjust_stock_many(changes, reason='mixed')
+        self.assertEqual(
+            {key: item.quantity for key, item in updated.items()},
+            {(a, loc): 7, (b, loc): 3, (c, loc): 4, (d, loc): 1},
+        )
+        self.assertEqual(self.quantities(), {'SKU-0': 7, 'SKU-1': 3, 'SKU-2': 4, 'SKU-3': 1})
+        # One ledger entry per change, in order, each with its running balance
+        movements = StockMovement.objects.filter(reason='mixed').order_by('id')
+        self.assertEqual(list(movements.values_list('product__sku', 'delta', 'quantity_after')), [
+            ('SKU-0', 3, 8), ('SKU-2', 4, 4), ('SKU-1', -2, 3), ('SKU-0', -1, 7), ('SKU-3', 1, 1),
+        ])
+
+    def test_guard_leaves_short_rows_untouched(self):
+        a, b, c = (product.pk for product in self.products[:3])
+        loc = self.location.pk
+        InventoryItem.objects.filter(product_id=b).update(reserved=3)
+        updated = adjust_stock_many([(a, loc, -5), (b, loc, -3), (c, loc, -1)], guarded=True, reason='guarded')
+        self.assertEqual(list(updated), [(a, loc)])
+        # b has 5 on hand but 3 reserved; c has no row, and a decrement creates none
+        self.assertEqual(self.quantities(), {'SKU-0': 0, 'SKU-1': 5})
+        self.assertEqual(list(StockMovement.objects.filter(reason='guarded').values_list('product__sku', flat=True)), ['SKU-0'])
+
+    def test_lost_race_applies_nothing(self):
+        order = SalesOrder.objects.create(ship_from=self.location)
+        for product in self.products[:2]:
+            SalesOrderItem.objects.create(sales_order=order, product=product, quantity=4, unit_price=1)
+
+        def racing(changes, **kwargs):
+            # Another writer takes SKU-1 between the availability read and the guarded update
+            InventoryItem.objects.filter(product=self.products[1]).update(quantity=1)
+            return adjust_stock_many(changes, **kwargs)
+
+        with mock.patch('inventory.models.adjust_stock_many', side_effect=racing), \
+                self.assertRaisesMessage(DjangoValidationError, 'Insufficient stock for SKU-1 at L1.'):
+            order.complete()
+        self.assertEqual(self.quantities()['SKU-0'], 5)
+        self.assertFalse(StockMovement.objects.filter(kind=StockMovement.Kind.SALE).exists())
+        order.refresh_from_db()
+        self.assertEqual(order.status, SalesOrder.Status.DRAFT)
+
+    def test_new_rows_refresh_the_dashboard_counts(self):
+        a, c = self.products[0].pk, self.products[2].pk
+        loc = self.location.pk
+        cache.delete(counters.COUNTS_KEY)
+        self.assertEqual(counters.get_counts()['inventory_items'], 2)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            adjust_stock_many([(a, loc, 1)])
+        self.assertEqual(callbacks, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            adjust_stock_many([(a, loc, 1), (c, loc, 2)])
+        self.assertEqual(counters.get_counts()['inventory_items'], 3)
+
+    def receive(self, lines):
+        supplier = Supplier.objects.get_or_create(name='Supplier')[0]
+        order = PurchaseOrder.objects.create(supplier=supplier, receive_location=self.location)
+        PurchaseOrderItem.objects.bulk_create(
+            PurchaseOrderItem(purchase_order=order, product=product, quantity=quantity, unit_cost=1)
+            for product, quantity in lines
+        )
+        with CaptureQueriesContext(connection) as queries:
+            summary = order.receive()
+        return order, summary, len(queries)
+
+    def test_receive_merges_duplicate_lines(self):
+        a, b, c = self.products[:3]
+        order, summary, _ = self.receive([(a, 2), (c, 4), (a, 3), (b, 1), (c, 1)])
+        self.assertEqual(summary, [
+            {'product': a.pk, 'lines': 2, 'quantity': 5, 'on_hand': 10},
+            {'product': c.pk, 'lines': 2, 'quantity': 5, 'on_hand': 5},
+            {'product': b.pk, 'lines': 1, 'quantity': 1, 'on_hand': 6},
+        ])
+        self.assertEqual(self.quantities(), {'SKU-0': 10, 'SKU-1': 6, 'SKU-2': 5})
+        # One ledger entry per product, carrying the merged quantity
+        self.assertEqual(
+            sorted(StockMovement.objects.filter(purchase_order=order).values_list('product__sku', 'kind', 'delta', 'quantity_after')),
+            [('SKU-0', 'receipt', 5, 10), ('SKU-1', 'receipt', 1, 6), ('SKU-2', 'receipt', 5, 5)],
+        )
+
+    def test_receive_queries_do_not_grow_with_the_order(self):
+        products = Product.objects.bulk_create(Product(sku=f'BULK-{n}', name=f'Bulk {n}') for n in range(80))
+        InventoryItem.objects.bulk_create(
+            InventoryItem(product=product, location=self.location, quantity=1) for product in products[::2]
+        )
+        *_, small = self.receive([(self.products[0], 1), (self.products[2], 1)])
+        # Forty existing rows, forty new ones and a duplicate line for every product
+        *_, large = self.receive([(product, 1) for product in products] * 2)
+        self.assertEqual(large, small)
+        self.assertEqual(InventoryItem.objects.filter(product__in=products).aggregate(total=Sum('quantity'))['total'], 200)
+
+
+class StockLedgerTests(APITestCase):
+    def setUp(self):
+        self.location = Location.objects.create(code='L1', name='Location 1')
+        self.products = [Product.objects.create(sku=f'SKU-{n}', name=f'Product {n}') for n in range(2)]
+
+    def stock(self, **params):
+        return self.client.get(f'/api/locations/{self.location.pk}/stock/', params)
+
+    @staticmethod
+    def moment(day, hour):
+        return day_start(day) + timedelta(hours=hour)
+
+    @staticmethod
+    def at(moment, func, *args, **kwargs):
+        with mock.patch('django.utils.timezone.now', return_value=moment):
+            return func(*args, **kwargs)
+
+    def test_point_in_time_stock(self):
+        a, b = self.products
+        day = date(2024, 3, 10)
+        self.at(self.moment(day, 9), adjust_stock, a, self.location, 10)
+        self.at(self.moment(day, 9), adjust_stock, b, self.location, 4)
+        self.at(self.moment(day, 12), take_stock_snapshots)
+        self.at(self.moment(day, 15), adjust_stock, a, self.location, -3)
+        self.at(self.moment(day + timedelta(days=1), 8), adjust_stock, a, self.location, -5)
+
+        self.assertEqual(stock_at(self.location, self.moment(day, 8)), {})
+        self.assertEqual(stock_at(self.location, self.moment(day, 10)), {a.pk: 10, b.pk: 4})
+        self.assertEqual(stock_at(self.location, self.moment(day, 16)), {a.pk: 7, b.pk: 4})
+        self.assertEqual(stock_at(self.location, self.moment(day + timedelta(days=1), 9), [a.pk]), {a.pk: 2})
+        # Reads after the snapshot start from it rather than from the older entries
+        StockMovement.objects.filter(product=a, delta=10).update(delta=1000)
+        self.assertEqual(stock_at(self.location, self.moment(day, 16)), {a.pk: 7, b.pk: 4})
+        self.assertEqual(stock_at(self.location, self.moment(day, 10)), {a.pk: 1000, b.pk: 4})
+
+        # A bare date means the end of that day; a datetime is taken as is
+        response = self.stock(at=day.isoformat())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['items'], [{'product': a.pk, 'quantity': 7}, {'product': b.pk, 'quantity': 4}])
+        self.assertEqual(self.stock(at=day.isoformat(), product=b.pk).data['items'], [{'product': b.pk, 'quantity': 4}])
+        self.assertEqual(self.stock(at=self.moment(day, 8).isoformat()).data['items'], [])
+
+    def test_snapshots_follow_activity(self):
+        a = self.products[0]
+        other = Location.objects.create(code='L2', name='Location 2')
+        adjust_stock(a, self.location, 5)
+        first = take_stock_snapshots()
+        self.assertEqual({snapshot.location_id for snapshot in first}, {self.location.pk, other.pk})
+        snapshot = next(snapshot for snapshot in first if snapshot.location_id == self.location.pk)
+        self.assertEqual(list(snapshot.items.values_list('product_id', 'quantity')), [(a.pk, 5)])
+        # One entry since the last snapshot is under min_movements; L2 has none at all
+        adjust_stock(a, self.location, 1)
+        self.assertEqual(take_stock_snapshots(min_movements=2), [])
+        adjust_stock(a, self.location, 1)
+        taken = take_stock_snapshots(min_movements=2)
+        self.assertEqual([snapshot.location_id for snapshot in taken], [self.location.pk])
+        self.assertEqual(taken[0].items.get().quantity, 7)
+        self.assertEqual(taken[0].last_movement_id, StockMovement.objects.latest('id').pk)
+
+    def test_snapshot_stock_command(self):
+        adjust_stock(self.products[0], self.location, 5)
+        Location.objects.create(code='L2', name='Location 2')
+        out = StringIO()
+        call_command('snapshot_stock', location=['L1'], stdout=out)
+        self.assertIn('1 snapshot(s) taken.', out.getvalue())
+        call_command('snapshot_stock', min_movements=1, stdout=out)
+        self.assertIn('0 snapshot(s) taken.', out.getvalue())
+        with self.assertRaisesMessage(CommandError, 'Unknown location(s): NOPE'):
+            call_command('snapshot_stock', location=['L1', 'NOPE'], stdout=out)
+
+    def test_stock_rejects_bad_parameters(self):
+        for params in ({'product': 'abc'}, {'product': [self.products[0].pk, '1.5']}, {'at': 'yesterday'}):
+            with self.subTest(params=params):
+                response = self.stock(**params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(list(response.data), list(params))
+
+    def test_admin_cannot_edit_the_ledger(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        adjust_stock(self.products[0], self.location, 3)
+        movement = StockMovement.objects.get()
+        base = '/admin/inventory/stockmovement/'
+        self.assertEqual(self.client.get(base).status_code, 200)
+        self.assertEqual(self.client.get(f'{base}add/').status_code, 403)
+        self.assertEqual(self.client.post(f'{base}{movement.pk}/change/', {'delta': 100}).status_code, 403)
+        self.assertEqual(self.client.post(f'{base}{movement.pk}/delete/', {'post': 'yes'}).status_code, 403)
+        self.assertEqual(StockMovement.objects.get().delta, 3)
+
+
+class ImportCatalogTests(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.location = Location.objects.create(code='L1', name='Location 1')
+
+    def run_import(self, kind, rows, name=None, **options):
+        path = self.directory / (name or f'{kind}.csv')
+        with open(path, 'w', newline='', encoding='utf-8') as handle:
+            writer = csv.DictWriter(handle, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        out = StringIO()
+        call_command('import_catalog', kind, str(path), stdout=out, stderr=StringIO(), **options)
+        return out.getvalue()
+
+    def test_upserts_by_natural_key(self):
+        self.run_import('suppliers', [{'name': 'Acme', 'email': 'old@acme.test'}])
+        self.run_import('suppliers', [{'name': 'Acme', 'email': 'new@acme.test'}, {'name': 'Globex', 'email': ''}])
+        self.assertEqual(
+            dict(Supplier.objects.values_list('name', 'email')), {'Acme': 'new@acme.test', 'Globex': None},
+        )
+
+        product = {'sku': 'SKU-1', 'name': 'Bolt', 'unit_cost': '2', 'unit_price': '5', 'supplier': 'Acme'}
+        self.run_import('products', [product])
+        self.run_import('products', [{**product, 'unit_price': '6', 'supplier': 'Globex'}])
+        bolt = Product.objects.get()
+        self.assertEqual((bolt.unit_price, bolt.supplier.name), (6, 'Globex'))
+
+        # Each stock import lands in the ledger with the difference from the previous quantity
+        self.run_import('stock', [{'sku': 'SKU-1', 'location': 'L1', 'quantity': '5'}])
+        self.run_import('stock', [{'sku': 'SKU-1', 'location': 'L1', 'quantity': '8', 'reorder_threshold': '2'}])
+        self.run_import('stock', [{'sku': 'SKU-1', 'location': 'L1', 'quantity': '3', 'reorder_threshold': '2'}])
+        item = InventoryItem.objects.get()
+        self.assertEqual((item.quantity, item.reorder_threshold), (3, 2))
+        movements = StockMovement.objects.filter(kind=StockMovement.Kind.IMPORT).order_by('id')
+        self.assertEqual(list(movements.values_list('delta', 'quantity_after')), [(5, 5), (3, 8), (-5, 3)])
+
+    def test_rejected_rows_go_to_the_rejects_file(self):
+        Supplier.objects.create(name='Acme')
+        rejects = self.directory / 'rejects.ndjson'
+        output = self.run_import('products', [
+            {'sku': 'SKU-1', 'name': 'Bolt', 'unit_cost': '2', 'supplier': 'Acme'},
+            {'sku': '', 'name': 'No sku', 'unit_cost': '2', 'supplier': ''},
+            {'sku': 'SKU-3', 'name': 'Nut', 'unit_cost': 'cheap', 'supplier': ''},
+            {'sku': 'SKU-4', 'name': 'Washer', 'unit_cost': '1', 'supplier': 'Nobody'},
+        ], rejects=str(rejects))
+        self.assertIn('1 upserted, 3 rejected', output)
+        self.assertEqual(list(Product.objects.values_list('sku', flat=True)), ['SKU-1'])
+        lines = [json.loads(line) for line in rejects.read_text().splitlines()]
+        self.assertEqual([(line['line'], line['reason']) for line in lines], [
+            (2, 'sku is required'),
+            (3, "unit_cost is not a number: 'cheap'"),
+            (4, "unknown supplier 'Nobody'"),
+        ])
+        self.assertEqual(lines[2]['row']['sku'], 'SKU-4')
+
+    def test_resumes_from_offset_and_checkpoint(self):
+        rows = [{'sku': f'SKU-{n}', 'name': f'Product {n}'} for n in range(5)]
+        checkpoint = self.directory / 'checkpoint'
+        self.run_import('products', rows, checkpoint=str(checkpoint), batch_size=2)
+        self.assertEqual(checkpoint.read_text(), '5')
+        self.assertEqual(Product.objects.count(), 5)
+
+        # A run that stopped after the first chunk picks up from the recorded offset
+        Product.objects.all().delete()
+        checkpoint.write_text('2')
+        output = self.run_import('products', rows, checkpoint=str(checkpoint), batch_size=2)
+        self.assertIn('Resuming from checkpoint offset 2', output)
+        self.assertEqual(list(Product.objects.order_by('sku').values_list('sku', flat=True)), ['SKU-2', 'SKU-3', 'SKU-4'])
+        self.assertEqual(checkpoint.read_text(), '5')
+
+        # An explicit --offset wins over the checkpoint
+        Product.objects.all().delete()
+        self.run_import('products', rows, checkpoint=str(checkpoint), offset=4)
+        self.assertEqual(list(Product.objects.values_list('sku', flat=True)), ['SKU-4'])
+
+    def test_rollup_refreshed_only_for_cost_or_supplier_changes(self):
+        Supplier.objects.create(name='Acme')
+        rows = [
+            {'sku': f'SKU-{n}', 'name': f'Product {n}', 'unit_cost': '2', 'supplier': 'Acme'} for n in range(3)
+        ]
+        self.run_import('products', rows)
+        target = 'inventory.management.commands.import_catalog.refresh_daily_sales'
+        with mock.patch(target) as refresh:
+            self.run_import('products', [{**row, 'name': 'Renamed', 'unit_cost': '2.00'} for row in rows])
+        refresh.assert_not_called()
+        with mock.patch(target) as refresh:
+            self.run_import('products', [rows[0], {**rows[1], 'unit_cost': '3'}, {**rows[2], 'supplier': ''}])
+        (products,), _ = refresh.call_args
+        self.assertEqual(sorted(products.values_list('sku', flat=True)), ['SKU-1', 'SKU-2'])
+
+
+class CheckLowStockTests(APITestCase):
+    def setUp(self):
+        self.locations = [Location.objects.create(code=f'L{n}', name=f'Location {n}') for n in range(2)]
+        self.products = [Product.objects.create(sku=f'SKU-{n}', name=f'Product {n}') for n in range(3)]
+        for product in self.products:
+            for location in self.locations:
+                InventoryItem.objects.create(product=product, location=location, quantity=10, reorder_threshold=5)
+
+    def check(self, **options):
+        out = StringIO()
+        call_command('check_low_stock', stdout=out, **options)
+        return out.getvalue()
+
+    @staticmethod
+    def reported(output):
+        return [line.split(':')[0].strip() for line in output.splitlines() if line.startswith('  ')]
+
+    def lower(self, product, location, quantity=2):
+        adjust_stock(product, location, quantity - InventoryItem.objects.get(product=product, location=location).quantity)
+
+    def test_each_crossing_is_reported_once(self):
+        since = '2000-01-01'
+        self.assertEqual(self.reported(self.check(since=since)), [])
+        self.lower(self.products[0], self.locations[0])
+        self.lower(self.products[1], self.locations[1])
+        output = self.check(since=since)
+        self.assertIn('L0: 1 newly low', output)
+        self.assertIn('L1: 1 newly low', output)
+        self.assertEqual(self.reported(output), ['SKU-0 - Product 0 @ L0', 'SKU-1 - Product 1 @ L1'])
+        # Still low, already alerted
+        self.lower(self.products[0], self.locations[0], 1)
+        self.assertEqual(self.reported(self.check(since=since)), [])
+        # Back above the threshold re-arms the alert for the next crossing
+        self.lower(self.products[0], self.locations[0], 8)
+        self.assertEqual(self.reported(self.check(since=since)), [])
+        self.assertIsNone(InventoryItem.objects.get(product=self.products[0], location=self.locations[0]).low_stock_alerted_at)
+        self.lower(self.products[0], self.locations[0])
+        self.assertEqual(self.reported(self.check(since=since)), ['SKU-0 - Product 0 @ L0'])
+
+    def test_since_only_evaluates_touched_rows(self):
+        self.lower(self.products[0], self.locations[0])
+        self.lower(self.products[1], self.locations[0])
+        InventoryItem.objects.filter(product=self.products[1]).update(updated_at=datetime(2024, 1, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(self.reported(self.check(since='2024-01-02')), ['SKU-0 - Product 0 @ L0'])
+        self.assertEqual(self.reported(self.check(since='2024-01-01T00:00:00+00:00')), ['SKU-1 - Product 1 @ L0'])
+        with self.assertRaisesMessage(CommandError, "Invalid --since value: 'soon'"):
+            self.check(since='soon')
+
+    def test_checkpoint_carries_over_between_runs(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        checkpoint = Path(directory.name) / 'checkpoint'
+        self.lower(self.products[0], self.locations[0])
+        # No checkpoint yet: every row is evaluated
+        self.assertEqual(self.reported(self.check(checkpoint=str(checkpoint))), ['SKU-0 - Product 0 @ L0'])
+        recorded = datetime.fromisoformat(checkpoint.read_text())
+        self.assertLess(recorded, datetime.now(dt_timezone.utc))
+
+        self.lower(self.products[2], self.locations[1])
+        InventoryItem.objects.filter(product=self.products[1]).update(
+            quantity=0, updated_at=recorded - timedelta(minutes=1),
+        )
+        # Rows untouched since the checkpoint are not evaluated again
+        self.assertEqual(self.reported(self.check(checkpoint=str(checkpoint))), ['SKU-2 - Product 2 @ L1'])
+        self.assertGreater(datetime.fromisoformat(checkpoint.read_text()), recorded)
+
+    def test_watch_reports_new_crossings_on_each_poll(self):
+        polls = []
+
+        def sleep(seconds):
+            polls.append(seconds)
+            if len(polls) == 1:
+                self.lower(self.products[1], self.locations[1])
+            else:
+                raise KeyboardInterrupt
+
+        self.lower(self.products[0], self.locations[0])
+        command = 'inventory.management.commands.check_low_stock'
+        with mock.patch(f'{command}.time.sleep', side_effect=sleep), mock.patch(f'{command}.close_old_connections'):
+            output = self.check(watch=True, interval=30)
+        self.assertEqual(polls, [30, 30])
+        self.assertEqual(self.reported(output), ['SKU-0 - Product 0 @ L0', 'SKU-1 - Product 1 @ L1'])
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        self.locations = [Location.objects.create(code=f'L{n}', name=f'Location {n}') for n in range(2)]
+        self.products = [
+            Product.objects.create(sku=f'SKU-{n}', name=f'Product "{n}", boxed', unit_cost=2, unit_price=5)
+            for n in range(2)
+        ]
+
+    def export(self, url, content_type):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], content_type)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_inventory_csv(self):
+        p0, p1 = self.products
+        l0, l1 = self.locations
+        for product, location, quantity in ((p0, l1, 3), (p1, l0, 7), (p0, l0, 1)):
+            InventoryItem.objects.create(product=product, location=location, quantity=quantity, reorder_threshold=2)
+        response, body = self.export(f'/api/inventory/export/?location={l0.pk}', 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="inventory.csv"')
+        rows = list(csv.reader(StringIO(body)))
+        self.assertEqual(rows[0], [
+            'id', 'product', 'sku', 'product_name', 'location', 'location_code', 'quantity', 'reorder_threshold', 'reserved',
+        ])
+        # List filters apply, rows come in id order and values are quoted as needed
+        self.assertEqual([(row[2], row[3], row[5], row[6]) for row in rows[1:]], [
+            ('SKU-1', 'Product "1", boxed', 'L0', '7'), ('SKU-0', 'Product "0", boxed', 'L0', '1'),
+        ])
+
+    def test_sales_orders_ndjson(self):
+        first = datetime(2024, 1, 10, 12, tzinfo=dt_timezone.utc)
+        orders = SalesOrder.objects.bulk_create([
+            SalesOrder(reference='SO-1', created_at=first, ship_from=self.locations[0]),
+            SalesOrder(reference='SO-2', created_at=first + timedelta(days=1)),
+        ])
+        for order, products in zip(orders, (self.products, self.products[:1])):
+            for product in products:
+                SalesOrderItem.objects.create(sales_order=order, product=product, quantity=2, unit_price='4.50')
+        _, body = self.export('/api/sales-orders/export/?output=ndjson', 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        # One row per line, newest order first
+        self.assertEqual([(row['reference'], row['sku']) for row in rows], [('SO-2', 'SKU-0'), ('SO-1', 'SKU-0'), ('SO-1', 'SKU-1')])
+        self.assertEqual(rows[1], {
+            'order': orders[0].pk, 'reference': 'SO-1', 'customer_name': None, 'status': 'draft',
+            'created_at': '2024-01-10T12:00:00Z', 'completed_at': None, 'ship_from': 'L0',
+            'item': rows[1]['item'], 'sku': 'SKU-0', 'quantity': 2, 'unit_price': '4.50',
+        })
+
+    def test_grouped_report_csv(self):
+        for product, quantity in ((self.products[1], 1), (self.products[0], 3)):
+            adjust_stock(product, self.locations[0], 10)
+            order = SalesOrder.objects.create(ship_from=self.locations[0])
+            SalesOrderItem.objects.create(sales_order=order, product=product, quantity=quantity, unit_price=5)
+            order.complete()
+        response, body = self.export('/api/reports/sales/?group_by=product&output=csv', 'text/csv; charset=utf-8')
+        self.assertEqual(response['X-Report-Source'], 'rollup')
+        header, *rows = csv.reader(StringIO(body))
+        self.assertEqual(header, ['product_id', 'product__sku', 'product__name', 'revenue', 'cost', 'profit'])
+        self.assertEqual([row[:3] + [Decimal(value) for value in row[3:]] for row in rows], [
+            [str(self.products[0].pk), 'SKU-0', 'Product "0", boxed', 15, 6, 9],
+            [str(self.products[1].pk), 'SKU-1', 'Product "1", boxed', 5, 2, 3],
+        ])
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get('/api/inventory/export/?output=xml').status_code, 400)
+
+
+class AutocompleteTests(APITestCase):
+    def setUp(self):
+        self.nut = Product.objects.create(sku='ECR-001', name='Écrou inox M6')
+        self.screw = Product.objects.create(sku='VIS-010', name='Vis acier écrou intégré')
+        Product.objects.create(sku='ECR-002', name='Écrou laiton', is_active=False)
+
+    def skus(self, q, **params):
+        response = self.client.get('/api/products/autocomplete/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row['sku'] for row in response.data]
+
+    def test_sku_prefix_then_name_words(self):
+        # Accents and case are folded; SKU matches come first, inactive products never
+        self.assertEqual(self.skus('ecr'), ['ECR-001', 'VIS-010'])
+        self.assertEqual(self.skus('ECROU in'), ['ECR-001', 'VIS-010'])
+        self.assertEqual(self.skus('écrou m6'), ['ECR-001'])
+        self.assertEqual(self.skus('ecr', limit=1), ['ECR-001'])
+        with self.assertNumQueries(0):
+            self.skus('vis')
+
+    def test_follows_product_writes(self):
+        self.skus('ecr')
+        created = Product.objects.create(sku='BOU-001', name='Boulon tête hexagonale')
+        self.assertEqual(self.skus('hexa'), ['BOU-001'])
+        self.nut.name = 'Rondelle plate'
+        self.nut.save()
+        self.assertEqual(self.skus('ecrou'), ['VIS-010'])
+        self.assertEqual(self.skus('rondelle'), ['ECR-001'])
+        self.screw.delete()
+        created.delete()
+        self.assertEqual(self.skus('ecrou'), [])
+        self.assertEqual(self.skus('b'), [])
+
+
+class FullTextSearchTests(APITestCase):
+    def setUp(self):
+        if not search.enabled(connection.alias):
+            self.skipTest('needs the SQLite FTS5 search index')
+        self.wh1 = Location.objects.create(code='WH1', name='Entrepôt nord')
+        self.wh2 = Location.objects.create(code='WH2', name='Entrepôt sud')
+        self.bolt = Product.objects.create(sku='SKU-00123', name='Boulon hexagonal', description='Acier zingué')
+        self.washer = Product.objects.create(sku='SKU-00200', name='Rondelle plate', description='Pour boulon M6')
+        InventoryItem.objects.create(product=self.bolt, location=self.wh2, quantity=1)
+        InventoryItem.objects.create(product=self.washer, location=self.wh1, quantity=1)
+
+    def found(self, url, search, key='sku'):
+        response = self.client.get(url, {'search': search})
+        self.assertEqual(response.status_code, 200)
+        return [row[key] for row in response.data['results']]
+
+    def test_ranks_by_column_weight(self):
+        # A match in the name outweighs one in the description, whatever the case or word prefix
+        for text in ('boulon', 'BOUL'):
+            self.assertEqual(self.found('/api/products/', text), ['SKU-00123', 'SKU-00200'])
+        self.washer.name = 'Rondelle boulon'
+        self.washer.save()
+        self.assertEqual(self.found('/api/products/', 'boulon'), ['SKU-00200', 'SKU-00123'])
+
+    def test_sku_substring(self):
+        self.assertEqual(self.found('/api/products/', '123'), ['SKU-00123'])
+        self.assertEqual(self.found('/api/products/', '00200'), ['SKU-00200'])
+        # Substring matches rank after full-text ones
+        Product.objects.create(sku='SKU-00999', name='Joint 123')
+        self.assertEqual(self.found('/api/products/', '123'), ['SKU-00999', 'SKU-00123'])
+
+    def test_inventory_location_code_and_sku(self):
+        items = '/api/inventory/'
+        self.assertEqual(self.found(items, 'WH1', key='product'), [self.washer.pk])
+        self.assertEqual(self.found(items, 'wh', key='product'), [self.bolt.pk, self.washer.pk])
+        self.assertEqual(self.found(items, '123', key='product'), [self.bolt.pk])
+        self.assertEqual(self.found(items, 'rondelle', key='product'), [self.washer.pk])
+
+    def test_fallback_without_the_index(self):
+        with mock.patch('inventory.search.enabled', return_value=False):
+            self.assertEqual(self.found('/api/products/', '123'), ['SKU-00123'])
+            self.assertEqual(self.found('/api/inventory/', 'WH1', key='product'), [self.washer.pk])
+            self.assertEqual(sorted(self.found('/api/products/', 'boulon')), ['SKU-00123'])
+
+    def test_triggers_follow_writes(self):
+        products = '/api/products/'
+        created = Product.objects.create(sku='SKU-00300', name='Goupille fendue')
+        self.assertEqual(self.found(products, 'goupille'), ['SKU-00300'])
+        Product.objects.filter(pk=created.pk).update(name='Clavette')
+        self.assertEqual(self.found(products, 'goupille'), [])
+        self.assertEqual(self.found(products, 'clavette'), ['SKU-00300'])
+        created.delete()
+        self.assertEqual(self.found(products, 'clavette'), [])
+
+    def test_supplier_rename_reindexes_purchase_orders(self):
+        supplier = Supplier.objects.create(name='Visserie Dupont')
+        order = PurchaseOrder.objects.create(supplier=supplier, reference='PO-1')
+        self.assertEqual(self.found('/api/purchase-orders/', 'dupont', key='id'), [order.pk])
+        supplier.name = 'Quincaillerie Martin'
+        supplier.save()
+        self.assertEqual(self.found('/api/purchase-orders/', 'dupont', key='id'), [])
+        self.assertEqual(self.found('/api/purchase-orders/', 'martin', key='id'), [order.pk])
+
+    def test_rebuild_search_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM inventory_product_fts')
+        self.assertEqual(self.found('/api/products/', 'rondelle'), [])
+        call_command('rebuild_search_index', 'inventory.Product', stdout=StringIO())
+        self.assertEqual(self.found('/api/products/', 'rondelle'), ['SKU-00200'])
+        # Without the tables, the command installs them
+        search.uninstall(connection)
+        self.assertIsNone(search.ranked(Product.objects.all(), 'rondelle'))
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.found('/api/products/', 'rondelle'), ['SKU-00200'])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN output is SQLite specific')
+class IndexUsageTests(APITestCase):
+    """Each index from 0003 must show up in the plan of the query it exists for."""
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertRegex(plan, rf'(SEARCH|SCAN) \w+ USING (COVERING )?INDEX {index}\b', plan)
+
+    def test_report_completed_range(self):
+        start = date(2024, 1, 1)
+        self.assertUsesIndex(
+            SalesOrder.objects.filter(
+                status=SalesOrder.Status.COMPLETED,
+                completed_at__gte=day_start(start), completed_at__lt=day_start(start + timedelta(days=31)),
+            ),
+            'salesorder_status_completed',
+        )
+        rows = SalesReportView.raw_rows(start, date(2024, 1, 31), None, None)
+        self.assertUsesIndex(rows.values('product_id').annotate(quantity=Sum('quantity')), 'salesorder_status_completed')
+
+    def test_status_listing(self):
+        self.assertUsesIndex(SalesOrder.objects.filter(status='pending').order_by('-created_at'), 'salesorder_status_created')
+        self.assertUsesIndex(PurchaseOrder.objects.filter(status='pending').order_by('-created_at'), 'purchaseorder_status_created')
+
+    def test_created_ordering(self):
+        self.assertUsesIndex(SalesOrder.objects.order_by('-created_at', '-id')[:25], 'salesorder_created_id')
+        self.assertUsesIndex(PurchaseOrder.objects.order_by('-created_at', '-id')[:25], 'purchaseorder_created_id')
+
+    def test_low_stock(self):
+        low = InventoryItem.objects.filter(quantity__lte=F('reorder_threshold'))
+        self.assertUsesIndex(low.select_related('product', 'location'), 'inventoryitem_low_stock')
+        self.assertUsesIndex(low.filter(location_id=1), 'inventoryitem_low_stock')
+        self.assertUsesIndex(low_stock_items(InventoryItem.objects.filter(location_id=1)), 'inventoryitem_low_stock')
+
+    def test_search_is_driven_by_the_fts_index(self):
+        if not search.enabled(connection.alias):
+            self.skipTest('needs the SQLite FTS5 search index')
+        # Words without a digit that the index finds never reach the substring lookups
+        product = Product.objects.create(sku='SKU-1', name='Boulon')
+        InventoryItem.objects.create(product=product, location=Location.objects.create(code='L1', name='L1'))
+        for viewset in (ProductViewSet, InventoryItemViewSet):
+            with self.subTest(viewset=viewset.__name__):
+                view = viewset(action_map={'get': 'list'}, format_kwarg=None, kwargs={})
+                view.request = view.initialize_request(APIRequestFactory().get('/', {'search': 'boulon'}))
+                plan = view.filter_queryset(view.get_queryset()).explain()
+                self.assertIn('inventory_product_fts VIRTUAL TABLE', plan)
+                self.assertNotRegex(plan, r'SCAN inventory_product(?!_)', plan)
+
+
+class AsyncViewsTests(APITestCase):
+    """The /api/async/ views answer like their sync counterparts."""
+
+    def setUp(self):
+        report_cache.get_cache().clear()
+        self.location = Location.objects.create(code='L1', name='Location 1')
+        self.products = [
+            Product.objects.create(sku=f'SKU-{n}', name=f'Product {n}', unit_cost=2, unit_price=5)
+            for n in range(3)
+        ]
+        for n, product in enumerate(self.products):
+            InventoryItem.objects.create(product=product, location=self.location, quantity=n * 4, reorder_threshold=5)
+            order = SalesOrder.objects.create(ship_from=self.location)
+            SalesOrderItem.objects.create(sales_order=order, product=product, quantity=1, unit_price=5)
+            if n:
+                order.complete()
+        purchase = PurchaseOrder.objects.create(supplier=Supplier.objects.create(name='Acme'), receive_location=self.location)
+        PurchaseOrderItem.objects.create(purchase_order=purchase, product=self.products[0], quantity=3, unit_cost=2)
+
+    @staticmethod
+    async def content(response):
+        if not response.streaming:
+            return response.content
+        if response.is_async:
+            return b''.join([chunk async for chunk in response.streaming_content])
+        # Sync exports query as they stream, which has to happen off the event loop
+        return await sync_to_async(b''.join)(response.streaming_content)
+
+    async def assertSameAnswer(self, url):
+        expected = await self.async_client.get(f'/api/{url}')
+        body = await self.content(expected)
+        self.assertEqual(expected.status_code, 200)
+        self.assertTrue(body.strip())
+        response = await self.async_client.get(f'/api/async/{url}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], expected['Content-Type'])
+        self.assertEqual(await self.content(response), body)
+
+    async def test_sales_report(self):
+        for query in (
+            '', '?group_by=product', '?group_by=day&source=raw',
+            '?output=csv', '?group_by=product&output=csv', '?group_by=month&output=csv', '?group_by=day&output=ndjson',
+        ):
+            with self.subTest(query=query):
+                await self.assertSameAnswer(f'reports/sales/{query}')
+        response = await self.async_client.get('/api/async/reports/sales/?start_date=2024-13-01')
+        self.assertEqual(response.status_code, 400)
+
+    async def test_exports(self):
+        for url in ('inventory/export/', 'sales-orders/export/?status=completed', 'purchase-orders/export/'):
+            for output in ('csv', 'ndjson'):
+                query = f"{'&' if '?' in url else '?'}output={output}"
+                with self.subTest(url=url, output=output):
+                    await self.assertSameAnswer(url + query)
+
+    async def test_low_stock(self):
+        response = await self.async_client.get('/api/async/low-stock/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 2)
+        self.assertEqual([row['sku'] for row in response.json()['results']], ['SKU-0', 'SKU-1'])
+
+
+class BulkCompleteTests(APITestCase):
+    def setUp(self):
+        self.location = Location.objects.create(code='L1', name='Location 1')
+        self.products = [Product.objects.create(sku=f'SKU-{n}', name=f'Product {n}', unit_price=5) for n in range(2)]
+        for product in self.products:
+            InventoryItem.objects.create(product=product, location=self.location, quantity=5)
+
+    def create_order(self, *lines, ship_from=True):
+        order = SalesOrder.objects.create(ship_from=self.location if ship_from else None)
+        for product, quantity in lines:
+            SalesOrderItem.objects.create(sales_order=order, product=product, quantity=quantity, unit_price=5)
+        return order
+
+    def quantities(self):
+        return dict(InventoryItem.objects.values_list('product__sku', 'quantity'))
+
+    def test_mixed_batch(self):
+        a, b = self.products
+        first = self.create_order((a, 2))
+        short = self.create_order((a, 1), (b, 6))
+        completed = self.create_order((a, 1))
+        completed.complete()
+        cancelled = self.create_order((b, 1))
+        SalesOrder.objects.filter(pk=cancelled.pk).update(status=SalesOrder.Status.CANCELLED)
+        nowhere = self.create_order((a, 1), ship_from=False)
+        second = self.create_order((a, 2), (b, 5))
+        ids = [first.pk, short.pk, completed.pk, cancelled.pk, nowhere.pk, 999999, second.pk]
+
+        response = self.client.post('/api/sales-orders/bulk-complete/', {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['completed'], response.data['failed']), (2, 5))
+        self.assertEqual(response.data['results'], [
+            {'id': first.pk, 'ok': True},
+            {'id': short.pk, 'ok': False, 'errors': ['Insufficient stock for SKU-1 at L1.']},
+            {'id': completed.pk, 'ok': False, 'errors': ['Cannot complete a cancelled or already completed sales order.']},
+            {'id': cancelled.pk, 'ok': False, 'errors': ['Cannot complete a cancelled or already completed sales order.']},
+            {'id': nowhere.pk, 'ok': False, 'errors': ['ship_from must be set to complete order.']},
+            {'id': 999999, 'ok': False, 'errors': ['Sales order not found.']},
+            {'id': second.pk, 'ok': True},
+        ])
+        self.assertEqual(self.quantities(), {'SKU-0': 0, 'SKU-1': 0})
+        statuses = dict(SalesOrder.objects.values_list('pk', 'status'))
+        self.assertEqual([statuses[order.pk] for order in (first, short, second)], ['completed', 'draft', 'completed'])
+        sales = StockMovement.objects.filter(kind=StockMovement.Kind.SALE)
+        self.assertEqual(sorted(sales.values_list('sales_order_id', 'product__sku', 'delta')), sorted([
+            (completed.pk, 'SKU-0', -1), (first.pk, 'SKU-0', -2), (second.pk, 'SKU-0', -2), (second.pk, 'SKU-1', -5),
+        ]))
+
+    def test_stock_conflict_falls_back_to_one_by_one(self):
+        a, b = self.products
+        first = self.create_order((a, 2))
+        second = self.create_order((b, 3))
+        real = adjust_stock_many
+
+        def racing(changes, **kwargs):
+            # Another writer takes SKU-1 between the availability read and the guarded update
+            InventoryItem.objects.filter(product=b).update(quantity=1)
+            return real(changes, **kwargs)
+
+        with mock.patch('inventory.models.adjust_stock_many', side_effect=racing) as adjust, \
+                mock.patch.object(SalesOrder, 'complete', autospec=True, side_effect=SalesOrder.complete) as complete:
+            results = complete_sales_orders([first.pk, second.pk])
+        self.assertEqual(results, {first.pk: [], second.pk: ['Insufficient stock for SKU-1 at L1.']})
+        # The chunk's batched write was undone and each order retried on its own; the
+        # second one now sees the stock taken by the other writer and does not try at all
+        self.assertEqual(adjust.call_count, 2)
+        self.assertEqual(sorted(order.pk for (order,), _ in complete.call_args_list), [first.pk, second.pk])
+        self.assertEqual(self.quantities()['SKU-0'], 3)
+        self.assertEqual(
+            list(StockMovement.objects.filter(kind=StockMovement.Kind.SALE).values_list('sales_order_id', 'delta')),
+            [(first.pk, -2)],
+        )
+        second.refresh_from_db()
+        self.assertEqual(second.status, SalesOrder.Status.DRAFT)
+
+
+class StockReservationTests(APITestCase):
+    def setUp(self):
+        self.location = Location.objects.create(code='L1', name='Location 1')
+        self.product = Product.objects.create(sku='SKU-1', name='Product 1', unit_cost=2, unit_price=5)
+        self.item = InventoryItem.objects.create(product=self.product, location=self.location, quantity=5)
+
+    def create_order(self, quantity, status='pending'):
+        return self.client.post('/api/sales-orders/', {
+            'status': status, 'ship_from': self.location.pk,
+            'items': [{'product': self.product.pk, 'quantity': quantity, 'unit_price': '5.00'}],
+        }, format='json')
+
+    def assertStock(self, quantity, reserved):
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.quantity, self.item.reserved), (quantity, reserved))
+        self.assertEqual(available_to_promise(self.product.pk, self.location.pk), quantity - reserved)
+
+    def test_pending_orders_cannot_promise_the_same_units(self):
+        self.assertEqual(self.create_order(3).status_code, 201)
+        self.assertStock(5, 3)
+        response = self.create_order(3)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['status'], ['Insufficient stock to reserve SKU-1 at L1.'])
+        self.assertEqual(SalesOrder.objects.count(), 1)
+        # A draft order holds nothing and cannot complete into reserved stock either
+        draft = SalesOrder.objects.get(pk=self.create_order(3, status='draft').data['id'])
+        self.assertStock(5, 3)
+        self.assertEqual(self.client.post(f'/api/sales-orders/{draft.pk}/complete/').status_code, 400)
+
+    def test_line_changes_and_cancel(self):
+        order = self.create_order(2).data
+        line = {**order['items'][0], 'quantity': 4}
+        response = self.client.patch(f"/api/sales-orders/{order['id']}/", {'items': [line]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertStock(5, 4)
+        self.client.patch(f"/api/sales-orders/{order['id']}/", {'status': 'cancelled'}, format='json')
+        self.assertStock(5, 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_complete_consumes_the_reservation(self):
+        first = self.create_order(3).data['id']
+        second = self.create_order(2).data['id']
+        self.assertEqual(self.client.post(f'/api/sales-orders/{first}/complete/').status_code, 200)
+        self.assertStock(2, 2)
+        self.assertEqual(self.client.post('/api/sales-orders/bulk-complete/', {'ids': [second]}, format='json').data['completed'], 1)
+        self.assertStock(0, 0)
+        self.assertEqual(self.client.get(f'/api/inventory/{self.item.pk}/').data['available'], 0)
+
+    def test_delete_releases(self):
+        order = self.create_order(5).data['id']
+        self.assertStock(5, 5)
+        SalesOrder.objects.filter(pk=order).delete()
+        self.assertStock(5, 0)
+
+    def test_admin_refusal_rolls_back(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        order = SalesOrder.objects.get(pk=self.create_order(4, status='draft').data['id'])
+        line = order.items.get()
+        url = f'/admin/inventory/salesorder/{order.pk}/change/'
+        response = self.client.post(url, {
+            'reference': 'SO-ADMIN', 'customer_name': '', 'status': 'pending', 'ship_from': self.location.pk,
+            'created_at_0': order.created_at.date().isoformat(), 'created_at_1': '00:00:00',
+            'items-TOTAL_FORMS': 1, 'items-INITIAL_FORMS': 1, 'items-MIN_NUM_FORMS': 0, 'items-MAX_NUM_FORMS': 1000,
+            'items-0-id': line.pk, 'items-0-sales_order': order.pk,
+            'items-0-product': self.product.pk, 'items-0-quantity': 6, 'items-0-unit_price': '5.00',
+        }, follow=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.redirect_chain, [(url, 302)])
+        self.assertEqual(
+            [(m.level_tag, m.message) for m in response.context['messages']],
+            [('error', 'Insufficient stock to reserve SKU-1 at L1.')],
+        )
+        # Neither the order nor its line changed
+        order.refresh_from_db()
+        line.refresh_from_db()
+        self.assertEqual((order.status, order.reference, line.quantity), ('draft', None, 4))
+        self.assertStock(5, 0)
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.supplier = Supplier.objects.create(name='Acme')
+        self.product = Product.objects.create(sku='E-1', name='Etag', supplier=self.supplier)
+        self.location = Location.objects.create(code='E', name='Etag')
+        self.item = adjust_stock(self.product, self.location, 10)
+
+    def reserve(self, quantity):
+        order = SalesOrder.objects.create(status=SalesOrder.Status.PENDING, ship_from=self.location)
+        order.items.create(product=self.product, quantity=quantity, unit_price=1)
+        sync_reservations([order])
+
+    def test_list_not_modified_until_a_row_changes(self):
+        url = '/api/inventory/?expand=product_detail'
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+        self.assertEqual(len(queries), 2)  # COUNT + page, no serialization
+        for change in (
+            lambda: adjust_stock(self.product, self.location, -1),
+            lambda: Supplier.objects.get(pk=self.supplier.pk).save(),  # shown through product_detail
+            lambda: self.reserve(2),
+            lambda: InventoryItem.objects.create(product=Product.objects.create(sku='E-2', name='Etag'), location=self.location),
+        ):
+            change()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+            etag = response['ETag']
+        self.assertEqual(response.data['count'], 2)
+
+    def test_detail_last_modified(self):
+        url = f'/api/products/{self.product.pk}/'
+        response = self.client.get(url)
+        self.assertEqual(response.data['version'], 1)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.client.patch(url, {'name': 'Renamed'})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((response.status_code, response.data['version']), (200, 2))
+
+    def test_saves_of_stale_copies_each_bump_the_version(self):
+        first, second = Product.objects.get(pk=self.product.pk), Product.objects.get(pk=self.product.pk)
+        first.name = 'First'
+        first.save()
+        second.name = 'Second'
+        second.save(update_fields=['name'])
+        self.assertEqual((first.version, second.version), (2, 3))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.version), ('Second', 3))
+
+    def test_orders_with_expanded_products_are_not_validated(self):
+        order = SalesOrder.objects.create(ship_from=self.location)
+        self.assertIn('ETag', self.client.get(f'/api/sales-orders/{order.pk}/'))
+        self.assertNotIn('ETag', self.client.get(f'/api/sales-orders/{order.pk}/?expand=items.product_detail'))
+
+
+class BenchCommandsTests(APITestCase):
+    def seed(self, seed):
+        call_command(
+            'seed_bench', seed=seed, suppliers=3, products=40, locations=2, sales_orders=60,
+            purchase_orders=10, stdout=StringIO(),
+        )
+        return list(Product.objects.filter(sku__startswith=f'B{seed}-').order_by('sku').values_list('name', 'unit_price'))
+
+    def test_seed_is_reproducible_and_reserves_pending_orders(self):
+        with transaction.atomic():
+            first = self.seed(1)
+            transaction.set_rollback(True)
+        self.assertEqual(len(first), 40)
+        self.assertEqual(self.seed(1), first)
+        pending = SalesOrderItem.objects.filter(sales_order__status=SalesOrder.Status.PENDING)
+        self.assertEqual(
+            InventoryItem.objects.aggregate(total=Sum('reserved'))['total'],
+            pending.aggregate(total=Sum('quantity'))['total'],
+        )
+
+    def test_bench_records_results_and_rolls_back(self):
+        self.seed(1)
+        orders = SalesOrder.objects.count()
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command(
+                'bench', host='testserver', repeat=1, warmup=0, only=['api.inventory', 'orders.', 'report.sales.day'],
+                output=output.name, stdout=StringIO(),
+            )
+            results = json.load(output)['results']
+        self.assertEqual(sorted(results), [
+            'api.inventory.list', 'orders.purchase.receive', 'orders.sales.complete',
+            'report.sales.day.raw', 'report.sales.day.rollup',
+        ])
+        self.assertEqual(results['report.sales.day.raw']['queries'], 1)
+        self.assertEqual(SalesOrder.objects.count(), orders)
+
+
+@override_settings(METRICS_TOKEN='secret')
+class MetricsTests(APITestCase):
+    def sample(self, line_start):
+        for line in self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').content.decode().splitlines():
+            if line.startswith(line_start + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return 0.0
+
+    def test_requests_are_recorded_per_url_name(self):
+        Product.objects.create(sku='M-1', name='Metric')
+        count = 'http_request_duration_seconds_count{view="product-list",method="GET",status="200"}'
+        queries = 'http_request_db_queries_sum{view="product-list"}'
+        before = self.sample(count), self.sample(queries)
+        self.client.get('/api/products/')
+        self.client.get('/api/products/')
+        self.assertEqual(self.sample(count), before[0] + 2)
+        self.assertEqual(self.sample(queries), before[1] + 4)  # COUNT + page, twice
+
+    def test_stock_operations_are_counted(self):
+        product = Product.objects.create(sku='M-2', name='Metric')
+        location = Location.objects.create(code='M', name='Metric')
+        order = SalesOrder.objects.create(status=SalesOrder.Status.PENDING, ship_from=location)
+        SalesOrderItem.objects.create(sales_order=order, product=product, quantity=1, unit_price=1)
+        ok = 'inventory_stock_operations_total{operation="complete",outcome="ok"}'
+        error = 'inventory_stock_operations_total{operation="complete",outcome="error"}'
+        adjusted = 'inventory_stock_operations_total{operation="adjust_stock",outcome="ok"}'
+        before = self.sample(ok), self.sample(error), self.sample(adjusted)
+        with self.assertRaises(DjangoValidationError):
+            order.complete()
+        adjust_stock(product, location, 5)
+        order.complete()
+        # The adjust_stock_many() run by complete() is not counted on its own
+        self.assertEqual(
+            (self.sample(ok), self.sample(error), self.sample(adjusted)),
+            (before[0] + 1, before[1] + 1, before[2] + 1),
+        )
+
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', response.content.decode())
+
+    @override_settings(METRICS_TOKEN='')
+    def test_closed_without_token_unless_debug_or_staff(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+        self.client.force_login(get_user_model().objects.create_user('staff', password='pw', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+class ProfilingTests(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(PROFILE_DIR=directory.name))
+        Product.objects.create(sku='P-1', name='Profiled')
+
+    def login(self, is_staff):
+        self.client.force_login(get_user_model().objects.create_user('user', is_staff=is_staff))
+
+    def test_staff_request_is_profiled(self):
+        self.login(is_staff=True)
+        response = self.client.get('/api/products/?_profile=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Profile-Queries'], '2')
+        download = self.client.get(f"/profiles/{response['X-Profile-Id']}/")
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(download.streaming_content)))
+        self.assertEqual(sorted(archive.namelist()), ['profile.pstats', 'queries.json', 'stats.txt'])
+        summary = json.loads(archive.read('queries.json'))
+        self.assertEqual((summary['view'], summary['query_count']), ('product-list', 2))
+        self.assertTrue(all(query['origin'].startswith('inventory/') for query in summary['queries']))
+
+    def test_header_download(self):
+        self.login(is_staff=True)
+        response = self.client.get('/api/products/', HTTP_X_PROFILE='download')
+        self.assertEqual(response['Content-Type'], 'application/zip')
+
+    def test_ignored_for_other_users(self):
+        self.login(is_staff=False)
+        response = self.client.get('/api/products/?_profile=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(self.client.get('/profiles/20250101-000000-0123abcd/').status_code, 302)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite write locking')
+class ConcurrentStockWriteTests(TransactionTestCase):
+    """Writers racing on one stock row all go through (BEGIN IMMEDIATE + retry).
+
+    With plain deferred transactions most of these fail with "database is locked".
+    """
+    WRITERS = 8
+    ORDERS_PER_WRITER = 5
+
+    def test_concurrent_completions_and_adjustments(self):
+        location = Location.objects.create(code='L1', name='Location 1')
+        product = Product.objects.create(sku='SKU-1', name='Product 1', unit_cost=2, unit_price=5)
+        item = InventoryItem.objects.create(product=product, location=location, quantity=1000)
+        batches = []
+        for _ in range(self.WRITERS):
+            batch = [SalesOrder.objects.create(ship_from=location) for _ in range(self.ORDERS_PER_WRITER)]
+            for order in batch:
+                SalesOrderItem.objects.create(sales_order=order, product=product, quantity=2, unit_price=5)
+            batches.append(batch)
+
+        barrier = threading.Barrier(self.WRITERS)
+        errors = []
+
+        def write(batch):
+            try:
+                barrier.wait()
+                for order in batch:
+                    order.complete()
+                    adjust_stock(product, location, 1, reason='recount')
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=write, args=(batch,)) for batch in batches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        orders = self.WRITERS * self.ORDERS_PER_WRITER
+        self.assertEqual(errors, [])
+        item.refresh_from_db()
+        self.assertEqual(item.quantity, 1000 - orders)
+        self.assertEqual(SalesOrder.objects.filter(status=SalesOrder.Status.COMPLETED).count(), orders)
+        movements = StockMovement.objects.filter(product=product).values_list('kind').annotate(count=Count('id'))
+        self.assertEqual(dict(movements.order_by()), {
+            StockMovement.Kind.CORRECTION: 1,  # the opening quantity
+            StockMovement.Kind.SALE: orders,
+            StockMovement.Kind.ADJUSTMENT: orders,
+        })
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite write locking')
+class StockWriteRetryTests(TransactionTestCase):
+    """stock_write against another connection holding the write lock, on the persistent connection."""
+
+    def setUp(self):
+        self.location = Location.objects.create(code='L1', name='Location 1')
+        self.product = Product.objects.create(sku='SKU-1', name='Product 1')
+        self.assertEqual(connection.settings_dict['CONN_MAX_AGE'], 600)
+        # Fail fast on the lock, so the retries rather than busy_timeout do the waiting
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout = 10')
+        self.addCleanup(connection.close)
+        self.other = sqlite3.connect(connection.settings_dict['NAME'], isolation_level=None, check_same_thread=False)
+        self.addCleanup(self.other.close)
+        self.other.execute('BEGIN IMMEDIATE')
+
+    def quantity(self):
+        return InventoryItem.objects.get(product=self.product).quantity
+
+    @override_settings(STOCK_WRITE_RETRIES=8, STOCK_WRITE_RETRY_DELAY=0.02)
+    def test_retries_until_the_lock_is_released(self):
+        release = threading.Timer(0.2, self.other.execute, args=('COMMIT',))
+        release.start()
+        self.addCleanup(release.join)
+        with mock.patch('inventory.db.time.sleep', wraps=time.sleep) as sleep:
+            adjust_stock(self.product, self.location, 3)
+        self.assertGreater(sleep.call_count, 0)
+        self.assertEqual(self.quantity(), 3)
+        self.assertEqual(connection.transaction_mode, None)
+
+    @override_settings(STOCK_WRITE_RETRIES=2)
+    def test_gives_up_and_keeps_the_connection(self):
+        db = connection.connection
+        with mock.patch('inventory.db.time.sleep') as sleep, self.assertRaisesMessage(OperationalError, 'database is locked'):
+            adjust_stock(self.product, self.location, 3)
+        self.assertEqual(sleep.call_count, 2)
+        self.other.execute('ROLLBACK')
+        # End of request: the persistent connection is still usable and is kept
+        close_old_connections()
+        self.assertIs(connection.connection, db)
+        self.assertFalse(connection.in_atomic_block)
+        adjust_stock(self.product, self.location, 1)
+        self.assertEqual(self.quantity(), 1)
+
+
+class SearchIndexMigrationTests(TransactionTestCase):
+    def test_table_rebuild_keeps_search_working(self):
+        if not search.enabled(connection.alias):
+            self.skipTest('needs the SQLite FTS5 search index')
+        # Unapplying and reapplying 0008 remakes the indexed tables on SQLite
+        call_command('migrate', 'inventory', '0007', verbosity=0)
+        call_command('migrate', 'inventory', verbosity=0)
+        supplier = Supplier.objects.create(name='Visserie Dupont')
+        order = PurchaseOrder.objects.create(supplier=supplier, reference='PO-1')
+        Product.objects.create(sku='SKU-00123', name='Boulon hexagonal', supplier=supplier)
+        self.assertQuerySetEqual(search.ranked(Product.objects.all(), 'boulon').values_list('sku', flat=True), ['SKU-00123'])
+        Supplier.objects.filter(pk=supplier.pk).update(name='Quincaillerie Martin')
+        self.assertQuerySetEqual(search.ranked(PurchaseOrder.objects.all(), 'martin'), [order])
@@ -1,8 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views
 from .views import (
     SupplierViewSet, ProductViewSet, LocationViewSet, InventoryItemViewSet,
-    PurchaseOrderViewSet, SalesOrderViewSet, SalesReportView,
+    PurchaseOrderViewSet, SalesOrderViewSet, StockMovementViewSet, SalesReportView,
 )
 
 router = DefaultRouter()
@@ -12,8 +13,15 @@ router.register(r'locations', LocationViewSet)
 router.register(r'inventory', InventoryItemViewSet)
 router.register(r'purchase-orders', PurchaseOrderViewSet)
 router.register(r'sales-orders', SalesOrderViewSet)
+router.register(r'stock-movements', StockMovementViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
     path('reports/sales/', SalesReportView.as_view(), name='sales-report'),
+    # Async variants of the slow reads, for ASGI deployments (config.asgi)
+    path('async/reports/sales/', async_views.sales_report, name='async-sales-report'),
+    path('async/low-stock/', async_views.low_stock, name='async-low-stock'),
+    path('async/inventory/export/', async_views.export_view(InventoryItemViewSet), name='async-inventory-export'),
+    path('async/purchase-orders/export/', async_views.export_view(PurchaseOrderViewSet), name='async-purchase-order-export'),
+    path('async/sales-orders/export/', async_views.export_view(SalesOrderViewSet), name='async-sales-order-export'),
 ]
\ No newline at end of file
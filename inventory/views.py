@@ -1,77 +1,442 @@
-from datetime import datetime
-from django.db.models import Sum, F, DecimalField, ExpressionWrapper
+import hashlib
+from datetime import datetime, timedelta
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.db.models import Sum, F, DecimalField, ExpressionWrapper, Prefetch, prefetch_related_objects
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework import viewsets, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiTypes
+from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter, OpenApiTypes
 
 from .models import (
     Supplier, Product, Location, InventoryItem,
     PurchaseOrder, PurchaseOrderItem,
-    SalesOrder, SalesOrderItem,
+    SalesOrder, SalesOrderItem, DailySalesRollup, StockMovement,
+    complete_sales_orders, day_start, stock_at,
 )
+from .exports import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_format, stream_rows
+from .pagination import OrderPagination
+from . import report_cache
+from .autocomplete import product_index
 from .serializers import (
     SupplierSerializer, ProductSerializer, LocationSerializer, InventoryItemSerializer,
     PurchaseOrderSerializer, PurchaseOrderItemSerializer,
-    SalesOrderSerializer, SalesOrderItemSerializer,
+    SalesOrderSerializer, SalesOrderItemSerializer, SalesOrderBulkCompleteSerializer,
+    StockMovementSerializer,
 )
 
 
-class SupplierViewSet(viewsets.ModelViewSet):
+def sparse_fields_schema(expandable=()):
+    parameters = [
+        OpenApiParameter(
+            name='fields', type=OpenApiTypes.STR, location='query',
+            description='Comma-separated fields to return (dotted names select nested fields, e.g. items.quantity).',
+        ),
+    ]
+    if expandable:
+        parameters.append(OpenApiParameter(
+            name='expand', type=OpenApiTypes.STR, location='query',
+            description=f"Comma-separated nested details to include: {', '.join(expandable)}.",
+        ))
+    return extend_schema_view(
+        list=extend_schema(parameters=parameters),
+        retrieve=extend_schema(parameters=parameters),
+    )
+
+
+class SparseFieldsViewSetMixin:
+    """Feed `?fields=` and `?expand=` to the serializer; `fields` only applies to reads."""
+
+    def query_list(self, name):
+        if self.request is None:
+            return set()
+        value = self.request.query_params.get(name, '')
+        return {part.strip() for part in value.split(',') if part.strip()}
+
+    def wants(self, name):
+        only = self.query_list('fields')
+        return not only or self.request.method not in SAFE_METHODS or any(
+            field == name or field.startswith(f'{name}.') for field in only
+        )
+
+    def get_serializer(self, *args, **kwargs):
+        if self.request is not None:
+            kwargs.setdefault('expand', self.query_list('expand'))
+            if self.request.method in SAFE_METHODS:
+                kwargs.setdefault('fields', self.query_list('fields'))
+        return super().get_serializer(*args, **kwargs)
+
+
+EXPORT_PARAMETERS = [
+    OpenApiParameter(name='output', type=OpenApiTypes.STR, location='query', enum=list(EXPORT_FORMATS), description='Export format (default csv).'),
+]
+EXPORT_RESPONSES = {(200, content_type.split(';')[0]): OpenApiTypes.STR for content_type in EXPORT_FORMATS.values()}
+
+
+class ExportViewSetMixin:
+    """`GET <collection>/export/` streams every row matching the list filters as CSV or NDJSON."""
+    export_columns = ()  # (header, values_list lookup) pairs
+    export_filename = 'export'
+
+    def get_export_queryset(self, queryset):
+        return queryset
+
+    @extend_schema(parameters=EXPORT_PARAMETERS, responses=EXPORT_RESPONSES)
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        output = export_format(request)
+        queryset = self.get_export_queryset(self.filter_queryset(self.get_queryset()))
+        headers, lookups = zip(*self.export_columns)
+        rows = queryset.values_list(*lookups).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        return stream_rows(headers, rows, output, self.export_filename)
+
+
+class ConditionalGetViewSetMixin:
+    """ETag on list and retrieve, plus Last-Modified on retrieve, checked before serializing.
+
+    The validators hash the `version` and `updated_at` of every row shown and
+    of the related rows embedded in it (`get_etag_related()`), read as extra
+    columns of the page query. Prefetches wait until the response is known to
+    be needed, so a 304 costs the page query (and its COUNT) only. Lists send
+    no Last-Modified: removing a row does not move any remaining timestamp.
+    """
+    etag_related = ()
+
+    def get_etag_related(self):
+        """Relations whose rows appear in the response; None turns validation off."""
+        return self.etag_related
+
+    def conditional(self):
+        return self.action in {'list', 'retrieve'} and self.request.method in ('GET', 'HEAD') \
+            and self.get_etag_related() is not None
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if not self.conditional():
+            return queryset
+        annotations = {}
+        for index, relation in enumerate(self.get_etag_related()):
+            annotations[f'etag_version_{index}'] = F(f'{relation}__version')
+            annotations[f'etag_updated_{index}'] = F(f'{relation}__updated_at')
+        self.deferred_prefetches = queryset._prefetch_related_lookups
+        return queryset.annotate(**annotations).prefetch_related(None)
+
+    def validators(self, obj):
+        values = [obj.pk, getattr(obj, 'version', None), obj.updated_at]
+        for index in range(len(self.get_etag_related())):
+            values += [getattr(obj, f'etag_version_{index}'), getattr(obj, f'etag_updated_{index}')]
+        return values
+
+    def etag(self, rows, *extra):
+        state = repr((self.request.get_full_path(), self.request.accepted_renderer.format, extra, rows))
+        return f'W/"{hashlib.md5(state.encode(), usedforsecurity=False).hexdigest()}"'
+
+    def not_modified(self, etag, last_modified=None):
+        response = get_conditional_response(
+            self.request, etag=etag, last_modified=int(last_modified.timestamp()) if last_modified else None,
+        )
+        if response is not None:
+            response['ETag'] = etag
+        return response
+
+    @staticmethod
+    def with_validators(response, etag, last_modified=None):
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if not self.conditional():
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        rows = list(queryset) if page is None else page
+        # Page metadata (count, links) is part of the representation too
+        meta = None if page is None else self.get_paginated_response([]).data
+        etag = self.etag([self.validators(obj) for obj in rows], meta)
+        response = self.not_modified(etag)
+        if response is not None:
+            return response
+        prefetch_related_objects(rows, *self.deferred_prefetches)
+        data = self.get_serializer(rows, many=True).data
+        response = Response(data) if page is None else self.get_paginated_response(data)
+        return self.with_validators(response, etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.conditional():
+            return super().retrieve(request, *args, **kwargs)
+        instance = self.get_object()
+        values = self.validators(instance)
+        etag = self.etag(values)
+        last_modified = max(value for value in values if isinstance(value, datetime))
+        response = self.not_modified(etag, last_modified)
+        if response is not None:
+            return response
+        prefetch_related_objects([instance], *self.deferred_prefetches)
+        return self.with_validators(Response(self.get_serializer(instance).data), etag, last_modified)
+
+
+@sparse_fields_schema()
+class SupplierViewSet(ConditionalGetViewSetMixin, SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     queryset = Supplier.objects.all().order_by('name')
     serializer_class = SupplierSerializer
     filterset_fields = ['name']
     search_fields = ['name', 'email']
 
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all().order_by('sku')
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+
+@sparse_fields_schema()
+class ProductViewSet(ConditionalGetViewSetMixin, SparseFieldsViewSetMixin, viewsets.ModelViewSet):
+    queryset = Product.objects.order_by('sku')
     serializer_class = ProductSerializer
+    etag_related = ('supplier',)
     filterset_fields = ['supplier', 'is_active']
     search_fields = ['sku', 'name']
     ordering_fields = ['sku', 'name', 'unit_cost', 'unit_price']
 
+    def get_queryset(self):
+        qs = super().get_queryset()
+        return qs.select_related('supplier') if self.wants('supplier_name') else qs
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name='q', type=OpenApiTypes.STR, location='query', required=True, description='SKU prefix or the start of words of the name.'),
+            OpenApiParameter(name='limit', type=OpenApiTypes.INT, location='query', description=f'At most {AUTOCOMPLETE_MAX_LIMIT} (default {AUTOCOMPLETE_LIMIT}).'),
+        ],
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    @action(detail=False, methods=['get'], filter_backends=[], pagination_class=None)
+    def autocomplete(self, request):
+        """Top active products by SKU prefix, then by name words, from the in-process index."""
+        try:
+            limit = int(request.query_params.get('limit', AUTOCOMPLETE_LIMIT))
+        except ValueError:
+            raise ValidationError({'limit': ['Expected an integer.']})
+        limit = max(1, min(limit, AUTOCOMPLETE_MAX_LIMIT))
+        return Response(product_index.search(request.query_params.get('q', ''), limit))
+
 
-class LocationViewSet(viewsets.ModelViewSet):
+@sparse_fields_schema()
+class LocationViewSet(ConditionalGetViewSetMixin, SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     queryset = Location.objects.all().order_by('code')
     serializer_class = LocationSerializer
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name='at', type=OpenApiTypes.DATETIME, location='query', description='Point in time (a bare date means the end of that day); defaults to now.'),
+            OpenApiParameter(name='product', type=OpenApiTypes.INT, location='query', many=True),
+        ],
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    @action(detail=True, methods=['get'])
+    def stock(self, request, pk=None):
+        location = self.get_object()
+        at = request.query_params.get('at')
+        moment = timezone.now()
+        if at:
+            try:
+                day, moment = parse_date(at), parse_datetime(at)
+            except ValueError:
+                day = moment = None
+            if day is not None:
+                moment = day_start(day + timedelta(days=1)) - timedelta(microseconds=1)
+            elif moment is None:
+                raise ValidationError({'at': ['Expected a date or datetime (ISO 8601).']})
+            elif timezone.is_naive(moment):
+                moment = timezone.make_aware(moment)
+        try:
+            products = [int(product) for product in request.query_params.getlist('product')] or None
+        except ValueError:
+            raise ValidationError({'product': ['Expected product ids (integers).']})
+        quantities = stock_at(location, moment, products)
+        return Response({
+            'location': location.pk,
+            'at': moment,
+            'items': [{'product': product, 'quantity': quantity} for product, quantity in sorted(quantities.items())],
+        })
+
 
-class InventoryItemViewSet(viewsets.ModelViewSet):
-    queryset = InventoryItem.objects.select_related('product', 'location').all()
+class StockMovementViewSet(SparseFieldsViewSetMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = StockMovement.objects.order_by('-id')
+    serializer_class = StockMovementSerializer
+    filterset_fields = ['product', 'location', 'kind', 'sales_order', 'purchase_order']
+
+
+@sparse_fields_schema(InventoryItemSerializer.Meta.expandable_fields)
+class InventoryItemViewSet(ConditionalGetViewSetMixin, SparseFieldsViewSetMixin, ExportViewSetMixin, viewsets.ModelViewSet):
+    queryset = InventoryItem.objects.order_by('id')
     serializer_class = InventoryItemSerializer
     filterset_fields = ['product', 'location']
     search_fields = ['product__sku', 'product__name', 'location__code']
+    export_filename = 'inventory'
+    export_columns = [
+        ('id', 'id'), ('product', 'product_id'), ('sku', 'product__sku'), ('product_name', 'product__name'),
+        ('location', 'location_id'), ('location_code', 'location__code'),
+        ('quantity', 'quantity'), ('reorder_threshold', 'reorder_threshold'), ('reserved', 'reserved'),
+    ]
+
+    def get_etag_related(self):
+        expand = self.query_list('expand')
+        related = ('product', 'product__supplier') if 'product_detail' in expand else ()
+        return related + (('location',) if 'location_detail' in expand else ())
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        expand = self.query_list('expand')
+        if 'product_detail' in expand:
+            qs = qs.select_related('product__supplier')
+        if 'location_detail' in expand:
+            qs = qs.select_related('location')
+        return qs
+
+
+def order_items_prefetch(view, model):
+    """Prefetch order lines only when the response includes them."""
+    if not view.wants('items'):
+        return ()
+    items = model.objects.order_by('id')
+    if 'items.product_detail' in view.query_list('expand'):
+        items = items.select_related('product__supplier')
+    return (Prefetch('items', queryset=items),)
 
 
-class PurchaseOrderViewSet(viewsets.ModelViewSet):
-    queryset = PurchaseOrder.objects.all().order_by('-created_at')
+@sparse_fields_schema(['items.product_detail'])
+class PurchaseOrderViewSet(ConditionalGetViewSetMixin, SparseFieldsViewSetMixin, ExportViewSetMixin, viewsets.ModelViewSet):
+    queryset = PurchaseOrder.objects.order_by('-created_at')
     serializer_class = PurchaseOrderSerializer
+    pagination_class = OrderPagination
     filterset_fields = ['supplier', 'status']
     search_fields = ['reference', 'supplier__name']
+    # One row per order line
+    export_filename = 'purchase-orders'
+    export_columns = [
+        ('order', 'purchase_order_id'), ('reference', 'purchase_order__reference'),
+        ('supplier', 'purchase_order__supplier__name'), ('status', 'purchase_order__status'),
+        ('created_at', 'purchase_order__created_at'), ('receive_location', 'purchase_order__receive_location__code'),
+        ('item', 'id'), ('sku', 'product__sku'), ('quantity', 'quantity'), ('unit_cost', 'unit_cost'),
+    ]
+
+    def get_etag_related(self):
+        # Line edits save the order, but embedded product details have no cheap validator
+        return None if 'items.product_detail' in self.query_list('expand') else ('supplier',)
+
+    def get_export_queryset(self, queryset):
+        return PurchaseOrderItem.objects.filter(
+            purchase_order__in=queryset.order_by().values('pk')
+        ).order_by('-purchase_order__created_at', '-purchase_order_id', 'id')
+
+    def get_queryset(self):
+        qs = super().get_queryset().prefetch_related(*order_items_prefetch(self, PurchaseOrderItem))
+        return qs.select_related('supplier') if self.wants('supplier_name') else qs
 
     @action(detail=True, methods=['post'])
     def receive(self, request, pk=None):
         po = self.get_object()
-        po.receive()
+        try:
+            po.receive()
+        except DjangoValidationError as e:
+            raise ValidationError(e.messages)
         return Response(self.get_serializer(po).data)
 
 
-class SalesOrderViewSet(viewsets.ModelViewSet):
-    queryset = SalesOrder.objects.all().order_by('-created_at')
+@sparse_fields_schema(['items.product_detail'])
+class SalesOrderViewSet(ConditionalGetViewSetMixin, SparseFieldsViewSetMixin, ExportViewSetMixin, viewsets.ModelViewSet):
+    queryset = SalesOrder.objects.order_by('-created_at')
     serializer_class = SalesOrderSerializer
+    pagination_class = OrderPagination
     filterset_fields = ['status']
     search_fields = ['reference', 'customer_name']
+    # One row per order line
+    export_filename = 'sales-orders'
+    export_columns = [
+        ('order', 'sales_order_id'), ('reference', 'sales_order__reference'),
+        ('customer_name', 'sales_order__customer_name'), ('status', 'sales_order__status'),
+        ('created_at', 'sales_order__created_at'), ('completed_at', 'sales_order__completed_at'),
+        ('ship_from', 'sales_order__ship_from__code'),
+        ('item', 'id'), ('sku', 'product__sku'), ('quantity', 'quantity'), ('unit_price', 'unit_price'),
+    ]
+
+    def get_etag_related(self):
+        return None if 'items.product_detail' in self.query_list('expand') else ()
+
+    def get_export_queryset(self, queryset):
+        return SalesOrderItem.objects.filter(
+            sales_order__in=queryset.order_by().values('pk')
+        ).order_by('-sales_order__created_at', '-sales_order_id', 'id')
+
+    def get_queryset(self):
+        return super().get_queryset().prefetch_related(*order_items_prefetch(self, SalesOrderItem))
 
     @action(detail=True, methods=['post'])
     def complete(self, request, pk=None):
         so = self.get_object()
-        so.complete()
+        try:
+            so.complete()
+        except DjangoValidationError as e:
+            raise ValidationError(e.messages)
         return Response(self.get_serializer(so).data)
 
+    @extend_schema(request=SalesOrderBulkCompleteSerializer, responses={200: OpenApiTypes.OBJECT})
+    @action(detail=False, methods=['post'], url_path='bulk-complete')
+    def bulk_complete(self, request):
+        serializer = SalesOrderBulkCompleteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = complete_sales_orders(serializer.validated_data['ids'])
+        completed = sum(1 for errors in results.values() if not errors)
+        return Response({
+            'completed': completed,
+            'failed': len(results) - completed,
+            'results': [
+                {'id': pk, 'ok': not errors, 'errors': errors} if errors else {'id': pk, 'ok': True}
+                for pk, errors in results.items()
+            ],
+        })
+
+
+def report_day(value, param):
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise ValidationError({param: ['Expected a date (YYYY-MM-DD).']})
+    return day
+
+
+# Raw report group keys -> the equivalent DailySalesRollup lookups
+REPORT_GROUPS = {
+    'product': {'product_id': 'product_id', 'product__sku': 'product__sku', 'product__name': 'product__name'},
+    'supplier': {'product__supplier_id': 'supplier_id', 'product__supplier__name': 'supplier__name'},
+    'day': {'sales_order__created_at__date': 'day'},
+    'month': {'sales_order__created_at__year': 'day__year', 'sales_order__created_at__month': 'day__month'},
+}
+# Group keys named before completed_at existed: clients read them, but the raw report groups on completion
+RAW_GROUP_LOOKUPS = {
+    'sales_order__created_at__date': 'sales_order__completed_at__date',
+    'sales_order__created_at__year': 'sales_order__completed_at__year',
+    'sales_order__created_at__month': 'sales_order__completed_at__month',
+}
+
 
 class SalesReportView(APIView):
+    """Sales totals or grouped rows.
+
+    Answers from the DailySalesRollup table; `source=raw` forces the
+    aggregation over SalesOrderItem. Dates filter on the completion day. The X-Report-Source header tells which.
+    JSON responses are cached until an order completes or a product cost
+    changes within the requested months (X-Cache: HIT/MISS).
+    """
+
     @extend_schema(
         parameters=[
             OpenApiParameter(name='start_date', type=OpenApiTypes.DATE, location='query'),
@@ -79,60 +444,149 @@ class SalesReportView(APIView):
             OpenApiParameter(name='product', type=OpenApiTypes.INT, location='query'),
             OpenApiParameter(name='supplier', type=OpenApiTypes.INT, location='query'),
             OpenApiParameter(name='group_by', type=OpenApiTypes.STR, location='query', description='product|supplier|day|month'),
+            OpenApiParameter(name='output', type=OpenApiTypes.STR, location='query', enum=list(EXPORT_FORMATS), description='Stream the rows as a CSV/NDJSON export instead of JSON.'),
+            OpenApiParameter(name='source', type=OpenApiTypes.STR, location='query', enum=['rollup', 'raw'], description='Force the raw aggregation instead of the daily rollup.'),
         ],
-        responses={200: OpenApiTypes.OBJECT},
+        responses={200: OpenApiTypes.OBJECT, **EXPORT_RESPONSES},
     )
     def get(self, request):
-        # Filters
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
-        product_id = request.query_params.get('product')
-        supplier_id = request.query_params.get('supplier')
-        group_by = request.query_params.get('group_by')  # product|supplier|day|month
-
-        items = SalesOrderItem.objects.select_related('sales_order', 'product').filter(
-            sales_order__status=SalesOrder.Status.COMPLETED
-        )
-        if start_date:
-            items = items.filter(sales_order__created_at__date__gte=start_date)
-        if end_date:
-            items = items.filter(sales_order__created_at__date__lte=end_date)
-        if product_id:
-            items = items.filter(product_id=product_id)
-        if supplier_id:
-            items = items.filter(product__supplier_id=supplier_id)
+        params = self.report_params(request)
+        output = export_format(request) if 'output' in request.query_params else None
+
+        # JSON answers are cached; exports always stream from the database
+        cache_key = None
+        if output is None:
+            cache_key = self.cache_key(**params)
+            cached = report_cache.lookup(cache_key)
+            if cached is not None:
+                return self.json_response(cached, params['source'], 'HIT')
+
+        query, groups = self.report_query(**params)
+        if groups is None:
+            data = self.totals(query.aggregate(**self.annotations(params['source'])))
+            rows = [tuple(data.values())]
+        else:
+            if output:
+                rows = (tuple(self.grouped_row(row, groups).values()) for row in query.iterator(chunk_size=EXPORT_CHUNK_SIZE))
+            else:
+                data = [self.grouped_row(row, groups) for row in query]
+        if output:
+            return self.export_response(rows, output, params)
 
+        report_cache.store(cache_key, data)
+        return self.json_response(data, params['source'], 'MISS')
+
+    @staticmethod
+    def report_params(request):
+        """Normalised filters from the query string; bad dates raise a 400."""
+        query = request.GET
+        start_date = query.get('start_date')
+        end_date = query.get('end_date')
+        group_by = query.get('group_by')  # product|supplier|day|month
+        return {
+            'start_date': report_day(start_date, 'start_date') if start_date else None,
+            'end_date': report_day(end_date, 'end_date') if end_date else None,
+            'product_id': query.get('product'),
+            'supplier_id': query.get('supplier'),
+            'group_by': group_by if group_by in REPORT_GROUPS else None,
+            'source': 'raw' if query.get('source') == 'raw' else 'rollup',
+        }
+
+    @classmethod
+    def report_query(cls, start_date, end_date, product_id, supplier_id, group_by, source):
+        """(queryset, groups): rows to aggregate, or grouped rows when `group_by` is set."""
+        if source == 'rollup':
+            rows = cls.rollup_rows(start_date, end_date, product_id, supplier_id)
+        else:
+            rows = cls.raw_rows(start_date, end_date, product_id, supplier_id)
+        if group_by is None:
+            return rows, None
+        # Rows always carry the raw report's keys, whichever table answered
+        groups = REPORT_GROUPS[group_by]
+        if source == 'raw':
+            groups = {key: RAW_GROUP_LOOKUPS.get(key, key) for key in groups}
+        lookups = list(groups.values())
+        return rows.values(*lookups).annotate(**cls.annotations(source)).order_by(*lookups), groups
+
+    @staticmethod
+    def annotations(source):
+        if source == 'rollup':
+            return {'revenue': Sum('revenue'), 'cost': Sum('cost')}
         revenue_expr = ExpressionWrapper(F('quantity') * F('unit_price'), output_field=DecimalField(max_digits=18, decimal_places=2))
         cost_expr = ExpressionWrapper(F('quantity') * F('product__unit_cost'), output_field=DecimalField(max_digits=18, decimal_places=2))
-
-        annotations = {
+        return {
             'revenue': Sum(revenue_expr),
             'cost': Sum(cost_expr),
         }
 
-        if group_by == 'product':
-            qs = items.values('product_id', 'product__sku', 'product__name').annotate(**annotations)
-        elif group_by == 'supplier':
-            qs = items.values('product__supplier_id', 'product__supplier__name').annotate(**annotations)
-        elif group_by == 'day':
-            qs = items.values('sales_order__created_at__date').annotate(**annotations)
-        elif group_by == 'month':
-            qs = items.values('sales_order__created_at__year', 'sales_order__created_at__month').annotate(**annotations)
-        else:
-            qs = items.aggregate(**annotations)
-            total_revenue = qs['revenue'] or 0
-            total_cost = qs['cost'] or 0
-            return Response({
-                'revenue': total_revenue,
-                'cost': total_cost,
-                'profit': total_revenue - total_cost,
-            })
+    @staticmethod
+    def totals(aggregate):
+        revenue = aggregate['revenue'] or 0
+        cost = aggregate['cost'] or 0
+        return {'revenue': revenue, 'cost': cost, 'profit': revenue - cost}
 
+    @staticmethod
+    def grouped_row(row, groups):
+        revenue = row['revenue'] or 0
+        cost = row['cost'] or 0
+        result = {key: row[lookup] for key, lookup in groups.items()}
         # For grouped results compute profit row-wise
-        results = []
-        for row in qs:
-            revenue = row.get('revenue') or 0
-            cost = row.get('cost') or 0
-            row['profit'] = revenue - cost
-            results.append(row)
-        return Response(results)
+        result.update(revenue=revenue, cost=cost, profit=revenue - cost)
+        return result
+
+    @staticmethod
+    def export_response(rows, output, params):
+        group_by = params['group_by']
+        columns = [*REPORT_GROUPS[group_by], 'revenue', 'cost', 'profit'] if group_by else ['revenue', 'cost', 'profit']
+        response = stream_rows(columns, rows, output, f'sales-report-{group_by}' if group_by else 'sales-report')
+        response['X-Report-Source'] = params['source']
+        return response
+
+    @staticmethod
+    def json_response(data, source, cache_status):
+        response = Response(data)
+        response['X-Report-Source'] = source
+        response['X-Cache'] = cache_status
+        return response
+
+    @staticmethod
+    def cache_params(start_date, end_date, product_id, supplier_id, group_by, source):
+        return {
+            'start_date': start_date,
+            'end_date': end_date,
+            'product': (product_id or '').strip() or None,
+            'supplier': (supplier_id or '').strip() or None,
+            'group_by': group_by,
+            'source': source,
+        }
+
+    @classmethod
+    def cache_key(cls, **params):
+        return report_cache.cache_key(cls.cache_params(**params))
+
+    @staticmethod
+    def rollup_rows(start_date, end_date, product_id, supplier_id):
+        rows = DailySalesRollup.objects.all()
+        if start_date:
+            rows = rows.filter(day__gte=start_date)
+        if end_date:
+            rows = rows.filter(day__lte=end_date)
+        if product_id:
+            rows = rows.filter(product_id=product_id)
+        if supplier_id:
+            rows = rows.filter(supplier_id=supplier_id)
+        return rows
+
+    @staticmethod
+    def raw_rows(start_date, end_date, product_id, supplier_id):
+        items = SalesOrderItem.objects.filter(sales_order__status=SalesOrder.Status.COMPLETED)
+        # Plain range predicates on completed_at so the (status, completed_at) index applies
+        if start_date:
+            items = items.filter(sales_order__completed_at__gte=day_start(start_date))
+        if end_date:
+            items = items.filter(sales_order__completed_at__lt=day_start(end_date + timedelta(days=1)))
+        if product_id:
+            items = items.filter(product_id=product_id)
+        if supplier_id:
+            items = items.filter(product__supplier_id=supplier_id)
+        return items
@@ -6,7 +6,7 @@ from inventory.models import Supplier, Product, Location, InventoryItem, Purchas
 
 class AdjustInventoryForm(forms.Form):
     delta = forms.IntegerField(label="Ajustement (peut être négatif)")
-    reason = forms.CharField(label="Raison", required=False)
+    reason = forms.CharField(label="Raison", required=False, max_length=255)
 
 
 class SignUpForm(UserCreationForm):
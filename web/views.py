@@ -2,14 +2,17 @@ from django.contrib import messages
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import LoginView, LogoutView
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
 from django.forms import inlineformset_factory
 import django.forms as forms
 from django.shortcuts import redirect, get_object_or_404, render
 from django.urls import reverse_lazy
 from django.views.generic import TemplateView, ListView, CreateView, UpdateView, DeleteView, FormView, View
 
-from inventory.models import Supplier, Product, Location, InventoryItem, PurchaseOrder, PurchaseOrderItem, SalesOrder, SalesOrderItem
+from inventory import counters
+from inventory.search import FullTextSearchFilter
+from inventory.models import Supplier, Product, Location, InventoryItem, PurchaseOrder, PurchaseOrderItem, SalesOrder, SalesOrderItem, keep_daily_sales, low_stock_items, sync_reservations
 from .forms import SignUpForm, SupplierForm, ProductForm, LocationForm, InventoryItemForm, PurchaseOrderItemInlineForm, SalesOrderItemInlineForm, AdjustInventoryForm
 
 
@@ -30,14 +33,9 @@ class DashboardView(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        low_stock = InventoryItem.objects.filter(quantity__lte=models.F('reorder_threshold')).select_related('product', 'location')
+        low_stock = low_stock_items().select_related('product', 'location')
         ctx['low_stock'] = low_stock[:20]
-        ctx['counts'] = {
-            'products': Product.objects.count(),
-            'suppliers': Supplier.objects.count(),
-            'locations': Location.objects.count(),
-            'inventory_items': InventoryItem.objects.count(),
-        }
+        ctx['counts'] = counters.get_counts()
         return ctx
 
 
@@ -53,7 +51,7 @@ class SupplierListView(LoginRequiredMixin, ListView):
         qs = super().get_queryset().order_by('name')
         q = self.request.GET.get('q')
         if q:
-            qs = qs.filter(name__icontains=q)
+            qs = FullTextSearchFilter.search(qs, q, fallback=models.Q(name__icontains=q))
         return qs
 
 
@@ -88,7 +86,7 @@ class ProductListView(LoginRequiredMixin, ListView):
         qs = super().get_queryset().order_by('sku')
         q = self.request.GET.get('q')
         if q:
-            qs = qs.filter(models.Q(sku__icontains=q) | models.Q(name__icontains=q))
+            qs = FullTextSearchFilter.search(qs, q, fallback=models.Q(sku__icontains=q) | models.Q(name__icontains=q))
         return qs
 
 
@@ -158,7 +156,10 @@ class InventoryItemListView(LoginRequiredMixin, ListView):
         qs = super().get_queryset().select_related('product', 'location').order_by('product__sku')
         q = self.request.GET.get('q')
         if q:
-            qs = qs.filter(models.Q(product__sku__icontains=q) | models.Q(product__name__icontains=q) | models.Q(location__code__icontains=q))
+            location = models.Q(location__code__icontains=q)
+            fallback = models.Q(product__sku__icontains=q) | models.Q(product__name__icontains=q) | location
+            # The product index knows nothing of locations
+            qs = FullTextSearchFilter.search(qs, q, fallback=fallback, also=location)
         return qs
 
 
@@ -189,12 +190,12 @@ class InventoryAdjustView(LoginRequiredMixin, View):
         return render(request, 'web/inventory_adjust.html', {'form': form, 'item': it})
 
     def post(self, request, pk):
-        it = get_object_or_404(InventoryItem, pk=pk)
+        it = get_object_or_404(InventoryItem.objects.select_related('product', 'location'), pk=pk)
         form = AdjustInventoryForm(request.POST)
         if form.is_valid():
             delta = form.cleaned_data['delta']
-            from inventory.models import adjust_stock
-            adjust_stock(it.product, it.location, delta)
+            from inventory.models import adjust_stock_many
+            adjust_stock_many([(it.product_id, it.location_id, delta)], reason=form.cleaned_data['reason'])
             messages.success(request, f"Stock ajusté de {delta} pour {it.product.sku} @ {it.location.code}")
             return redirect('web:inventory-list')
         return render(request, 'web/inventory_adjust.html', {'form': form, 'item': it})
@@ -212,7 +213,7 @@ class PurchaseOrderListView(LoginRequiredMixin, ListView):
         qs = super().get_queryset().select_related('supplier', 'receive_location').order_by('-created_at')
         q = self.request.GET.get('q')
         if q:
-            qs = qs.filter(models.Q(reference__icontains=q) | models.Q(supplier__name__icontains=q))
+            qs = FullTextSearchFilter.search(qs, q, fallback=models.Q(reference__icontains=q) | models.Q(supplier__name__icontains=q))
         return qs
 
 
@@ -285,7 +286,7 @@ class SalesOrderListView(LoginRequiredMixin, ListView):
         qs = super().get_queryset().order_by('-created_at')
         q = self.request.GET.get('q')
         if q:
-            qs = qs.filter(models.Q(reference__icontains=q) | models.Q(customer_name__icontains=q))
+            qs = FullTextSearchFilter.search(qs, q, fallback=models.Q(reference__icontains=q) | models.Q(customer_name__icontains=q))
         return qs
 
 
@@ -329,10 +330,16 @@ class SalesOrderUpdateView(LoginRequiredMixin, View):
         form = Form(request.POST, instance=so)
         formset = ItemFormSet(request.POST, instance=so)
         if form.is_valid() and formset.is_valid():
-            so = form.save()
-            formset.save()
-            messages.success(request, "Commande mise à jour")
-            return redirect('web:so-list')
+            try:
+                with transaction.atomic(), keep_daily_sales([so]):
+                    so = form.save()
+                    formset.save()
+                    sync_reservations([so])
+            except ValidationError as e:
+                form.add_error('status', e)
+            else:
+                messages.success(request, "Commande mise à jour")
+                return redirect('web:so-list')
         return render(request, 'web/salesorder_form.html', {'form': form, 'formset': formset, 'title': f"Modifier SO #{so.id}"})
 
 